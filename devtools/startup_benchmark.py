@@ -0,0 +1,209 @@
+"""
+Startup time benchmark, to catch regressions in time to first prompt (usually due to
+a slow import creeping into startup).
+
+Runs kmd in a fixture workspace until just before the prompt, a few times, and reports
+the median time, as well as the slowest imports (from `python -X importtime`).
+Exits with an error if startup is over budget, so it can be used as a check.
+
+Example:
+    poetry run startup_benchmark --budget 3 --import-budget 2
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from rich import print as rprint
+
+from kmd.xonsh_shell import STARTUP_TIMING_ENV
+
+KMD_COMMAND = [sys.executable, "-m", "kmd.main"]
+
+_importtime_re = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+@dataclass
+class StartupReport:
+    runs: int
+    items: int
+    wall_times: List[float]
+    startup_times: List[float]
+    import_time: float
+    top_imports: List[Tuple[str, float]] = field(default_factory=list)
+    top_packages: List[Tuple[str, float]] = field(default_factory=list)
+
+    @property
+    def wall_time(self) -> float:
+        return statistics.median(self.wall_times)
+
+    @property
+    def startup_time(self) -> float:
+        return statistics.median(self.startup_times)
+
+    def as_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "wall_time": self.wall_time,
+            "startup_time": self.startup_time,
+        }
+
+
+def make_fixture(root: Path, num_items: int) -> Path:
+    """
+    A workspace with some markdown docs, and a separate home directory, so runs don't
+    depend on (or change) the user's own settings and workspaces.
+    """
+    ws_dir = root / "benchmark.kb"
+    docs_dir = ws_dir / "docs"
+    docs_dir.mkdir(parents=True)
+    (root / "home").mkdir()
+    for i in range(num_items):
+        (docs_dir / f"doc_{i:05d}.doc.md").write_text(
+            "---\n"
+            f"title: Doc {i}\n"
+            "type: doc\n"
+            "format: markdown\n"
+            "---\n"
+            f"Benchmark document {i}.\n\nSome text for it to contain.\n"
+        )
+    return ws_dir
+
+
+def run_startup(ws_dir: Path, importtime: bool = False) -> Tuple[float, float, str]:
+    """
+    Run kmd up to the prompt. Returns wall time, startup time reported by kmd, and
+    stderr (which has the import times, if requested).
+    """
+    timing_file = ws_dir.parent / "startup_timing.json"
+    env = {**os.environ, "HOME": str(ws_dir.parent / "home"), STARTUP_TIMING_ENV: str(timing_file)}
+    python_opts = ["-X", "importtime"] if importtime else []
+    cmd = [KMD_COMMAND[0], *python_opts, *KMD_COMMAND[1:]]
+
+    start = time.time()
+    result = subprocess.run(
+        cmd, cwd=ws_dir, env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True
+    )
+    wall_time = time.time() - start
+
+    if result.returncode != 0 or not timing_file.exists():
+        raise RuntimeError(f"kmd startup failed (exit {result.returncode}):\n{result.stderr}")
+    startup_time = json.loads(timing_file.read_text())["startup_time"]
+    timing_file.unlink()
+    return wall_time, startup_time, result.stderr
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """
+    Self times in seconds by module and by top-level package.
+    """
+    modules: Dict[str, float] = {}
+    packages: Counter[str] = Counter()
+    for line in stderr.splitlines():
+        match = _importtime_re.match(line)
+        if match:
+            self_us, module = int(match.group(1)), match.group(4)
+            modules[module] = modules.get(module, 0) + self_us / 1e6
+            packages[module.split(".")[0]] += self_us / 1e6
+    return modules, dict(packages)
+
+
+def benchmark(runs: int, num_items: int, top_n: int) -> StartupReport:
+    with tempfile.TemporaryDirectory(prefix="kmd_startup_") as tmp_dir:
+        ws_dir = make_fixture(Path(tmp_dir), num_items)
+
+        # Warm-up run, so bytecode and other caches are written.
+        run_startup(ws_dir)
+
+        wall_times, startup_times = [], []
+        for _ in range(runs):
+            wall_time, startup_time, _stderr = run_startup(ws_dir)
+            wall_times.append(wall_time)
+            startup_times.append(startup_time)
+
+        _, _, stderr = run_startup(ws_dir, importtime=True)
+
+    modules, packages = parse_importtime(stderr)
+
+    def top(times: Dict[str, float]) -> List[Tuple[str, float]]:
+        return sorted(times.items(), key=lambda kv: kv[1], reverse=True)[:top_n]
+
+    return StartupReport(
+        runs=runs,
+        items=num_items,
+        wall_times=wall_times,
+        startup_times=startup_times,
+        import_time=sum(modules.values()),
+        top_imports=top(modules),
+        top_packages=top(packages),
+    )
+
+
+def print_report(report: StartupReport) -> None:
+    rprint()
+    rprint(f"[bold]Startup time ({report.runs} runs, {report.items} items):[/bold]")
+    rprint(f"  wall time (median):    {report.wall_time:.2f}s")
+    rprint(f"  startup time (median): {report.startup_time:.2f}s")
+    rprint(f"  total import time:     {report.import_time:.2f}s")
+    rprint()
+    rprint("[bold]Slowest packages (import self time):[/bold]")
+    for name, seconds in report.top_packages:
+        rprint(f"  {seconds:6.3f}s  {name}")
+    rprint()
+    rprint("[bold]Slowest modules (import self time):[/bold]")
+    for name, seconds in report.top_imports:
+        rprint(f"  {seconds:6.3f}s  {name}")
+    rprint()
+
+
+def check_budget(
+    report: StartupReport, budget: Optional[float], import_budget: Optional[float]
+) -> List[str]:
+    errors = []
+    if budget is not None and report.wall_time > budget:
+        errors.append(f"Startup time {report.wall_time:.2f}s is over budget ({budget:.2f}s)")
+    if import_budget is not None and report.import_time > import_budget:
+        errors.append(
+            f"Import time {report.import_time:.2f}s is over budget ({import_budget:.2f}s)"
+        )
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="timed runs (median is used)")
+    parser.add_argument("--items", type=int, default=100, help="items in the workspace")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--budget", type=float, help="max median wall time to prompt (s)")
+    parser.add_argument("--import-budget", type=float, help="max total import time (s)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = benchmark(args.runs, args.items, args.top)
+    errors = check_budget(report, args.budget, args.import_budget)
+
+    if args.json:
+        print(json.dumps({**report.as_dict(), "errors": errors}, indent=2))
+    else:
+        print_report(report)
+        for error in errors:
+            rprint(f"[bold red]✗ {error}[/bold red]")
+        if not errors and (args.budget or args.import_budget):
+            rprint("[bold green]✔️ Startup within budget.[/bold green]")
+        rprint()
+
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,17 @@
+import hashlib
 import importlib
 import pkgutil
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional
 
 from cachetools import Cache, cached
+from cachetools.keys import hashkey
 
 from kmd.config.logger import get_logger
+from kmd.config.settings import ACTION_MANIFEST_PATH
 from kmd.errors import InvalidInput
+from kmd.exec.action_manifest import ActionInfo, ActionManifest
 from kmd.exec.action_registry import instantiate_actions
 from kmd.model.actions_model import Action
 from kmd.util.format_utils import fmt_path
@@ -17,6 +22,10 @@ log = get_logger(__name__)
 
 cache = Cache(maxsize=float("inf"))
 
+BASE_ACTIONS = "base_actions"
+
+ACTION_PACKAGES = [BASE_ACTIONS, "experimental_actions", "compound_actions"]
+
 
 def _import_all_files(path: Path, base_package: str, tallies: Optional[Dict[str, int]]):
     if tallies is None:
@@ -49,9 +58,9 @@ def import_actions(subdir_names: List[str], tallies: Optional[Dict[str, int]] =
 def load_all_actions(base_only: bool = False) -> Dict[str, Action]:
     tallies: Dict[str, int] = {}
     # Allow bootstrapping base actions before compound actions that may depend on them.
-    import_actions(["base_actions"], tallies)
+    import_actions([BASE_ACTIONS], tallies)
     if not base_only:
-        import_actions(["experimental_actions", "compound_actions"], tallies)
+        import_actions(ACTION_PACKAGES[1:], tallies)
 
     actions_map = instantiate_actions()
 
@@ -69,11 +78,98 @@ def load_all_actions(base_only: bool = False) -> Dict[str, Action]:
 
 
 def reload_all_actions(base_only: bool = False) -> Dict[str, Action]:
-    cache.clear()
+    _clear_caches()
     return load_all_actions(base_only=base_only)
 
 
+_manifest: Optional[ActionManifest] = None
+
+# Actions instantiated individually, by name.
+_lazy_actions: Dict[str, Action] = {}
+
+_lazy_lock = threading.RLock()
+
+
+def _clear_caches():
+    global _manifest
+    with _lazy_lock:
+        cache.clear()
+        _manifest = None
+        _lazy_actions.clear()
+
+
+def _manifest_path() -> Path:
+    # Separate manifests for separate installs.
+    key = hashlib.sha1(str(Path(__file__).parent.resolve()).encode()).hexdigest()[:8]
+    return Path(ACTION_MANIFEST_PATH.format(key=key)).expanduser()
+
+
+def _is_packaged(action: Action) -> bool:
+    """
+    Whether the action is defined in the action packages, as opposed to an extension
+    (e.g. a script run with `load`, whose module is `__main__`).
+    """
+    return type(action).__module__.startswith(f"{__name__}.")
+
+
+def action_manifest(reload: bool = False) -> Dict[str, ActionInfo]:
+    """
+    Info on all actions in the action packages. Read from the saved manifest if it's
+    current, so no action modules need to be imported. Otherwise imports all actions and
+    saves a new manifest.
+    """
+    global _manifest
+    with _lazy_lock:
+        if reload:
+            _clear_caches()
+        if _manifest is None:
+            source_dirs = [Path(__file__).parent / name for name in ACTION_PACKAGES]
+            path = _manifest_path()
+            manifest = ActionManifest.read(path)
+            if not manifest or not manifest.is_current(source_dirs):
+                log.info("Action manifest missing or out of date, loading all actions.")
+                actions = {
+                    name: action
+                    for name, action in load_all_actions(base_only=False).items()
+                    if _is_packaged(action)
+                }
+                manifest = ActionManifest.from_actions(actions, source_dirs)
+                try:
+                    manifest.write(path)
+                except OSError as e:
+                    log.warning("Could not save action manifest: %s", e)
+            _manifest = manifest
+        return _manifest.actions
+
+
+def _load_action(info: ActionInfo) -> Optional[Action]:
+    """
+    Import just the module defining an action and instantiate its actions.
+    """
+    with _lazy_lock:
+        if info.name not in _lazy_actions:
+            importlib.import_module(info.module)
+            _lazy_actions.update(instantiate_actions(module=info.module))
+            log.info("Loaded action `%s` from: %s", info.name, info.module)
+        return _lazy_actions.get(info.name)
+
+
 def look_up_action(action_name: str, base_only: bool = False) -> Action:
+    """
+    Look up an action by name. Uses the manifest to import only the action's module,
+    unless all actions are already loaded.
+    """
+    if hashkey(base_only=base_only) in cache:
+        actions = load_all_actions(base_only=base_only)
+        if action_name in actions:
+            return actions[action_name]
+
+    info = action_manifest().get(action_name)
+    if info and (not base_only or info.package == BASE_ACTIONS):
+        action = _load_action(info)
+        if action:
+            return action
+
     actions = load_all_actions(base_only=base_only)
     if action_name not in actions:
         raise InvalidInput(f"Action not found: `{action_name}`")
@@ -0,0 +1,108 @@
+"""
+Headless entry point to run an action on each input listed in a manifest, without the
+shell. Progress is checkpointed after each input, so running the same command again
+resumes an interrupted batch. Exits with status 1 if any inputs failed.
+
+Example:
+    kmd_batch strip_html urls.txt --workers 4
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Keeping initial imports/deps minimal.
+from kmd.config.logger import get_logger
+from kmd.config.setup import setup
+
+# Ensure logging is set up before anything else.
+setup()
+
+log = get_logger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("action", help="action (or sequence action) to run on each input")
+    parser.add_argument("manifest", help="file listing inputs, one path or URL per line")
+    parser.add_argument("--workspace", help="workspace to run in (default: current directory)")
+    parser.add_argument("--workers", type=int, default=1, help="inputs to run at once")
+    parser.add_argument(
+        "--checkpoint",
+        help="checkpoint file (default: in the workspace, named for the manifest and action)",
+    )
+    parser.add_argument("--summary", help="JSON summary file (default: next to the checkpoint)")
+    parser.add_argument(
+        "--skip-failed", action="store_true", help="don't retry inputs that failed before"
+    )
+    parser.add_argument(
+        "--rerun", action="store_true", help="run even if outputs are already in the workspace"
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="save a trace of where time went (Chrome trace event JSON) next to the summary",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    manifest_path = Path(args.manifest).absolute()
+
+    from kmd.errors import nonfatal_exceptions
+    from kmd.exec.batch_runner import run_batch
+    from kmd.model.args_model import fmt_loc
+    from kmd.util.tracing import start_tracing, stop_tracing
+    from kmd.workspaces.workspaces import current_workspace, resolve_workspace
+
+    try:
+        if args.workspace:
+            _name, ws_dir, _is_sandbox = resolve_workspace(args.workspace)
+            os.chdir(ws_dir)
+        ws = current_workspace()
+
+        name = f"{manifest_path.stem}.{args.action}"
+        batch_dir = ws.base_dir / ws.dirs.batch_dir
+        checkpoint_path = (
+            Path(args.checkpoint).absolute()
+            if args.checkpoint
+            else batch_dir / f"{name}.checkpoint.jsonl"
+        )
+        summary_path = (
+            Path(args.summary).absolute()
+            if args.summary
+            else checkpoint_path.with_name(f"{name}.summary.json")
+        )
+        if args.trace:
+            start_tracing()
+        try:
+            summary = run_batch(
+                args.action,
+                manifest_path,
+                checkpoint_path,
+                summary_path,
+                workers=args.workers,
+                retry_failed=not args.skip_failed,
+                rerun=args.rerun,
+            )
+        finally:
+            if args.trace:
+                trace_path = summary_path.with_name(f"{name}.trace.json")
+                stop_tracing(trace_path)
+                log.message("Trace: %s", fmt_loc(trace_path))
+    except KeyboardInterrupt:
+        log.warning("Interrupted. Run again to resume.")
+        sys.exit(130)
+    except nonfatal_exceptions() as e:
+        log.error("Batch failed: %s", e)
+        sys.exit(2)
+
+    sys.exit(1 if summary.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ import os
 from datetime import datetime, timezone
 from os.path import basename
 from pathlib import Path
-from typing import cast, List, Optional
+from typing import List, Optional
 
 from frontmatter_format import fmf_read_raw, fmf_strip_frontmatter
 from rich.text import Text
@@ -20,10 +20,10 @@ from kmd.exec.resolve_args import (
 )
 from kmd.file_formats.doc_normalization import normalize_text_file
 from kmd.file_tools.file_sort_filter import (
-    collect_files,
-    FileInfo,
     FileListing,
+    group_files,
     GroupByOption,
+    iter_files,
     parse_since,
     SortOption,
     type_suffix,
@@ -426,11 +426,10 @@ def files(
 
     base_path = Path(".")
 
-    # Collect all the files.
-    file_listing = collect_files(
-        start_paths=paths_to_show,
+    file_listing = FileListing.empty(paths_to_show, since_seconds)
+    found_files = iter_files(
+        file_listing,
         ignore=is_ignored,
-        since_seconds=since_seconds,
         base_path=base_path,
         max_depth=depth,
         max_files_per_subdir=max_per_subdir,
@@ -444,41 +443,20 @@ def files(
     active_ws_name = ws.name if base_path.resolve().is_relative_to(ws.base_dir.resolve()) else None
     base_is_ws = ws.base_dir.resolve() == base_path.resolve()
 
-    log.info("Collected %s files.", file_listing.files_total)
-
-    if not file_listing.files:
-        cprint("No files found.")
-        _print_listing_tallies(file_listing, 0, 0, max_files, depth, max_per_subdir)
-        return ShellResult()
-
-    df = file_listing.as_dataframe()
-
-    if sort:
-        # Determine the primary and secondary sort columns.
-        primary_sort = sort.value
-        secondary_sort = "filename" if primary_sort != "filename" else "created"
-
-        df.sort_values(
-            by=[primary_sort, secondary_sort], ascending=[not reverse, True], inplace=True
-        )
-
-    items_matching = len(df)
-    log.info(f"Total items collected: {items_matching}")
-
-    if groupby and groupby != GroupByOption.flat:
-        grouped = df.groupby(groupby.value)
-    else:
-        grouped = [(None, df)]
-
     if save:
+        file_listing.files = [
+            info
+            for _name, group, _total in group_files(found_files, sort=sort, reverse=reverse)
+            for info in group
+        ]
+        log.info("Collected %s files.", file_listing.files_total)
         item = Item(
             type=ItemType.export,
             title="File Listing",
             description=f"Files in {', '.join(fmt_loc(p) for p in paths_to_show)}",
             format=Format.csv,
-            body=df.to_csv(index=False),
+            body=file_listing.as_csv(),
         )
-        ws = current_workspace()
         store_path = ws.save(item, as_tmp=False)
         log.message("File listing saved to: %s", fmt_loc(store_path))
 
@@ -486,6 +464,16 @@ def files(
 
         return ShellResult(show_selection=True)
 
+    # Files are grouped, sorted, and printed as they are found, keeping at most
+    # max_per_group files per group in memory.
+    grouped = group_files(
+        found_files,
+        groupby=groupby if groupby != GroupByOption.flat else None,
+        sort=sort,
+        reverse=reverse,
+        max_per_group=max_per_group,
+    )
+
     total_displayed = 0
     total_displayed_size = 0
     now = datetime.now(timezone.utc)
@@ -498,21 +486,15 @@ def files(
 
     with console_pager(use_pager=pager):
         with local_url_formatter(active_ws_name) as fmt:
-            for group_name, group_df in grouped:
-                if group_name:
+            for group_name, group_files_shown, group_total in grouped:
+                if group_name is not None:
                     cprint(
-                        f"\n{group_name} ({len(group_df)} files)",
+                        f"\n{group_name} ({group_total} files)",
                         color=COLOR_EMPH,
                         text_wrap=Wrap.NONE,
                     )
 
-                if max_per_group:
-                    display_df = group_df.head(max_per_group)
-                else:
-                    display_df = group_df
-
-                for row in display_df.itertuples(index=False, name="FileInfo"):
-                    row = cast(FileInfo, row)
+                for row in group_files_shown:
                     short_file_size = fmt_size_human(row.size)
                     full_file_size = f"{row.size} bytes"
                     short_mod_time = fmt_time(row.modified, iso_time=iso_time, now=now, brief=True)
@@ -553,15 +535,25 @@ def files(
                     total_displayed_size += row.size
 
                 # Indicate if items are omitted.
-                if groupby and max_per_group and len(group_df) > max_per_group:
+                if group_total is not None and max_per_group and group_total > max_per_group:
                     cprint(
-                        f"{indent}… and {len(group_df) - max_per_group} more files",
+                        f"{indent}… and {group_total - max_per_group} more files",
                         color=COLOR_EMPH_ALT,
                         text_wrap=Wrap.NONE,
                     )
+                if group_name is not None:
+                    cprint()
+
+            log.info("Collected %s files.", file_listing.files_total)
+
+            ungrouped = not groupby or groupby == GroupByOption.flat
+            if not file_listing.files_matching:
+                cprint("No files found.")
+            elif ungrouped:
                 cprint()
 
-            if not groupby and max_per_group and items_matching > max_per_group:
+            items_matching = file_listing.files_matching
+            if ungrouped and max_per_group and items_matching > max_per_group:
                 cprint(
                     f"{indent}… and {items_matching - max_per_group} more files",
                     color=COLOR_EMPH_ALT,
@@ -6,14 +6,20 @@ from kmd.commands.files_commands import trash
 from kmd.config.logger import get_logger, log_file_path, log_objects_dir, reset_logging
 from kmd.config.settings import global_settings, LogLevel, update_global_settings
 from kmd.config.setup import print_api_key_setup
+from kmd.errors import InvalidState
+from kmd.exec.background_jobs import cancel_job, clear_finished_jobs, get_job, list_jobs
 from kmd.help.tldr_help import tldr_refresh_cache
+from kmd.lang_tools.inflection import plural
+from kmd.llms.concurrency_limiter import limiter_stats
 from kmd.model.args_model import fmt_loc
 from kmd.server import local_server
 from kmd.server.local_url_formatters import enable_local_urls
 from kmd.shell_tools.native_tools import tail_file
 from kmd.shell_tools.tool_deps import check_terminal_features, tool_check
-from kmd.shell_ui.shell_output import cprint, format_name_and_description, print_status
+from kmd.shell_ui.shell_output import cprint, format_name_and_description, print_status, Wrap
 from kmd.util.format_utils import fmt_lines
+from kmd.util.strif import iso_timestamp
+from kmd.util.tracing import is_tracing, start_tracing, stop_tracing
 from kmd.workspaces.workspaces import current_workspace
 
 log = get_logger(__name__)
@@ -96,6 +102,102 @@ def clear_logs() -> None:
     print_status("Logs cleared:\n%s", fmt_lines([fmt_loc(log_path)]))
 
 
+@kmd_command
+def llm_limits() -> None:
+    """
+    Show the current adaptive concurrency limits and call stats for each LLM and
+    embedding model used so far in this session.
+    """
+    stats = limiter_stats()
+    if not stats:
+        cprint("No LLM calls yet.")
+        return
+    for model_name, model_stats in stats.items():
+        cprint(format_name_and_description(model_name, str(model_stats)))
+    cprint()
+
+
+@kmd_command
+def start_trace() -> None:
+    """
+    Start tracing where time goes (tasks, action phases, LLM calls, file I/O, and
+    logged or tallied function calls) until `stop_trace`, to see as a timeline.
+    """
+    if is_tracing():
+        log.warning("Already tracing; restarting the trace.")
+    start_tracing()
+    print_status("Tracing started. Use `stop_trace` to save the trace.")
+
+
+@kmd_command
+def stop_trace() -> None:
+    """
+    Stop tracing and save the trace, in Chrome trace event format, to view in Perfetto
+    (https://ui.perfetto.dev) or `chrome://tracing`.
+    """
+    if not is_tracing():
+        raise InvalidState("Not tracing. Use `start_trace` first.")
+    ws = current_workspace()
+    timestamp = iso_timestamp(microseconds=False).replace(":", "")
+    trace_path = ws.base_dir / ws.dirs.traces_dir / f"trace.{timestamp}.json"
+    spans = stop_tracing(trace_path)
+    print_status(
+        "Saved trace of %s %s:\n%s", spans, plural("span", spans), fmt_lines([fmt_loc(trace_path)])
+    )
+
+
+@kmd_command
+def bg_jobs(clear: bool = False) -> None:
+    """
+    List background jobs (started by running an action with `--bg`), with the progress
+    of each running job.
+
+    :param clear: Remove finished jobs from the list.
+    """
+    if clear:
+        cleared = clear_finished_jobs()
+        print_status(f"Cleared {len(cleared)} finished {plural('job', len(cleared))}.")
+        return
+
+    jobs = list_jobs()
+    if not jobs:
+        cprint("No background jobs.")
+        return
+    for job in jobs:
+        details = job.progress_str() or job.error
+        if details:
+            cprint(format_name_and_description(str(job), details))
+        else:
+            cprint(str(job))
+    cprint()
+
+
+@kmd_command
+def bg_output(job: str, tail: int = 40) -> None:
+    """
+    Show the output so far of a background job.
+
+    :param job: The job number, like `%1` or `1`.
+    :param tail: Show only this many of the last lines (0 for all).
+    """
+    bg_job = get_job(job)
+    lines = bg_job.output_text().splitlines()
+    cprint(str(bg_job), text_wrap=Wrap.NONE)
+    cprint("\n".join(lines[-tail:] if tail else lines), text_wrap=Wrap.NONE)
+
+
+@kmd_command
+def bg_cancel(job: str) -> None:
+    """
+    Cancel a background job. It stops at its next step (the next item, part, or LLM
+    call). Anything it already saved is kept.
+
+    :param job: The job number, like `%1` or `1`.
+    """
+    bg_job = cancel_job(job)
+    print_status(f"Cancelling job: {bg_job}")
+
+
 @kmd_command
 def reset_ignore_file(append: bool = False) -> None:
     """
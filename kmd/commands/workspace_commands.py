@@ -1,6 +1,7 @@
 import os
+from functools import cache
 from pathlib import Path
-from typing import Optional
+from typing import cast, get_args, Optional
 
 from frontmatter_format import to_yaml_string
 from rich.text import Text
@@ -10,12 +11,21 @@ from kmd.commands.command_registry import kmd_command
 from kmd.commands.files_commands import files, trash
 from kmd.commands.selection_commands import select
 from kmd.config.logger import get_logger
-from kmd.config.settings import global_settings
+from kmd.config.settings import global_settings, update_global_settings
 from kmd.config.text_styles import COLOR_EMPH, COLOR_HINT, COLOR_SUGGESTION, EMOJI_TRUE, EMOJI_WARN
 from kmd.errors import InvalidInput
+from kmd.exec.action_exec import save_run_record
 from kmd.exec.resolve_args import assemble_path_args, assemble_store_path_args, resolve_locator_arg
+from kmd.exec.run_records import (
+    aggregate_phases,
+    aggregate_runs,
+    GroupBy,
+    read_run_records,
+    record_run,
+)
 from kmd.file_formats.chat_format import tail_chat_history
 from kmd.file_storage.metadata_dirs import MetadataDirs
+from kmd.file_tools.file_sort_filter import parse_since
 from kmd.lang_tools.inflection import plural
 from kmd.media import media_tools
 from kmd.model.args_model import fmt_loc
@@ -25,6 +35,7 @@ from kmd.model.paths_model import fmt_store_path, StorePath
 from kmd.model.shell_model import ShellResult
 from kmd.preconditions import all_preconditions
 from kmd.preconditions.precondition_checks import actions_matching_paths
+from kmd.provenance.rebuild import plan_rebuild, rebuild_job, run_jobs, workspace_sources
 from kmd.server.local_url_formatters import local_url_formatter
 from kmd.shell_tools.git_tools import add_to_git_ignore
 from kmd.shell_tools.native_tools import tail_file
@@ -35,7 +46,7 @@ from kmd.shell_ui.shell_output import (
     print_status,
     Wrap,
 )
-from kmd.util.format_utils import fmt_lines
+from kmd.util.format_utils import fmt_lines, fmt_size_human
 from kmd.util.obj_utils import remove_values
 from kmd.util.parse_key_vals import format_key_value, parse_key_value
 from kmd.util.type_utils import not_none
@@ -151,6 +162,47 @@ def clear_history() -> None:
     trash(ws.base_dir / ws.dirs.shell_history_yml)
 
 
+@kmd_command
+def run_stats(by: str = "action", max: int = 100, runs: bool = False, phases: bool = False) -> None:
+    """
+    Show LLM calls, tokens, cost, and latency of recent action runs in the current
+    workspace, totaled by action, model, or item.
+
+    :param by: Total by `action`, `model`, or `item`.
+    :param max: Include at most the last `max` runs.
+    :param runs: Also list each run.
+    :param phases: Also show the time of each phase of running each action (resolving
+        inputs, hashing, checks, running, saving, and selecting).
+    """
+    if by not in get_args(GroupBy):
+        raise InvalidInput(f"Can only total by one of: {', '.join(get_args(GroupBy))}")
+
+    ws = current_workspace()
+    records = read_run_records(ws.base_dir / ws.dirs.run_records_jsonl, max)
+    if not records:
+        cprint("No action runs recorded yet.")
+        return
+
+    if runs:
+        print_heading("Action Runs")
+        for record in records:
+            cprint(record.summary_str(), text_wrap=Wrap.NONE)
+        cprint()
+
+    print_heading(f"LLM Usage by {by.capitalize()} ({len(records)} {plural('run', len(records))})")
+    totals = aggregate_runs(records, cast(GroupBy, by))
+    for key, usage in sorted(totals.items(), key=lambda kv: kv[1].cost, reverse=True):
+        cprint(format_name_and_description(key, str(usage)))
+    cprint()
+
+    if phases:
+        print_heading("Time by Phase")
+        for action, by_phase in aggregate_phases(records).items():
+            lines = [f"{phase}: {totals}" for phase, totals in by_phase.items()]
+            cprint(f"`{action}`:\n{fmt_lines(lines)}", text_wrap=Wrap.NONE)
+        cprint()
+
+
 @kmd_command
 def init(path: Optional[str] = None) -> None:
     """
@@ -235,6 +287,63 @@ def relations(*paths: str) -> None:
         cprint()
 
 
+@kmd_command
+def rebuild(*paths: str, dry_run: bool = False) -> ShellResult:
+    """
+    Recompute derived items that are stale, like `make`. An item is stale if an input
+    has changed since it was made (according to the input hashes in its provenance), or
+    an input is itself stale. Only stale items are recomputed, in dependency order, with
+    independent ones in parallel. Rebuilt items keep their paths, and their previous
+    versions are archived.
+
+    :param dry_run: Just list stale items and why they are stale.
+    """
+    ws = current_workspace()
+    targets = None
+    if paths:
+        targets = [
+            item_path
+            for store_path in assemble_store_path_args(*paths)
+            for item_path in ws.walk_items(store_path)
+        ]
+
+    @cache
+    def current_hash(store_path: StorePath) -> Optional[str]:
+        return ws.hash(store_path) if ws.exists(store_path) else None
+
+    plan = plan_rebuild(workspace_sources(), current_hash, targets)
+    for store_path, input_path in plan.missing.items():
+        log.warning(
+            "%s Can't rebuild %s since its input %s no longer exists",
+            EMOJI_WARN,
+            fmt_loc(store_path),
+            fmt_loc(input_path),
+        )
+    if not plan.stale:
+        print_status("Nothing to rebuild.")
+        return ShellResult()
+
+    if dry_run:
+        print_heading(f"Stale Items ({len(plan.stale)})")
+        for store_path, reason in plan.stale.items():
+            cprint(format_name_and_description(fmt_loc(store_path), reason))
+        return ShellResult()
+
+    with record_run("rebuild") as record:
+        result = run_jobs(plan.jobs, rebuild_job)
+        record.items = len(result.rebuilt)
+    save_run_record(record)
+
+    print_status(
+        f"Rebuilt {len(result.rebuilt)} {plural('item', len(result.rebuilt))} "
+        f"({len(plan.jobs) - len(result.failed) - len(result.skipped)} of {len(plan.jobs)} "
+        f"operations; {len(result.failed)} failed, {len(result.skipped)} skipped)."
+    )
+    if result.rebuilt:
+        select(*result.rebuilt)
+    return ShellResult(show_selection=bool(result.rebuilt))
+
+
 @kmd_command
 def param(*args: str) -> None:
     """
@@ -318,9 +427,10 @@ def archive(*paths: str) -> None:
     """
     store_paths = assemble_store_path_args(*paths)
     ws = current_workspace()
-    archived_paths = [ws.archive(store_path) for store_path in store_paths]
+    for store_path in store_paths:
+        ws.archive(store_path)
 
-    print_status(f"Archived:\n{fmt_lines(fmt_loc(p) for p in archived_paths)}")
+    print_status(f"Archived:\n{fmt_lines(fmt_loc(p) for p in store_paths)}")
     select()
 
 
@@ -330,7 +440,8 @@ def unarchive(*paths: str) -> None:
     Unarchive the items at the given paths.
     """
     ws = current_workspace()
-    store_paths = assemble_store_path_args(*paths)
+    # Archived paths are not files in the workspace, so don't check they exist.
+    store_paths = [StorePath(path) for path in assemble_path_args(*paths)]
     unarchived_paths = [ws.unarchive(store_path) for store_path in store_paths]
 
     print_status(f"Unarchived:\n{fmt_lines(fmt_loc(p) for p in unarchived_paths)}")
@@ -347,6 +458,52 @@ def clear_archive() -> None:
     os.makedirs(archive_dir, exist_ok=True)
 
 
+@kmd_command
+def compact_archive(keep: int = 3, max_age: Optional[str] = None) -> None:
+    """
+    Compact the archive, keeping only recent versions of each archived item and deleting
+    content no longer needed by any of them. Identical versions are only stored once, so
+    this mostly matters for items that have been edited many times.
+
+    :param keep: Maximum number of archived versions to keep for each item (at least 1).
+    :param max_age: Also drop versions archived longer ago than this (e.g., '30d' or '2w').
+        The most recent version of each item is always kept.
+    """
+    ws = current_workspace()
+    max_age_seconds = parse_since(max_age) if max_age else 0.0
+    stats = ws.compact_archive(keep_versions=keep, max_age=max_age_seconds)
+
+    print_status(
+        "Compacted archive: removed %s old versions and %s unreferenced files "
+        "(%s reclaimed), migrated %s files from older archive layout.",
+        stats.versions_removed,
+        stats.blobs_removed,
+        fmt_size_human(stats.bytes_reclaimed),
+        stats.legacy_files_migrated,
+    )
+
+
+@kmd_command
+def watch_files(stop: bool = False) -> None:
+    """
+    Watch files in the current workspace for changes made outside of kmd (e.g. in an
+    editor or by git), so cached items, the id index, and selections stay up to date
+    without a reload. Also applies to workspaces loaded later in this session.
+
+    :param stop: Stop watching instead.
+    """
+    with update_global_settings() as settings:
+        settings.watch_files = not stop
+
+    ws = current_workspace()
+    if stop:
+        ws.stop_watching()
+        print_status("Stopped watching files in workspace: %s", fmt_loc(ws.base_dir))
+    else:
+        ws.start_watching()
+        print_status("Watching files in workspace: %s", fmt_loc(ws.base_dir))
+
+
 @kmd_command
 def suggest_actions(all: bool = False) -> None:
     """
@@ -1,21 +1,43 @@
 import ast
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, Iterable, List, Tuple, TYPE_CHECKING
 
-import pandas as pd
-from litellm import embedding
 from pydantic.dataclasses import dataclass
 
 from kmd.config.logger import get_logger
-from kmd.model.language_models import DEFAULT_EMBEDDING_MODEL
+from kmd.llms.concurrency_limiter import limiter_for
+from kmd.llms.mock_llm import is_mock_model, mock_embedding
+from kmd.model.language_models import DEFAULT_EMBEDDING_MODEL, EmbeddingModel
 from kmd.util.strif import abbreviate_list
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 log = get_logger(__name__)
 
 
 BATCH_SIZE = 1024
 
 
+def embed_texts(
+    texts: List[str], model: EmbeddingModel = DEFAULT_EMBEDDING_MODEL
+) -> List[List[float]]:
+    """
+    Embed a batch of texts with LiteLLM (or the local mock provider).
+    """
+    if is_mock_model(model.value):
+        return limiter_for(model.value).run(mock_embedding, model.value, texts)
+
+    from litellm import embedding
+
+    response = limiter_for(model.value).run(embedding, model=model.value, input=texts)
+    if not response.data:
+        log.error("No embedding response data, got: %s", response)
+        raise ValueError("No embedding response data")
+
+    return [e["embedding"] for e in response.data]
+
+
 @dataclass
 class Embeddings:
     """
@@ -28,7 +50,9 @@ class Embeddings:
     def as_iterable(self) -> Iterable[Tuple[str, str, List[float]]]:
         return ((key, text, emb) for key, (text, emb) in self.data.items())
 
-    def as_df(self) -> pd.DataFrame:
+    def as_df(self) -> "pd.DataFrame":
+        import pandas as pd
+
         keys, texts, embeddings = zip(*[(key, text, emb) for key, (text, emb) in self.data.items()])
         return pd.DataFrame(
             {
@@ -61,11 +85,7 @@ class Embeddings:
 
             # TODO: Add an embedding cache.
 
-            response = embedding(model=model.value, input=texts)
-            if not response.data:
-                raise ValueError("No embedding response data")
-
-            batch_embeddings = [e["embedding"] for e in response.data]
+            batch_embeddings = embed_texts(texts, model)
             data.update({key: (text, emb) for key, text, emb in zip(keys, texts, batch_embeddings)})
 
             log.message(
@@ -79,6 +99,8 @@ class Embeddings:
 
     @classmethod
     def read_from_csv(cls, path: Path) -> "Embeddings":
+        import pandas as pd
+
         df = pd.read_csv(path)
         df["embedding"] = df["embedding"].apply(ast.literal_eval)
         data = {row["key"]: (row["text"], row["embedding"]) for _, row in df.iterrows()}
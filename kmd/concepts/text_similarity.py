@@ -1,19 +1,20 @@
-from typing import List, Tuple
+from typing import List, Tuple, TYPE_CHECKING
 
-import pandas as pd
-from litellm import embedding
-from scipy import spatial
-
-from kmd.concepts.embeddings import Embeddings
+from kmd.concepts.embeddings import embed_texts, Embeddings
 from kmd.config.logger import get_logger
 from kmd.lang_tools.inflection import sort_by_length
 from kmd.model.language_models import DEFAULT_EMBEDDING_MODEL
 from kmd.util.log_calls import tally_calls
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 log = get_logger(__name__)
 
 
 def cosine_relatedness(x, y):
+    from scipy import spatial
+
     return 1 - spatial.distance.cosine(x, y)
 
 
@@ -27,12 +28,7 @@ def rank_by_relatedness(
     """
     Returns a list of strings and relatednesses, sorted from most related to least.
     """
-    response = embedding(model=model.value, input=[query])
-    if not response.data:
-        log.error("No embedding response data, got: %s", response)
-        raise ValueError("No embedding response data")
-
-    query_embedding = response.data[0].embedding
+    [query_embedding] = embed_texts([query], model)
 
     scored_strings = [
         (key, text, relatedness_fn(query_embedding, emb))
@@ -46,7 +42,9 @@ def rank_by_relatedness(
 @tally_calls(level="warning", min_total_runtime=5, if_slower_than=10)
 def relate_texts_by_embedding(
     embeddings: Embeddings, relatedness_fn=cosine_relatedness
-) -> pd.DataFrame:
+) -> "pd.DataFrame":
+    import pandas as pd
+
     log.message("Computing relatedness matrix of %d text embeddings…", len(embeddings.data))
 
     keys = [key for key, _, _ in embeddings.as_iterable()]
@@ -67,7 +65,7 @@ def relate_texts_by_embedding(
 
 
 def find_related_pairs(
-    relatedness_matrix: pd.DataFrame, threshold: float = 0.9
+    relatedness_matrix: "pd.DataFrame", threshold: float = 0.9
 ) -> List[Tuple[str, str, float]]:
     log.message(
         "Finding near duplicates among %s items (threshold %s)",
@@ -2,21 +2,112 @@ import time
 
 import_start_time = time.time()
 
-# TODO: Find a better way to improve startup time by delaying importing of big packages.
-# Tried these but none seem quite like what we need?
+# Startup time is dominated by imports, so big packages (litellm, weasyprint, spacy,
+# inflect, pandas, etc.) should be imported within the functions that use them, not at
+# the top of modules loaded at startup. Use `devtools/startup_benchmark.py` to see which
+# imports dominate and check startup stays within budget.
+#
+# We tried these general-purpose approaches but none were quite what we need:
 # https://pypi.org/project/apipkg/
 # https://scientific-python.org/specs/spec-0001/
 # https://github.com/scientific-python/lazy-loader
 # https://pypi.org/project/lazy-import/
 # https://pypi.org/project/lazy-imports/
-
 # Also tried lazyasd's background importing but it didn't speed up anything
-# and intermittentlly causes errors.
-
-# from lazyasd import load_module_in_background
-# load_module_in_background("wikipedia")
-# load_module_in_background("tenacity")
-# load_module_in_background("deepgram")
-# load_module_in_background("numpy")
-# load_module_in_background("pandas")
-# load_module_in_background("weasyprint")
+# and intermittently causes errors.
+
+import importlib.abc
+import importlib.machinery
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Callable, Dict, List
+
+ImportHook = Callable[[ModuleType], None]
+
+_hooks: Dict[str, List[ImportHook]] = {}
+_hooks_lock = threading.RLock()
+
+
+class _HookLoader(importlib.abc.Loader):
+    """
+    Wraps a module's loader to run hooks after the module is executed.
+    """
+
+    def __init__(self, loader: importlib.abc.Loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec: importlib.machinery.ModuleSpec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        self._loader.exec_module(module)
+        _run_hooks(self._name, module)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+
+class _PostImportFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname: str, path, target=None):
+        if fullname not in _hooks:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec:
+                if spec.loader:
+                    spec.loader = _HookLoader(spec.loader, fullname)
+                return spec
+        return None
+
+
+_finder = _PostImportFinder()
+
+
+def _run_hooks(name: str, module: ModuleType) -> None:
+    with _hooks_lock:
+        hooks = _hooks.pop(name, [])
+    for hook in hooks:
+        hook(module)
+
+
+def when_imported(module_name: str, hook: ImportHook) -> None:
+    """
+    Call `hook` with the module once it is imported, or right away if it already has
+    been. Useful to configure a slow-to-import package without importing it ourselves.
+    """
+    with _hooks_lock:
+        module = sys.modules.get(module_name)
+        if module is None:
+            if _finder not in sys.meta_path:
+                sys.meta_path.insert(0, _finder)
+            _hooks.setdefault(module_name, []).append(hook)
+            return
+    hook(module)
+
+
+## Tests
+
+
+def test_when_imported():
+    seen: List[str] = []
+
+    # Already imported.
+    when_imported("json", lambda module: seen.append(module.__name__))
+    assert seen == ["json"]
+
+    # Not yet imported.
+    sys.modules.pop("uuid", None)
+    when_imported("uuid", lambda module: seen.append(module.__name__))
+    assert seen == ["json"]
+    import uuid
+
+    assert seen == ["json", "uuid"]
+    assert uuid.uuid4()
+
+    # Hooks run once.
+    importlib.reload(uuid)
+    assert seen == ["json", "uuid"]
@@ -1,13 +1,17 @@
+import atexit
 import logging
 import os
 import threading
 from collections.abc import Generator
 from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
 from functools import cache
 from logging import ERROR, Formatter, INFO
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from typing import Any, IO, Optional
+from queue import Queue
+from typing import Any, Dict, IO, Optional
 
 import rich
 from rich import reconfigure
@@ -18,16 +22,30 @@ from rich.theme import Theme
 from slugify import slugify
 
 import kmd.config.suppress_warnings  # noqa: F401
+from kmd.config.lazy_imports import when_imported
 from kmd.config.settings import global_settings, LogLevel
 from kmd.config.text_styles import EMOJI_ERROR, EMOJI_SAVED, EMOJI_WARN, KmdHighlighter, RICH_STYLES
+from kmd.util.background_writer import BackgroundWriter, EXIT_FLUSH_TIMEOUT
 from kmd.util.format_utils import fmt_path
 from kmd.util.stack_traces import current_stack_traces
-from kmd.util.strif import atomic_output_file, new_timestamped_uid
+from kmd.util.strif import new_timestamped_uid
 from kmd.util.task_stack import task_stack_prefix_str
 
 LOG_DIR_NAME = ".kmd/logs"
 LOG_FILE_NAME = "kmd.log"
 LOG_OBJECTS_NAME = "objects"
+LOG_PARTIAL_NAME = "partial"
+
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+LOG_QUEUE_MAX_RECORDS = 10_000
+"""Log records waiting to be written to the log file, beyond which logging blocks."""
+
+LOG_OBJECTS_MAX_BYTES = 200 * 1024 * 1024
+"""Total size of saved objects, beyond which the oldest are deleted."""
+
+LOG_OBJECTS_QUEUE_MAX_BYTES = 32 * 1024 * 1024
+"""Size of saved objects waiting to be written, beyond which saving blocks."""
 
 _log_root = Path(".")
 
@@ -46,14 +64,27 @@ def log_objects_dir() -> Path:
     return log_dir() / LOG_OBJECTS_NAME
 
 
-@dataclass
-class TlContext(threading.local):
-    console: Optional[Console] = None
+def log_partial_dir() -> Path:
+    """
+    Partial output kept from interrupted work. Unlike saved objects, these are never
+    deleted automatically.
+    """
+    return log_dir() / LOG_PARTIAL_NAME
+
 
+@dataclass(frozen=True)
+class ConsoleOverride:
+    console: Console
+    include_logs: bool = False
+    """Whether console log messages also go to this console."""
 
-_tl_context = TlContext()
+
+_console_override: ContextVar[Optional[ConsoleOverride]] = ContextVar(
+    "console_override", default=None
+)
 """
-Thread-local context override for Rich console.
+Context override for Rich console. Context variables are per thread, but also carry over
+to worker threads started with `submit_in_context`.
 """
 
 
@@ -72,10 +103,10 @@ reconfigure(theme=get_theme(), highlighter=get_highlighter())
 
 def get_console() -> Console:
     """
-    Return the Rich global console, unless it is overridden by a
-    thread-local console.
+    Return the Rich global console, unless it is overridden in the current context.
     """
-    return _tl_context.console or rich.get_console()
+    override = _console_override.get()
+    return override.console if override else rich.get_console()
 
 
 def new_console(file: Optional[IO[str]], record: bool) -> Console:
@@ -87,19 +118,20 @@ def new_console(file: Optional[IO[str]], record: bool) -> Console:
 
 
 @contextmanager
-def record_console() -> Generator[Console, None, None]:
+def record_console(
+    console: Optional[Console] = None, include_logs: bool = False
+) -> Generator[Console, None, None]:
     """
-    Context manager to temporarily override the global console with a thread-local
-    console that records output.
+    Context manager to temporarily override the global console (in this thread and
+    context) with a console that records output (a new one, unless one is given). If
+    `include_logs` is set, console log messages are recorded there too.
     """
-    old_console = _tl_context.console
-    console = new_console(file=NULL_FILE, record=True)
-    _tl_context.console = console
-
+    console = console or new_console(file=NULL_FILE, record=True)
+    token = _console_override.set(ConsoleOverride(console, include_logs))
     try:
         yield console
     finally:
-        _tl_context.console = old_console
+        _console_override.reset(token)
 
 
 # TODO: Need this to enforce flushing of stream?
@@ -108,9 +140,28 @@ def record_console() -> Generator[Console, None, None]:
 #         super().emit(record)
 #         self.flush()
 
+
+class _BlockingQueueHandler(QueueHandler):
+    """
+    Queues log records for another thread to write, waiting if the queue is full.
+    """
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put(record)
+
+
 global _file_handler
 global _console_handler
 
+_file_queue_handler: Optional[QueueHandler] = None
+_file_listener: Optional[QueueListener] = None
+
+_object_writer = BackgroundWriter(
+    "log_objects",
+    max_queued_bytes=LOG_OBJECTS_QUEUE_MAX_BYTES,
+    max_dir_bytes=LOG_OBJECTS_MAX_BYTES,
+)
+
 
 def logging_setup():
     """
@@ -125,22 +176,40 @@ def logging_setup():
     os.makedirs(log_objects_dir(), exist_ok=True)
 
     # Verbose logging to file, important logging to console.
-    global _file_handler
-    _file_handler = logging.FileHandler(log_file_path())
+    # Writing to the file is done on a background thread, so it never slows callers.
+    global _file_handler, _file_queue_handler, _file_listener
+    if _file_listener:
+        _file_listener.stop()  # Writes anything still queued.
+        _file_handler.close()
+    _file_handler = RotatingFileHandler(
+        log_file_path(), maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS
+    )
     _file_handler.setLevel(global_settings().file_log_level.value)
     _file_handler.setFormatter(Formatter("%(asctime)s %(levelname).1s %(name)s - %(message)s"))
 
+    log_queue: Queue[logging.LogRecord] = Queue(maxsize=LOG_QUEUE_MAX_RECORDS)
+    _file_queue_handler = _BlockingQueueHandler(log_queue)
+    _file_queue_handler.setLevel(global_settings().file_log_level.value)
+    _file_listener = QueueListener(log_queue, _file_handler, respect_handler_level=True)
+    _file_listener.start()
+
     class PrefixedRichHandler(RichHandler):
         def emit(self, record):
             # Can add an extra indent to differentiate logs but it's a little messier looking.
             # record.msg = EMOJI_MSG_INDENT + record.msg
-            super().emit(record)
+            override = _console_override.get()
+            if override and override.include_logs:
+                message = self.render_message(record, self.format(record))
+                override.console.print(
+                    self.render(record=record, traceback=None, message_renderable=message)
+                )
+            else:
+                super().emit(record)
 
     global _console_handler
     _console_handler = PrefixedRichHandler(
-        # For now we use the fixed global console for logging.
-        # In the ruture we may want to add a way to have thread-local capture
-        # of all system logs.
+        # We use the fixed global console for logging, except in threads recording
+        # their logs with `record_console()`.
         console=rich.get_console(),
         level=global_settings().console_log_level.value,
         show_time=False,
@@ -153,22 +222,28 @@ def logging_setup():
     _console_handler.setFormatter(Formatter("%(message)s"))
 
     # Manually adjust logging for a few packages, removing previous verbose default handlers.
+    # These packages are slow to import and set up their own handlers when imported, so
+    # we configure them now and again once (if ever) they are imported.
+    _reset_loggers(_log_levels)
 
-    import litellm
-    from litellm import _logging  # noqa: F401
-    from weasyprint import LOGGER, PROGRESS_LOGGER  # noqa: F401
+    if not _import_hooks_registered:
+        _register_import_hooks()
+        atexit.register(_stop_logging)
 
-    litellm.suppress_debug_info = True  # Suppress overly prominent exception messages.
 
-    log_levels = {
-        None: INFO,
-        "LiteLLM": INFO,
-        "LiteLLM Router": INFO,
-        "LiteLLM Proxy": INFO,
-        "weasyprint": ERROR,
-        "weasyprint.progress": ERROR,
-    }
+_log_levels = {
+    None: INFO,
+    "LiteLLM": INFO,
+    "LiteLLM Router": INFO,
+    "LiteLLM Proxy": INFO,
+    "weasyprint": ERROR,
+    "weasyprint.progress": ERROR,
+}
 
+_import_hooks_registered = False
+
+
+def _reset_loggers(log_levels: Dict[Optional[str], int]):
     for logger_name, level in log_levels.items():
         logger = logging.getLogger(logger_name)
         logger.setLevel(level)
@@ -177,7 +252,22 @@ def logging_setup():
         for handler in logger.handlers[:]:
             logger.removeHandler(handler)
         logger.addHandler(_console_handler)
-        logger.addHandler(_file_handler)
+        logger.addHandler(_file_queue_handler)
+
+
+def _register_import_hooks():
+    global _import_hooks_registered
+    _import_hooks_registered = True
+
+    def litellm_imported(litellm):
+        litellm.suppress_debug_info = True  # Suppress overly prominent exception messages.
+
+    def package_logging_imported(_module):
+        # litellm adds its own handlers when imported.
+        _reset_loggers({name: level for name, level in _log_levels.items() if name})
+
+    when_imported("litellm", litellm_imported)
+    when_imported("litellm._logging", package_logging_imported)
 
 
 def prefix(line, emoji: str = "", warn_emoji: str = ""):
@@ -236,13 +326,8 @@ class CustomLogger:
             f"{new_timestamped_uid()}.{file_ext.lstrip('.')}"
         )
         path = log_objects_dir() / filename
-        with atomic_output_file(path) as tmp_filename:
-            if isinstance(obj, bytes):
-                with open(tmp_filename, "wb") as f:
-                    f.write(obj)
-            else:
-                with open(tmp_filename, "w") as f:
-                    f.write(str(obj))
+        # Written in the background. Only the most recent saved objects are kept.
+        _object_writer.write(path, obj if isinstance(obj, bytes) else str(obj))
 
         self.log(level, "%s %s saved: %s", EMOJI_SAVED, description, path)
 
@@ -258,14 +343,25 @@ def get_log_file_stream():
     return _file_handler.stream
 
 
+def _stop_logging() -> None:
+    _object_writer.flush(EXIT_FLUSH_TIMEOUT)
+    if _file_listener:
+        _file_listener.stop()
+
+
 def reset_logging(log_root: Optional[Path] = None):
     """
-    Reset the logging root, if it has changed.
+    Reset the logging root, if it has changed. With no root, reset logging anyway (e.g.
+    to apply new log levels).
     """
     global _log_lock
     with _log_lock:
         global _log_root
-        if log_root and log_root != _log_root:
+        if log_root and log_root == _log_root:
+            # Unchanged, and this is called on every `current_workspace()`, so skip the
+            # setup (which would also replace the open log file handler).
+            return
+        if log_root:
             log = get_logger(__name__)
             log.info("Resetting log root: %s", fmt_path(log_file_path().absolute()))
 
@@ -19,6 +19,8 @@ RCFILE_PATH = "~/.kmdrc"
 SANDBOX_NAME = "sandbox"
 SANDBOX_KB_PATH = f"~/.local/kmd/{SANDBOX_NAME}.kb"
 
+ACTION_MANIFEST_PATH = "~/.local/kmd/cache/action_manifest_{key}.json"
+
 GLOBAL_CACHE_NAME = "kmd_cache"
 MEDIA_CACHE_NAME = "media"
 CONTENT_CACHE_NAME = "content"
@@ -135,6 +137,9 @@ class Settings:
     use_kyrm_codes: bool
     """If true, use Kyrm codes for enriching terminal output."""
 
+    watch_files: bool
+    """If true, watch workspace files for changes made outside of kmd (e.g. in an editor)."""
+
 
 # Initial default settings.
 _settings = Settings(
@@ -150,6 +155,7 @@ _settings = Settings(
     local_server_ports_max=LOCAL_SERVER_PORTS_MAX,
     local_server_port=0,
     use_kyrm_codes=False,
+    watch_files=False,
 )
 
 
@@ -3,6 +3,7 @@ Unified hierarchy of error types. These inherit from standard errors like
 ValueError and FileExistsError but are more fine-grained.
 """
 
+import sys
 from typing import Tuple, Type
 
 
@@ -147,7 +148,23 @@ class FileFormatError(ContentError):
     pass
 
 
-def _nonfatal_exceptions() -> Tuple[Type[Exception], ...]:
+class Cancelled(BaseException):
+    """
+    Raised within a task that was cancelled, like a background job. Like
+    KeyboardInterrupt, not an Exception, so error handlers don't catch it.
+    """
+
+    pass
+
+
+def nonfatal_exceptions() -> Tuple[Type[Exception], ...]:
+    """
+    Exceptions that are not fatal and usually don't merit a full stack trace.
+
+    Exceptions from slow-to-import packages (litellm, yt_dlp) are only included once
+    the package is imported, since they can't be raised before then. This lets us
+    avoid importing them at startup.
+    """
     from xonsh.tools import XonshError
 
     exceptions = [
@@ -157,29 +174,16 @@ def _nonfatal_exceptions() -> Tuple[Type[Exception], ...]:
         XonshError,
     ]
 
-    try:
-        import litellm
-
+    litellm = sys.modules.get("litellm")
+    if litellm:
         exceptions.append(litellm.exceptions.APIError)
-    except ImportError:
-        pass
-
-    try:
-        import yt_dlp
 
-        exceptions.append(yt_dlp.utils.DownloadError)
-    except ImportError:
-        pass
+    yt_dlp_utils = sys.modules.get("yt_dlp.utils")
+    if yt_dlp_utils:
+        exceptions.append(yt_dlp_utils.DownloadError)
 
     return tuple(exceptions)
 
 
-NONFATAL_EXCEPTIONS = _nonfatal_exceptions()
-"""Exceptions that are not fatal and usually don't merit a full stack trace."""
-
-
 def is_fatal(exception: Exception) -> bool:
-    for e in NONFATAL_EXCEPTIONS:
-        if isinstance(exception, e):
-            return False
-    return True
+    return not isinstance(exception, nonfatal_exceptions())
@@ -1,12 +1,19 @@
-import time
 from dataclasses import replace
 from typing import List, Optional
 
 from kmd.action_defs import look_up_action
 from kmd.config.logger import get_logger
 from kmd.config.text_styles import EMOJI_SKIP, EMOJI_SUCCESS, EMOJI_TIMING
-from kmd.errors import ContentError, InvalidInput, InvalidOutput, NONFATAL_EXCEPTIONS
+from kmd.errors import ContentError, InvalidInput, InvalidOutput, nonfatal_exceptions
 from kmd.exec.resolve_args import assemble_action_args
+from kmd.exec.run_records import (
+    append_run_record,
+    current_run,
+    PhaseTimer,
+    record_item,
+    record_run,
+    RunRecord,
+)
 from kmd.exec.system_actions import fetch_page_metadata
 from kmd.lang_tools.inflection import plural
 from kmd.model.actions_model import (
@@ -23,6 +30,7 @@ from kmd.model.operations_model import Input, Operation, Source
 from kmd.model.paths_model import StorePath
 from kmd.util.format_utils import fmt_lines
 from kmd.util.task_stack import task_stack
+from kmd.util.tracing import trace_span
 from kmd.util.type_utils import not_none
 from kmd.workspaces.selections import Selection
 from kmd.workspaces.workspace_importing import import_and_load
@@ -58,10 +66,52 @@ def run_action(
     rerun=False,
 ) -> ActionResult:
     """
-    Main function to run an action.
+    Main function to run an action. Runs are recorded (with the time of each phase and the
+    usage and latency of any LLM calls) and top-level runs are saved to the workspace run
+    records.
     """
+    action_name = action.name if isinstance(action, Action) else action
+    record = None
+    try:
+        with record_run(action_name) as record, trace_span(action_name, "action"):
+            result = _run_action(
+                action,
+                *provided_args,
+                internal_call=internal_call,
+                override_state=override_state,
+                rerun=rerun,
+            )
+            record.items = len(result.items)
+        if record.elapsed > 1.0:
+            log.message(
+                "%s Action `%s` took %.1fs (%s).",
+                EMOJI_TIMING,
+                action_name,
+                record.elapsed,
+                record.phases_str(),
+            )
+    finally:
+        if record and not internal_call:
+            save_run_record(record)
+
+    return result
+
+
+def save_run_record(record: RunRecord) -> None:
+    if record.llm_calls:
+        log.message("%s LLM usage for action:\n%s", EMOJI_TIMING, record.summary_str())
+    ws = current_workspace()
+    append_run_record(ws.base_dir / ws.dirs.run_records_jsonl, record)
 
-    start_time = time.time()
+
+def _run_action(
+    action: str | Action,
+    *provided_args: str,
+    internal_call=False,
+    override_state: Optional[State] = None,
+    rerun=False,
+) -> ActionResult:
+    phases = PhaseTimer()
 
     # Get the action and action name.
     if not isinstance(action, Action):
@@ -96,6 +146,7 @@ def run_action(
     # Ensure input items are already saved in the workspace and load the corresponding items.
     # This also imports any URLs.
     input_items = [import_and_load(ws, arg) for arg in args]
+    phases.end("inputs")
 
     # Now make a note of the the operation we will perform.
     # If the inputs are paths, record the input paths with hashes.
@@ -103,6 +154,7 @@ def run_action(
     store_paths = [StorePath(not_none(item.store_path)) for item in input_items if item.store_path]
     inputs = [Input(store_path, ws.hash(store_path)) for store_path in store_paths]
     operation = Operation(action_name, inputs, action.param_value_summary())
+    phases.end("hash")
 
     log.message("Action:\n%s", fmt_lines([f"`{operation.command_line(with_options=False)}`"]))
     if len(action.param_value_summary()) > 0:
@@ -119,6 +171,7 @@ def run_action(
         if input_items:
             log.message("Assembling metadata for input items:\n%s", fmt_lines(input_items))
             input_items = [fetch_url_items(item) for item in input_items]
+    phases.end("precondition")
 
     existing_result = None
 
@@ -143,11 +196,15 @@ def run_action(
                 )
                 existing_items = [ws.load(not_none(store_path)) for store_path in already_present]
                 existing_result = ActionResult(existing_items)
+                run = current_run()
+                if run:
+                    run.status = "skipped"
     else:
         log.info(
             "Rerun check: Will run since `%s` has no rerun check (no preassembly).",
             action_name,
         )
+    phases.end("rerun_check")
 
     if existing_result:
         # Use the cached result.
@@ -172,6 +229,7 @@ def run_action(
 
         if not result:
             raise InvalidOutput(f"Action `{action_name}` did not return any results")
+        phases.end("run")
 
         # Record the operation and add to the history of each item.
         was_run_for_each = isinstance(action, PerItemAction)
@@ -189,7 +247,9 @@ def run_action(
                 item.state = override_state
 
         # Save the result items. This is done here; the action itself should not worry about saving.
+        # Items are saved as a batch, so either all results are saved or none are.
         skipped_paths = []
+        items_to_save = []
         for item in result.items:
             if result.skip_duplicates:
                 store_path = ws.find_by_id(item)
@@ -197,7 +257,9 @@ def run_action(
                     skipped_paths.append(store_path)
                     continue
 
-            ws.save(item)
+            items_to_save.append(item)
+
+        ws.save_batch(items_to_save)
 
         if skipped_paths:
             log.message(
@@ -236,9 +298,7 @@ def run_action(
             len(result.items),
             plural("item", len(result.items)),
         )
-        elapsed = time.time() - start_time
-        if elapsed > 1.0:
-            log.message("%s Action `%s` took %.1fs.", EMOJI_TIMING, action_name, elapsed)
+        phases.end("save")
 
     # Implement any path operations from the output and/or select the final output
     if not internal_call:
@@ -269,6 +329,7 @@ def run_action(
             final_outputs = sorted(set(result_store_paths) - set(archived_store_paths))
             log.info("final_outputs:\n%s", fmt_lines(final_outputs))
             ws.selections.push(Selection(paths=final_outputs))
+        phases.end("select")
 
     return result
 
@@ -283,7 +344,8 @@ def run_for_each_item(action: Action, items: ActionInput) -> ActionResult:
 
     def run_item(item: Item) -> Item:
         # Should have already validated arg counts by now.
-        result = action.run([item])
+        with record_item(item.store_path):
+            result = action.run([item])
         if result.has_hints():
             log.warning(
                 "Ignoring result hints for action `%s` when running on multiple items"
@@ -311,7 +373,7 @@ def run_for_each_item(action: Action, items: ActionInput) -> ActionResult:
                 result_item = run_item(item)
                 result_items.append(result_item)
                 had_error = False
-            except NONFATAL_EXCEPTIONS as e:
+            except nonfatal_exceptions() as e:
                 errors.append(e)
                 had_error = True
 
@@ -0,0 +1,203 @@
+"""
+A manifest of all actions (names, descriptions, preconditions, and params), saved
+to disk so help and completion can list actions without importing every action
+module (and their often heavy dependencies). It's rebuilt whenever any action source
+file changes.
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from kmd.config.logger import get_logger
+from kmd.model.actions_model import Action
+from kmd.model.args_model import fmt_loc
+from kmd.model.params_model import Param
+from kmd.util.strif import atomic_output_file
+
+log = get_logger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+@dataclass(frozen=True)
+class ParamInfo:
+    name: str
+    description: Optional[str]
+    is_bool: bool
+    default_value: Optional[str]
+    valid_values: List[str]
+
+    def as_param(self) -> Param:
+        """
+        A Param to display or complete on. Values are all strings except for bools.
+        """
+        return Param(
+            self.name,
+            self.description,
+            default_value=self.default_value,
+            type=bool if self.is_bool else str,
+            valid_str_values=self.valid_values or None,
+        )
+
+
+@dataclass(frozen=True)
+class ActionInfo:
+    """
+    What we need to know about an action without importing it.
+    """
+
+    name: str
+    description: str
+    precondition: str
+    """The precondition as displayed (its name, in backticks)."""
+
+    params: List[ParamInfo]
+    module: str
+    package: str
+
+    @property
+    def param_list(self) -> List[Param]:
+        return [param.as_param() for param in self.params]
+
+    @classmethod
+    def from_action(cls, action: Action) -> "ActionInfo":
+        module = type(action).__module__
+        return cls(
+            name=action.name,
+            description=action.description,
+            precondition=str(action.precondition),
+            params=[
+                ParamInfo(
+                    name=param.name,
+                    description=param.description,
+                    is_bool=param.type == bool,
+                    default_value=param.default_value_str,
+                    valid_values=param.valid_values,
+                )
+                for param in action.params
+            ],
+            module=module,
+            package=module.rsplit(".", 2)[-2] if module.count(".") >= 2 else "",
+        )
+
+
+def source_mtimes(source_dirs: List[Path]) -> Dict[str, int]:
+    """
+    Modification times of all Python files in the given directories (not recursive).
+    """
+    mtimes: Dict[str, int] = {}
+    for source_dir in source_dirs:
+        try:
+            with os.scandir(source_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".py") and entry.is_file():
+                        mtimes[entry.path] = entry.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+    return mtimes
+
+
+@dataclass
+class ActionManifest:
+    actions: Dict[str, ActionInfo] = field(default_factory=dict)
+    sources: Dict[str, int] = field(default_factory=dict)
+
+    def is_current(self, source_dirs: List[Path]) -> bool:
+        return bool(self.actions) and self.sources == source_mtimes(source_dirs)
+
+    @classmethod
+    def from_actions(cls, actions: Dict[str, Action], source_dirs: List[Path]) -> "ActionManifest":
+        # Take mtimes first, so a file edited while importing makes it stale.
+        sources = source_mtimes(source_dirs)
+        return cls(
+            actions={name: ActionInfo.from_action(action) for name, action in actions.items()},
+            sources=sources,
+        )
+
+    @classmethod
+    def read(cls, path: Path) -> Optional["ActionManifest"]:
+        """
+        Read the manifest, or return None if it's missing, unreadable, or in an old format.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                return None
+            return cls(
+                actions={
+                    name: ActionInfo(**{**info, "params": [ParamInfo(**p) for p in info["params"]]})
+                    for name, info in data["actions"].items()
+                },
+                sources=data["sources"],
+            )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Ignoring invalid action manifest: %s: %s", fmt_loc(path), e)
+            return None
+
+    def write(self, path: Path) -> None:
+        data = {
+            "version": MANIFEST_VERSION,
+            "actions": {name: asdict(info) for name, info in self.actions.items()},
+            "sources": self.sources,
+        }
+        with atomic_output_file(path, make_parents=True) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=1)
+        log.info("Wrote action manifest (%s actions): %s", len(self.actions), fmt_loc(path))
+
+
+## Tests
+
+
+def test_action_manifest():
+    import shutil
+    import time
+
+    from pydantic.dataclasses import dataclass as pydantic_dataclass
+
+    from kmd.model.actions_model import ActionInput, ActionResult
+    from kmd.model.preconditions_model import Precondition
+
+    @pydantic_dataclass
+    class MyAction(Action):
+        verbose: bool = False
+
+        def run(self, items: ActionInput) -> ActionResult:
+            return ActionResult([])
+
+    source_dir = Path("tmp/test_action_manifest/actions")
+    shutil.rmtree(source_dir.parent, ignore_errors=True)
+    source_dir.mkdir(parents=True)
+    (source_dir / "my_action.py").write_text("# An action.")
+    manifest_path = source_dir.parent / "manifest.json"
+
+    action = MyAction(
+        name="my_action",
+        description="Does things.",
+        precondition=Precondition(lambda item: True, "is_thing"),
+        params=(Param("verbose", "Be verbose.", type=bool),),
+    )
+    manifest = ActionManifest.from_actions({"my_action": action}, [source_dir])
+    manifest.write(manifest_path)
+
+    read_manifest = ActionManifest.read(manifest_path)
+    assert read_manifest == manifest
+    assert read_manifest.is_current([source_dir])
+
+    info = read_manifest.actions["my_action"]
+    assert info.precondition == "`is_thing`"
+    assert [p.name for p in info.param_list] == ["verbose"]
+    assert info.param_list[0].shell_prefix == "--verbose"
+
+    # Any change to action sources makes it stale.
+    time.sleep(0.01)
+    (source_dir / "my_action.py").write_text("# A changed action.")
+    assert not read_manifest.is_current([source_dir])
+    (source_dir / "other_action.py").write_text("# Another action.")
+    assert not ActionManifest.from_actions({}, [source_dir]).is_current([source_dir])
@@ -50,9 +50,14 @@ def kmd_action(cls: Type[Action]) -> Type[Action]:
     return _register_action(pydantic_cls)
 
 
-def instantiate_actions() -> Dict[str, Action]:
+def instantiate_actions(module: Optional[str] = None) -> Dict[str, Action]:
+    """
+    Instantiate all registered actions, or only those defined in the given module.
+    """
     actions_map: Dict[str, Action] = {}
     for cls in _actions:
+        if module and cls.__module__ != module:
+            continue
         action: Action = cls()  # type: ignore
         if action.name in actions_map:
             log.error("Duplicate action name (defined twice by accident?): %s", action.name)
@@ -0,0 +1,199 @@
+"""
+Background jobs, so long-running actions can run while the shell is used for other
+things.
+
+Each job runs on its own thread, in the workspace it was started in. Its output and
+log messages are recorded instead of printed, and can be shown at any time, along
+with its progress (from its task stack). Jobs can be cancelled, which takes effect at
+the job's next step (next item, part, or LLM call). When a job finishes, a
+notification is queued for the shell to show.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Literal, Optional
+
+from rich._null_file import NULL_FILE
+from rich.console import Console
+
+from kmd.config.logger import get_logger, new_console, record_console
+from kmd.errors import Cancelled, InvalidInput
+from kmd.model.actions_model import ActionResult
+from kmd.model.paths_model import StorePath
+from kmd.util.task_stack import cancellable, task_stack, TaskStack
+from kmd.workspaces.workspaces import current_workspace, pinned_workspace
+
+log = get_logger(__name__)
+
+
+JobStatus = Literal["running", "done", "failed", "cancelled"]
+
+
+@dataclass
+class Job:
+    id: int
+    command: str
+    start_time: float
+    status: JobStatus = "running"
+    end_time: Optional[float] = None
+    error: Optional[str] = None
+    outputs: List[StorePath] = field(default_factory=list)
+    console: Console = field(default_factory=lambda: new_console(file=NULL_FILE, record=True))
+    """Records the job's output and log messages."""
+    tasks: Optional[TaskStack] = None
+    """The job thread's task stack, for progress."""
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def name(self) -> str:
+        return f"%{self.id}"
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end_time or time.time()) - self.start_time
+
+    def progress_str(self) -> str:
+        if self.status != "running" or not self.tasks:
+            return ""
+        return self.tasks.full_str()
+
+    def output_text(self) -> str:
+        return self.console.export_text(clear=False)
+
+    def __str__(self) -> str:
+        status = "cancelling" if self.status == "running" and self.cancel_event.is_set() else None
+        return f"{self.name} {status or self.status} ({self.elapsed:.0f}s): {self.command}"
+
+
+_jobs: Dict[int, Job] = {}
+_notifications: List[str] = []
+_lock = threading.Lock()
+
+
+def start_job(command: str, run: Callable[[], ActionResult]) -> Job:
+    """
+    Start a background job running `run()` in the current workspace.
+    """
+    ws = current_workspace()
+    with _lock:
+        job = Job(id=max(_jobs, default=0) + 1, command=command, start_time=time.time())
+        _jobs[job.id] = job
+
+    def run_job() -> None:
+        job.tasks = task_stack()
+        status: JobStatus = "done"
+        with (
+            pinned_workspace(ws),
+            record_console(job.console, include_logs=True),
+            cancellable(job.cancel_event),
+        ):
+            try:
+                result = run()
+                job.outputs = [
+                    StorePath(item.store_path) for item in result.items if item.store_path
+                ]
+            except Cancelled:
+                status = "cancelled"
+            except Exception as e:
+                status = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+                log.info("Background job %s failed: %s", job.name, e, exc_info=True)
+
+        with _lock:
+            job.status, job.end_time = status, time.time()
+            outputs = f", output: {', '.join(map(str, job.outputs))}" if job.outputs else ""
+            error = f": {job.error}" if job.error else ""
+            _notifications.append(f"Job {job}{outputs}{error}")
+
+    threading.Thread(target=run_job, name=f"job-{job.id}", daemon=True).start()
+    return job
+
+
+def list_jobs() -> List[Job]:
+    with _lock:
+        return list(_jobs.values())
+
+
+def get_job(job_id: str | int) -> Job:
+    """
+    Look up a job by number, as `3` or `%3`.
+    """
+    try:
+        id = int(str(job_id).lstrip("%"))
+    except ValueError:
+        raise InvalidInput(f"Not a job number: {job_id!r}")
+    with _lock:
+        if id not in _jobs:
+            raise InvalidInput(f"No job {job_id}")
+        return _jobs[id]
+
+
+def cancel_job(job_id: str | int) -> Job:
+    job = get_job(job_id)
+    if job.status == "running":
+        job.cancel_event.set()
+    return job
+
+
+def clear_finished_jobs() -> List[Job]:
+    with _lock:
+        finished = [job for job in _jobs.values() if job.status != "running"]
+        for job in finished:
+            del _jobs[job.id]
+    return finished
+
+
+def pop_notifications() -> List[str]:
+    """
+    Notifications of jobs finished since last checked.
+    """
+    with _lock:
+        notifications = _notifications.copy()
+        _notifications.clear()
+    return notifications
+
+
+## Tests
+
+
+def test_background_jobs():
+    import shutil
+    from pathlib import Path
+
+    from kmd.file_storage.file_store import FileStore
+    from kmd.util.task_stack import check_cancelled
+
+    ws_dir = Path("tmp/test_background_jobs.kb")
+    shutil.rmtree(ws_dir, ignore_errors=True)
+    ws = FileStore(ws_dir, is_sandbox=False)
+
+    started = threading.Event()
+
+    def slow() -> ActionResult:
+        with task_stack().context("slow", total_parts=100) as ts:
+            started.set()
+            for _ in range(100):
+                time.sleep(0.01)
+                ts.next()
+        return ActionResult([])
+
+    def fails() -> ActionResult:
+        check_cancelled()
+        raise InvalidInput("bad input")
+
+    with pinned_workspace(ws):
+        job1 = start_job("slow", slow)
+        job2 = start_job("fails", fails)
+    assert started.wait(5)
+    assert "slow" in job1.progress_str()
+    assert cancel_job(job1.name) is job1
+
+    for _ in range(500):
+        if all(job.status != "running" for job in [job1, job2]):
+            break
+        time.sleep(0.01)
+    assert job1.status == "cancelled"
+    assert job2.status == "failed" and job2.error == "InvalidInput: bad input"
+    assert len(pop_notifications()) == 2 and not pop_notifications()
+    assert {job.id for job in clear_finished_jobs()} >= {job1.id, job2.id}
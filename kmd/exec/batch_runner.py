@@ -0,0 +1,326 @@
+"""
+Run an action (including a sequence action) on each input in a manifest, headless,
+with a checkpoint so an interrupted batch can be resumed where it stopped.
+
+A manifest is a text file with one input (a path or URL) per line. Blank lines and
+lines starting with `#` are ignored.
+
+The checkpoint is a JSON lines file with one line per finished input, appended (and
+synced) as each finishes, so it survives crashes. Inputs already done are skipped on
+resume. When the batch stops, for whatever reason, a JSON summary of timings, LLM
+usage, and failures is written.
+"""
+
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Literal, Optional
+
+from kmd.config.logger import get_logger
+from kmd.config.text_styles import EMOJI_WARN
+from kmd.errors import InvalidInput, nonfatal_exceptions
+from kmd.exec.run_records import record_run
+from kmd.lang_tools.inflection import plural
+from kmd.model.args_model import fmt_loc
+from kmd.util.format_utils import fmt_count_items
+from kmd.util.strif import atomic_output_file
+from kmd.util.task_stack import cancellable
+from kmd.util.thread_utils import submit_in_context
+
+log = get_logger(__name__)
+
+
+ItemStatus = Literal["done", "failed"]
+
+BatchStatus = Literal["running", "done", "interrupted", "error"]
+
+
+@dataclass
+class ItemResult:
+    input: str
+    status: ItemStatus
+    outputs: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+    llm_calls: int = 0
+    cost: float = 0.0
+    error: Optional[str] = None
+    finished_at: float = 0.0
+
+
+@dataclass
+class BatchSummary:
+    action: str
+    manifest: str
+    checkpoint: str
+    status: BatchStatus = "running"
+    start_time: float = 0.0
+    elapsed: float = 0.0
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+    resumed: int = 0
+    """Inputs already done in an earlier run, so skipped."""
+    remaining: int = 0
+    timing: Dict[str, float] = field(default_factory=dict)
+    """Time per input done in this run: mean, median, and max, in seconds."""
+    usage: Dict[str, Any] = field(default_factory=dict)
+    failures: List[ItemResult] = field(default_factory=list)
+    items: List[ItemResult] = field(default_factory=list)
+
+    def summary_str(self) -> str:
+        return (
+            f"{self.done} of {self.total} {plural('input', self.total)} done "
+            f"({self.resumed} from earlier runs), {self.failed} failed, "
+            f"{self.remaining} remaining, in {self.elapsed:.1f}s"
+        )
+
+
+def read_manifest(path: Path) -> List[str]:
+    """
+    Read the inputs listed in a manifest file, without duplicates.
+    """
+    inputs: Dict[str, None] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                inputs[line] = None
+    return list(inputs)
+
+
+class Checkpoint:
+    """
+    Results of finished inputs, persisted as a JSON line per result. The last result
+    for an input wins.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.results: Dict[str, ItemResult] = {}
+        self._lock = threading.Lock()
+
+        try:
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            text = ""
+        # After a crash mid-write, start the next line on a new line.
+        self._needs_newline = bool(text) and not text.endswith("\n")
+        for line in text.splitlines():
+            try:
+                result = ItemResult(**json.loads(line))
+                self.results[result.input] = result
+            except (ValueError, TypeError) as e:
+                # Most likely a partial line written at a crash.
+                log.warning("Skipping invalid checkpoint line in %s: %s", fmt_loc(path), e)
+
+    def is_done(self, input: str) -> bool:
+        result = self.results.get(input)
+        return bool(result and result.status == "done")
+
+    def add(self, result: ItemResult) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self._needs_newline:
+                    f.write("\n")
+                    self._needs_newline = False
+                f.write(json.dumps(asdict(result)) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.results[result.input] = result
+
+
+def _run_item(action_name: str, input: str, rerun: bool) -> ItemResult:
+    from kmd.exec.action_exec import run_action, save_run_record
+
+    start = time.time()
+    with record_run(action_name) as record:
+        try:
+            result = run_action(action_name, input, internal_call=True, rerun=rerun)
+            outputs = [str(item.store_path) for item in result.items if item.store_path]
+            status: ItemStatus = "done"
+            error = None
+        except nonfatal_exceptions() as e:
+            log.error("%s Failed on %s: %s", EMOJI_WARN, fmt_loc(input), e)
+            record.status = "error"
+            outputs, status, error = [], "failed", f"{type(e).__name__}: {e}"
+    save_run_record(record)
+
+    totals = record.totals()
+    return ItemResult(
+        input=input,
+        status=status,
+        outputs=outputs,
+        elapsed=time.time() - start,
+        llm_calls=totals.calls,
+        cost=totals.cost,
+        error=error,
+        finished_at=time.time(),
+    )
+
+
+def run_batch(
+    action_name: str,
+    manifest_path: Path,
+    checkpoint_path: Path,
+    summary_path: Path,
+    workers: int = 1,
+    retry_failed: bool = True,
+    rerun: bool = False,
+) -> BatchSummary:
+    """
+    Run the action on each input in the manifest not already done according to the
+    checkpoint, with up to `workers` inputs at once. Failed inputs are run again unless
+    `retry_failed` is False. With `rerun`, inputs are run even if the action's outputs
+    are already in the workspace. Writes the summary however the batch ends.
+    """
+    if workers < 1:
+        raise InvalidInput(f"Workers must be at least 1: {workers}")
+    inputs = read_manifest(manifest_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    summary = BatchSummary(
+        action=action_name,
+        manifest=str(manifest_path),
+        checkpoint=str(checkpoint_path),
+        start_time=time.time(),
+        total=len(inputs),
+    )
+
+    resumed = [input for input in inputs if checkpoint.is_done(input)]
+    todo = [
+        input
+        for input in inputs
+        if not checkpoint.is_done(input) and (retry_failed or input not in checkpoint.results)
+    ]
+    summary.resumed = len(resumed)
+    log.message(
+        "Batch `%s` on %s: %s to run, %s already done (checkpoint: %s)",
+        action_name,
+        fmt_loc(manifest_path),
+        len(todo),
+        len(resumed),
+        fmt_loc(checkpoint_path),
+    )
+
+    run_results: List[ItemResult] = []
+    executor = ThreadPoolExecutor(max_workers=workers)
+    # Set on interrupt or error, so inputs in progress stop at their next step.
+    cancel_event = threading.Event()
+    running: Dict[Future, str] = {}
+    try:
+        pending = list(reversed(todo))
+        while pending or running:
+            while pending and len(running) < workers:
+                input = pending.pop()
+                with cancellable(cancel_event):
+                    future = submit_in_context(executor, _run_item, action_name, input, rerun)
+                running[future] = input
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                result = future.result()
+                checkpoint.add(result)
+                run_results.append(result)
+                log.message(
+                    "Batch progress: %s of %s (%s: %s, %.1fs)",
+                    len(run_results),
+                    len(todo),
+                    result.status,
+                    fmt_loc(result.input),
+                    result.elapsed,
+                )
+        summary.status = "done"
+    except KeyboardInterrupt:
+        summary.status = "interrupted"
+        raise
+    except BaseException:
+        summary.status = "error"
+        raise
+    finally:
+        # Stop inputs in progress at their next step. Those stopped aren't checkpointed,
+        # so will be rerun. Any that finish first are checkpointed as usual.
+        if running:
+            log.warning("Stopping %s in progress", fmt_count_items(len(running), "input"))
+            cancel_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in running:
+            if not future.cancelled() and not future.exception():
+                result = future.result()
+                checkpoint.add(result)
+                run_results.append(result)
+        _finish_summary(summary, inputs, checkpoint, run_results)
+        with atomic_output_file(summary_path, make_parents=True) as tmp_path:
+            tmp_path.write_text(json.dumps(asdict(summary), indent=2), encoding="utf-8")
+        log.message(
+            "Batch %s: %s\nSummary: %s",
+            summary.status,
+            summary.summary_str(),
+            fmt_loc(summary_path),
+        )
+
+    return summary
+
+
+def _finish_summary(
+    summary: BatchSummary,
+    inputs: List[str],
+    checkpoint: Checkpoint,
+    run_results: List[ItemResult],
+) -> None:
+    summary.elapsed = time.time() - summary.start_time
+    summary.items = [checkpoint.results[input] for input in inputs if input in checkpoint.results]
+    summary.done = sum(1 for item in summary.items if item.status == "done")
+    summary.failures = [item for item in summary.items if item.status == "failed"]
+    summary.failed = len(summary.failures)
+    summary.remaining = summary.total - summary.done
+
+    times = [result.elapsed for result in run_results if result.status == "done"]
+    if times:
+        summary.timing = {
+            "mean": statistics.mean(times),
+            "median": statistics.median(times),
+            "max": max(times),
+        }
+    summary.usage = {
+        "llm_calls": sum(result.llm_calls for result in run_results),
+        "cost": sum(result.cost for result in run_results),
+    }
+
+
+## Tests
+
+
+def test_batch_checkpoint():
+    import shutil
+
+    tmp_dir = Path("tmp/test_batch_checkpoint")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    manifest = tmp_dir / "manifest.txt"
+    manifest.write_text("# Inputs\ndocs/a.md\n\ndocs/b.md\ndocs/a.md\ndocs/c.md\n")
+    assert read_manifest(manifest) == ["docs/a.md", "docs/b.md", "docs/c.md"]
+
+    checkpoint = Checkpoint(tmp_dir / "checkpoint.jsonl")
+    checkpoint.add(ItemResult("docs/a.md", "done", outputs=["docs/a_out.md"], elapsed=1.0))
+    checkpoint.add(ItemResult("docs/b.md", "failed", error="InvalidInput: bad"))
+    # A partial line, as if we crashed while writing.
+    with open(checkpoint.path, "a") as f:
+        f.write('{"input": "docs/c.md", "sta')
+
+    resumed = Checkpoint(checkpoint.path)
+    assert resumed.is_done("docs/a.md")
+    assert not resumed.is_done("docs/b.md") and not resumed.is_done("docs/c.md")
+    assert resumed.results["docs/a.md"].outputs == ["docs/a_out.md"]
+    resumed.add(ItemResult("docs/c.md", "done"))
+    assert Checkpoint(checkpoint.path).is_done("docs/c.md")
+
+    summary = BatchSummary("action", str(manifest), str(checkpoint.path), total=3)
+    _finish_summary(summary, read_manifest(manifest), resumed, [])
+    assert (summary.done, summary.failed, summary.remaining) == (2, 1, 1)
+    assert summary.failures[0].input == "docs/b.md"
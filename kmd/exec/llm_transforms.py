@@ -39,6 +39,7 @@ def windowed_llm_transform(
                     input=input_doc.reassemble(),
                     template=template,
                     check_no_results=check_no_results,
+                    stream=True,
                 ).content
             )
         )
@@ -95,6 +96,7 @@ def llm_transform_str(context: ExecContext, input_str: str, check_no_results: bo
             template=action.template,
             input=input_str,
             check_no_results=check_no_results,
+            stream=True,
         ).content
 
     return result_str
@@ -0,0 +1,347 @@
+"""
+Records of action runs: how long each took (in total and in each phase of running it),
+and the tokens, cost, and latency of every LLM call made while running it, so slowdowns
+or cost increases can be explained.
+
+Each top-level action run is appended as a JSON line to a file in the workspace, so
+totals can be queried afterwards, per action, model, or item.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Generator, Iterable, List, Literal, Optional, Tuple
+
+from kmd.config.logger import get_logger
+from kmd.lang_tools.inflection import plural
+from kmd.model.args_model import fmt_loc
+from kmd.util.format_utils import fmt_lines
+from kmd.util.tracing import add_span
+
+log = get_logger(__name__)
+
+
+RunStatus = Literal["running", "done", "skipped", "error"]
+
+GroupBy = Literal["action", "model", "item"]
+
+PHASES = ("inputs", "hash", "precondition", "rerun_check", "run", "save", "select")
+"""Phases of running an action, in order."""
+
+
+@dataclass
+class LLMCallRecord:
+    action: str
+    model: str
+    item: Optional[str]
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+    latency: float
+    error: Optional[str] = None
+
+
+@dataclass
+class UsageTotals:
+    calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    latency: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, call: LLMCallRecord) -> None:
+        self.calls += 1
+        self.errors += 1 if call.error else 0
+        self.prompt_tokens += call.prompt_tokens
+        self.completion_tokens += call.completion_tokens
+        self.cost += call.cost
+        self.latency += call.latency
+
+    def __str__(self) -> str:
+        errors = f" ({self.errors} failed)" if self.errors else ""
+        return (
+            f"{self.calls} LLM {plural('call', self.calls)}{errors}, "
+            f"{self.prompt_tokens} + {self.completion_tokens} = {self.total_tokens} tokens, "
+            f"${self.cost:.4f}, {self.latency:.1f}s LLM time"
+        )
+
+
+def usage_totals(
+    calls: Iterable[LLMCallRecord], key: Callable[[LLMCallRecord], Optional[str]]
+) -> Dict[str, UsageTotals]:
+    totals: Dict[str, UsageTotals] = {}
+    for call in calls:
+        totals.setdefault(key(call) or "(none)", UsageTotals()).add(call)
+    return totals
+
+
+@dataclass
+class RunRecord:
+    """
+    A run of an action, with all LLM calls made during it (including by any actions it
+    ran internally, as noted in each call's `action`).
+    """
+
+    action: str
+    start_time: float
+    elapsed: float = 0.0
+    status: RunStatus = "running"
+    items: int = 0
+    llm_calls: List[LLMCallRecord] = field(default_factory=list)
+    phases: Dict[str, float] = field(default_factory=dict)
+    """Time spent in each phase, in seconds."""
+
+    def totals(self) -> UsageTotals:
+        totals = UsageTotals()
+        for call in self.llm_calls:
+            totals.add(call)
+        return totals
+
+    def totals_by(self, group_by: GroupBy) -> Dict[str, UsageTotals]:
+        return usage_totals(self.llm_calls, lambda call: getattr(call, group_by))
+
+    def phases_str(self) -> str:
+        return ", ".join(f"{phase} {elapsed:.2f}s" for phase, elapsed in self.phases.items())
+
+    def summary_str(self) -> str:
+        lines = [f"`{self.action}` ({self.status}, {self.elapsed:.1f}s): {self.totals()}"]
+        models = self.totals_by("model")
+        if len(models) > 1:
+            lines.extend(f"{model}: {totals}" for model, totals in models.items())
+        if self.phases:
+            lines.append(f"phases: {self.phases_str()}")
+        return fmt_lines(lines)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, line: str) -> "RunRecord":
+        data = json.loads(line)
+        data["llm_calls"] = [LLMCallRecord(**call) for call in data["llm_calls"]]
+        return cls(**data)
+
+
+_active_runs: ContextVar[Tuple[RunRecord, ...]] = ContextVar("active_runs", default=())
+_current_item: ContextVar[Optional[str]] = ContextVar("current_item", default=None)
+_lock = threading.Lock()
+
+
+def current_run() -> Optional[RunRecord]:
+    """
+    The innermost action run in progress, if any.
+    """
+    runs = _active_runs.get()
+    return runs[-1] if runs else None
+
+
+@contextmanager
+def record_run(action_name: str) -> Generator[RunRecord, None, None]:
+    """
+    Record a run of an action. LLM calls made within it are added to it and to any
+    enclosing runs.
+    """
+    record = RunRecord(action=action_name, start_time=time.time())
+    token = _active_runs.set(_active_runs.get() + (record,))
+    try:
+        yield record
+        if record.status == "running":
+            record.status = "done"
+    except BaseException:
+        record.status = "error"
+        raise
+    finally:
+        record.elapsed = time.time() - record.start_time
+        _active_runs.reset(token)
+
+
+class PhaseTimer:
+    """
+    Times consecutive phases of the current action run: `end(phase)` adds the time since
+    the last phase ended (or since the timer was created) to that phase, and to the
+    trace, if tracing. Cheap enough to use on every run.
+    """
+
+    def __init__(self):
+        self.run = current_run()
+        self.last = time.perf_counter()
+
+    def end(self, phase: str) -> None:
+        now = time.perf_counter()
+        if self.run:
+            with _lock:
+                self.run.phases[phase] = self.run.phases.get(phase, 0.0) + now - self.last
+        add_span(phase, "phase", self.last)
+        self.last = now
+
+
+@contextmanager
+def record_item(item_name: Optional[str]) -> Generator[None, None, None]:
+    """
+    Attribute LLM calls made within this context to the given item.
+    """
+    token = _current_item.set(item_name)
+    try:
+        yield
+    finally:
+        _current_item.reset(token)
+
+
+def record_llm_call(
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cost: float,
+    latency: float,
+    error: Optional[str] = None,
+) -> None:
+    runs = _active_runs.get()
+    if not runs:
+        return
+    call = LLMCallRecord(
+        action=runs[-1].action,
+        model=model,
+        item=_current_item.get(),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost=cost,
+        latency=latency,
+        error=error,
+    )
+    with _lock:
+        for run in runs:
+            run.llm_calls.append(call)
+
+
+def append_run_record(path: Path, record: RunRecord) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _lock, open(path, "a", encoding="utf-8") as f:
+        f.write(record.to_json() + "\n")
+
+
+def read_run_records(path: Path, max_records: int = 0) -> List[RunRecord]:
+    """
+    Read the run records (only the last `max_records`, if set), skipping any invalid ones.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+
+    records = []
+    for line in lines[-max_records:] if max_records else lines:
+        try:
+            records.append(RunRecord.from_json(line))
+        except (ValueError, TypeError, KeyError) as e:
+            log.warning("Skipping invalid run record in %s: %s", fmt_loc(path), e)
+    return records
+
+
+def aggregate_runs(records: Iterable[RunRecord], group_by: GroupBy) -> Dict[str, UsageTotals]:
+    return usage_totals(
+        (call for record in records for call in record.llm_calls),
+        lambda call: getattr(call, group_by),
+    )
+
+
+@dataclass
+class PhaseTotals:
+    runs: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.runs += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.runs if self.runs else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.mean:.2f}s mean, {self.max:.2f}s max, {self.total:.1f}s total"
+
+
+def aggregate_phases(records: Iterable[RunRecord]) -> Dict[str, Dict[str, PhaseTotals]]:
+    """
+    Time per phase across runs, for each action, with phases in order.
+    """
+    totals: Dict[str, Dict[str, PhaseTotals]] = {}
+    for record in records:
+        by_phase = totals.setdefault(record.action, {})
+        for phase, elapsed in record.phases.items():
+            by_phase.setdefault(phase, PhaseTotals()).add(elapsed)
+    order = {phase: i for i, phase in enumerate(PHASES)}
+    return {
+        action: dict(sorted(by_phase.items(), key=lambda kv: order.get(kv[0], len(order))))
+        for action, by_phase in totals.items()
+    }
+
+
+## Tests
+
+
+def test_run_records():
+    import shutil
+
+    def call(model: str, tokens: int) -> None:
+        record_llm_call(model, tokens, tokens // 2, cost=0.01, latency=0.5)
+
+    with record_run("outer") as outer:
+        with record_item("doc1.md"):
+            call("model_a", 100)
+        with record_run("inner") as inner:
+            call("model_b", 10)
+        call("model_a", 100)
+
+    assert outer.status == inner.status == "done"
+    assert len(inner.llm_calls) == 1 and inner.llm_calls[0].action == "inner"
+    totals = outer.totals()
+    assert totals.calls == 3 and totals.prompt_tokens == 210 and totals.completion_tokens == 105
+    assert outer.totals_by("model")["model_a"].calls == 2
+    assert outer.totals_by("item")["doc1.md"].prompt_tokens == 100
+    assert set(outer.totals_by("action")) == {"outer", "inner"}
+    assert current_run() is None
+
+    # Calls outside any run aren't recorded.
+    call("model_a", 1)
+
+    path = Path("tmp/test_run_records/runs.jsonl")
+    shutil.rmtree(path.parent, ignore_errors=True)
+    append_run_record(path, outer)
+    append_run_record(path, outer)
+    records = read_run_records(path)
+    assert records == [outer, outer]
+    assert read_run_records(path, max_records=1) == [outer]
+    assert aggregate_runs(records, "action")["outer"].calls == 4
+
+
+def test_phase_timer():
+    with record_run("action") as record:
+        timer = PhaseTimer()
+        timer.end("run")
+        timer.end("inputs")
+        time.sleep(0.01)
+        timer.end("run")
+    assert list(record.phases) == ["run", "inputs"]
+    assert 0.01 <= record.phases["run"] < record.elapsed
+
+    # Without a run, phases aren't recorded.
+    PhaseTimer().end("run")
+
+    other = RunRecord("action", 0.0, phases={"inputs": 0.5, "run": 2.0})
+    phases = aggregate_phases([RunRecord.from_json(record.to_json()), other])["action"]
+    assert list(phases) == ["inputs", "run"]
+    assert phases["run"].runs == 2 and phases["run"].max == 2.0
+    assert phases["inputs"].mean == (0.5 + record.phases["inputs"]) / 2
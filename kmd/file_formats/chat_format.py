@@ -86,12 +86,15 @@ content: |
 """
 
 import json
+import os
+import struct
+import threading
 from dataclasses import field
 from enum import Enum
 from io import StringIO
 from pathlib import Path
 from textwrap import dedent
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Tuple, Union
 
 from frontmatter_format import from_yaml_string, new_yaml, to_yaml_string
 from pydantic.dataclasses import dataclass
@@ -100,6 +103,7 @@ from kmd.model.items_model import Item, ItemType
 from kmd.util.format_utils import fmt_size_human
 from kmd.util.obj_utils import abbreviate_obj
 from kmd.util.sort_utils import custom_key_sort
+from kmd.util.strif import atomic_output_file
 
 
 class ChatRole(str, Enum):
@@ -245,29 +249,151 @@ class ChatHistory:
         return self.as_str_brief()
 
 
+CHAT_INDEX_SUFFIX = ".idx"
+"""
+Suffix for the index kept alongside a chat file that messages are appended to. The
+index has the byte offset where each message starts, so reading the last few messages
+doesn't require reading or parsing the whole file.
+"""
+
+_uint64 = struct.Struct("<Q")
+
+_index_lock = threading.RLock()
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_suffix(CHAT_INDEX_SUFFIX)
+
+
+def _scan_offsets(path: Path, start: int) -> List[int]:
+    """
+    Offsets of messages (each starting with a `---` line) after the given position,
+    which should be the start of a line.
+    """
+    offsets: List[int] = []
+    pos = start
+    with path.open("rb") as file:
+        file.seek(start)
+        for line in file:
+            if line.rstrip(b"\r\n") == b"---":
+                offsets.append(pos)
+            elif pos == 0 and line.strip():
+                offsets.append(0)  # Initial `---` is optional.
+            pos += len(line)
+    return offsets
+
+
+def _read_index(path: Path) -> Tuple[int, int]:
+    """
+    Return the size of the chat file covered by its index and the number of offsets in
+    the index, or (-1, 0) if the index is missing or no longer matches the file.
+    """
+    try:
+        with _index_path(path).open("rb") as index:
+            header = index.read(_uint64.size)
+            index_size = index.seek(0, os.SEEK_END)
+            if len(header) < _uint64.size or index_size % _uint64.size:
+                return -1, 0
+            count = index_size // _uint64.size - 1
+            if count:
+                index.seek(-_uint64.size, os.SEEK_END)
+                (last_offset,) = _uint64.unpack(index.read(_uint64.size))
+    except FileNotFoundError:
+        return -1, 0
+
+    (covered,) = _uint64.unpack(header)
+    if covered > path.stat().st_size:
+        return -1, 0  # File was truncated or replaced.
+    if count:
+        # Cheap check the file wasn't otherwise edited.
+        with path.open("rb") as file:
+            file.seek(last_offset)
+            if last_offset >= covered or (last_offset and file.read(3) != b"---"):
+                return -1, 0
+    return covered, count
+
+
+def _write_index(path: Path, covered: int, offsets: List[int], rebuild: bool) -> None:
+    data = b"".join(_uint64.pack(offset) for offset in offsets)
+    if rebuild:
+        with atomic_output_file(_index_path(path)) as tmp_path:
+            tmp_path.write_bytes(_uint64.pack(covered) + data)
+    else:
+        with _index_path(path).open("r+b") as index:
+            index.seek(0, os.SEEK_END)
+            index.write(data)
+            index.seek(0)
+            index.write(_uint64.pack(covered))
+
+
+def _sync_index(path: Path) -> int:
+    """
+    Update the index for anything appended to the file since it was last indexed,
+    reading only the new part of the file (or all of it if the index is missing or
+    stale). Returns the number of messages.
+    """
+    size = path.stat().st_size
+    covered, count = _read_index(path)
+    if covered < 0:
+        offsets = _scan_offsets(path, 0)
+        _write_index(path, size, offsets, rebuild=True)
+        return len(offsets)
+    if covered < size:
+        offsets = _scan_offsets(path, covered)
+        _write_index(path, size, offsets, rebuild=False)
+        count += len(offsets)
+    return count
+
+
+def _read_offsets(path: Path, count: int, n: int) -> List[int]:
+    n = min(n, count)
+    with _index_path(path).open("rb") as index:
+        index.seek((count - n + 1) * _uint64.size)
+        data = index.read(n * _uint64.size)
+    return [offset for (offset,) in _uint64.iter_unpack(data)]
+
+
 def append_chat_message(path: Path, message: ChatMessage, make_parents: bool = True) -> None:
     """
-    Append a chat message to a YAML file.
+    Append a chat message to a YAML file, as a single write, and update its index.
     """
     if make_parents:
         path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as file:
-        file.write("---\n")
-        file.write(message.to_yaml())
+    data = ("---\n" + message.to_yaml()).encode("utf-8")
+    with _index_lock:
+        if path.exists():
+            _sync_index(path)
+        else:
+            _write_index(path, 0, [], rebuild=True)
+        with path.open("ab") as file:
+            offset = file.tell()
+            file.write(data)
+        _write_index(path, offset + len(data), [offset], rebuild=False)
 
 
 def tail_chat_history(path: Path, max_records: int) -> ChatHistory:
     """
-    Show last few results from a chat history file.
+    Read the last few messages from a chat history file. Uses the index, so only these
+    messages are read and parsed. A missing or stale index is rebuilt.
     """
-    with path.open("r", encoding="utf-8") as file:
-        contents = file.read()
-
-    chat_history = ChatHistory.from_yaml(contents)
-    if max_records > 0:
-        chat_history.messages = chat_history.messages[-max_records:]
-
-    return chat_history
+    if max_records <= 0:
+        return ChatHistory.from_yaml(path.read_text(encoding="utf-8"))
+
+    # Read a few more in case some are empty (like after a trailing `---`).
+    n = max_records + 1
+    while True:
+        with _index_lock:
+            count = _sync_index(path)
+            offsets = _read_offsets(path, count, n)
+        if not offsets:
+            return ChatHistory()
+        with path.open("rb") as file:
+            file.seek(offsets[0])
+            chat_history = ChatHistory.from_yaml(file.read().decode("utf-8"))
+        if len(chat_history.messages) >= max_records or n >= count:
+            chat_history.messages = chat_history.messages[-max_records:]
+            return chat_history
+        n *= 2
 
 
 ## Tests
@@ -414,3 +540,33 @@ def test_structured_content():
         "parsed_items": 42,
         "details": {"errors": []},  # null field is dropped.
     }
+
+
+def test_tail_chat_history():
+    import shutil
+
+    tmp_dir = Path("tmp/test_tail_chat_history")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    path = tmp_dir / "history.yml"
+
+    def command(i: int) -> ChatMessage:
+        return ChatMessage(ChatRole.command, f"command_{i}")
+
+    for i in range(10):
+        append_chat_message(path, command(i))
+    assert path.read_text().startswith("---\nrole: command\n")
+    assert tail_chat_history(path, 3).messages == [command(i) for i in range(7, 10)]
+    assert tail_chat_history(path, 20).messages == [command(i) for i in range(10)]
+    assert tail_chat_history(path, 0) == ChatHistory.from_yaml(path.read_text())
+
+    # Appends by other means are indexed when next read.
+    with path.open("a") as f:
+        f.write("---\n" + command(10).to_yaml() + "---\n")
+    assert tail_chat_history(path, 2).messages == [command(9), command(10)]
+
+    # Files with no index (or a stale one) are reindexed.
+    path.write_text(ChatHistory([command(i) for i in range(5)]).to_yaml().removeprefix("---\n"))
+    assert tail_chat_history(path, 2).messages == [command(3), command(4)]
+    _index_path(path).unlink()
+    append_chat_message(path, command(5))
+    assert tail_chat_history(path, 7).messages == [command(i) for i in range(6)]
@@ -1,11 +1,11 @@
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
 from frontmatter_format import fmf_has_frontmatter, fmf_read, fmf_write, FmStyle
 
 from kmd.config.logger import get_logger
 from kmd.file_formats.doc_normalization import normalize_formatting
-from kmd.file_storage.file_cache import FileMtimeCache
+from kmd.file_storage.file_cache import FileMtimeCache, WatchFilter
 from kmd.model.args_model import fmt_loc
 from kmd.model.file_formats_model import Format
 from kmd.model.items_model import Item, ITEM_FIELDS
@@ -13,6 +13,8 @@ from kmd.model.operations_model import OPERATION_FIELDS
 from kmd.util.format_utils import fmt_size_human
 from kmd.util.log_calls import tally_calls
 from kmd.util.sort_utils import custom_key_sort
+from kmd.util.strif import file_mtime_hash
+from kmd.util.tracing import trace_span
 
 log = get_logger(__name__)
 
@@ -23,6 +25,27 @@ ITEM_FIELD_SORT = custom_key_sort(OPERATION_FIELDS + ITEM_FIELDS)
 _item_cache = FileMtimeCache[Item](max_size=2000, name="Item")
 
 
+def _normalized_body(item: Item) -> str:
+    body = normalize_formatting(item.body_text(), item.format)
+
+    # Special case for YAML files to avoid a possible duplicate `---` divider in the body.
+    if body and item.format == Format.yaml:
+        stripped = body.lstrip()
+        if stripped.startswith("---\n"):
+            body = stripped[4:]
+
+    return body
+
+
+def normalized_item(item: Item) -> Item:
+    """
+    The item as it would be read back after `write_item()`, with normalized body text
+    and metadata round-tripped through its serialized form. Useful to compare a new item
+    with a saved one without writing and reloading it.
+    """
+    return Item.from_dict(item.metadata(), body=_normalized_body(item))
+
+
 @tally_calls()
 def write_item(item: Item, path: Path):
     """
@@ -38,13 +61,7 @@ def write_item(item: Item, path: Path):
     # Clear cache before writing.
     _item_cache.delete(path)
 
-    body = normalize_formatting(item.body_text(), item.format)
-
-    # Special case for YAML files to avoid a possible duplicate `---` divider in the body.
-    if body and item.format == Format.yaml:
-        stripped = body.lstrip()
-        if stripped.startswith("---\n"):
-            body = stripped[4:]
+    body = _normalized_body(item)
 
     # Decide on the frontmatter style.
     format = Format(item.format)
@@ -92,8 +109,45 @@ def read_item(path: Path, base_dir: Optional[Path]) -> Item:
     return _read_item_uncached(path, base_dir)
 
 
+def uncache_items(paths: Iterable[Path]) -> None:
+    """
+    Drop cached items for files (or directories of files) changed outside of kmd.
+    """
+    for path in paths:
+        _item_cache.delete_tree(path)
+
+
+def watch_item_cache(base_dir: Path, is_watched: Optional[WatchFilter]) -> None:
+    """
+    Trust cached items in `base_dir` that `is_watched` accepts without checking mtimes,
+    since a file watcher will uncache them when they change. Pass None to go back to
+    checking mtimes.
+    """
+    _item_cache.set_watched(base_dir, is_watched)
+
+
+def cache_item(path: Path, item: Item, mtime_hash: str) -> None:
+    """
+    Add an item read elsewhere (e.g. in another process) to the item cache, with the
+    `file_mtime_hash()` of the file taken before it was read.
+    """
+    _item_cache.update(path, item, mtime_hash=mtime_hash)
+
+
 @tally_calls()
 def _read_item_uncached(path: Path, base_dir: Optional[Path]) -> Item:
+    # Get the mtime before reading, so a concurrent change can't be cached as current.
+    mtime_hash = file_mtime_hash(path)
+    with trace_span("read", "io", path=path):
+        item = parse_item(path, base_dir)
+    _item_cache.update(path, item, mtime_hash=mtime_hash)
+    return item
+
+
+def parse_item(path: Path, base_dir: Optional[Path]) -> Item:
+    """
+    Read an item from a file like `read_item()`, but without using the item cache.
+    """
     has_frontmatter = fmf_has_frontmatter(path)
     body = metadata = None
     if has_frontmatter:
@@ -148,7 +202,4 @@ def _read_item_uncached(path: Path, base_dir: Optional[Path]) -> Item:
     # Update modified time.
     item.set_modified(path.stat().st_mtime)
 
-    # Update the cache with the new item
-    _item_cache.update(path, item)
-
     return item
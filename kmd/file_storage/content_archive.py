@@ -0,0 +1,235 @@
+"""
+Content-addressed storage of archived files, so that repeatedly archiving versions
+of the same (often large) file only stores each distinct version once.
+
+Layout within the archive directory:
+
+    blobs/ab/ab12…ef      File contents, named by SHA1 hash of the content.
+    versions/docs/foo.doc.md.yml
+                          Version log for the path `docs/foo.doc.md`, oldest first,
+                          listing hash, size, and timestamps of each archived version.
+
+Any other files in the archive directory are from the older layout, where each archived
+file was simply moved to the same path within the archive directory.
+"""
+
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Generator, List, Set
+
+from frontmatter_format import read_yaml_file, write_yaml_file
+
+from kmd.config.logger import get_logger
+from kmd.errors import FileExists, FileNotFound
+from kmd.model.args_model import fmt_loc
+from kmd.util.strif import copyfile_atomic, hash_file
+
+log = get_logger(__name__)
+
+BLOBS_DIR = "blobs"
+VERSIONS_DIR = "versions"
+VERSIONS_SUFFIX = ".yml"
+
+
+@dataclass(frozen=True)
+class ArchivedVersion:
+    """
+    One archived version of a file.
+    """
+
+    sha1: str
+    size: int
+    mtime: float
+    archived_at: float
+
+
+@dataclass
+class CompactionStats:
+    versions_removed: int = 0
+    blobs_removed: int = 0
+    legacy_files_migrated: int = 0
+    bytes_reclaimed: int = 0
+
+
+class ContentArchive:
+    """
+    An archive of previous versions of files, stored by content hash with a small
+    version log per path. Not thread safe; callers should synchronize.
+    """
+
+    def __init__(self, archive_dir: Path):
+        self.archive_dir = archive_dir
+        self.blobs_dir = archive_dir / BLOBS_DIR
+        self.versions_dir = archive_dir / VERSIONS_DIR
+
+    def _blob_path(self, sha1: str) -> Path:
+        return self.blobs_dir / sha1[:2] / sha1
+
+    def _log_path(self, key: str) -> Path:
+        return self.versions_dir / f"{key}{VERSIONS_SUFFIX}"
+
+    def versions(self, key: str) -> List[ArchivedVersion]:
+        """
+        All archived versions of the given path, oldest first.
+        """
+        log_path = self._log_path(key)
+        if not log_path.exists():
+            return []
+        return [ArchivedVersion(**entry) for entry in read_yaml_file(str(log_path)) or []]
+
+    def _save_versions(self, key: str, versions: List[ArchivedVersion]) -> None:
+        log_path = self._log_path(key)
+        if versions:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            write_yaml_file([asdict(v) for v in versions], str(log_path))
+        elif log_path.exists():
+            os.unlink(log_path)
+
+    def add(self, path: Path, key: str) -> ArchivedVersion:
+        """
+        Move the file at `path` into the archive as the newest version of `key`.
+        If the same content is already archived (for any path), no new blob is stored.
+        """
+        stat = path.stat()
+        sha1 = hash_file(path, algorithm="sha1").hex
+        blob_path = self._blob_path(sha1)
+        if blob_path.exists():
+            log.info("Archived content already present, not storing again: %s", fmt_loc(path))
+            os.unlink(path)
+        else:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, blob_path)
+
+        version = ArchivedVersion(
+            sha1=sha1, size=stat.st_size, mtime=stat.st_mtime, archived_at=time.time()
+        )
+        self._save_versions(key, self.versions(key) + [version])
+        return version
+
+    def restore(self, key: str, dest_path: Path) -> ArchivedVersion:
+        """
+        Restore the newest version of `key` to `dest_path` and remove it from the
+        version log. The blob itself is left for `compact()` to clean up, since other
+        versions may share it. Refuses to overwrite an existing file at `dest_path`.
+        """
+        if dest_path.exists():
+            raise FileExists(f"Cannot restore over existing file: {fmt_loc(dest_path)}")
+        versions = self.versions(key)
+        if not versions:
+            raise FileNotFound(f"No archived versions of: {fmt_loc(key)}")
+
+        version = versions[-1]
+        blob_path = self._blob_path(version.sha1)
+        if not blob_path.exists():
+            raise FileNotFound(f"Archived content missing for {fmt_loc(key)}: {version.sha1}")
+
+        copyfile_atomic(blob_path, dest_path, make_parents=True)
+        os.utime(dest_path, (version.mtime, version.mtime))
+        self._save_versions(key, versions[:-1])
+        return version
+
+    def keys(self) -> Generator[str, None, None]:
+        """
+        All paths that have archived versions.
+        """
+        for dirname, _dirnames, filenames in os.walk(self.versions_dir):
+            for filename in filenames:
+                if filename.endswith(VERSIONS_SUFFIX):
+                    rel_path = (Path(dirname) / filename).relative_to(self.versions_dir)
+                    yield str(rel_path)[: -len(VERSIONS_SUFFIX)]
+
+    def legacy_files(self) -> Generator[Path, None, None]:
+        """
+        Files archived with the older layout (as plain files at the same path).
+        """
+        for dirname, dirnames, filenames in os.walk(self.archive_dir):
+            if Path(dirname) == self.archive_dir:
+                dirnames[:] = [d for d in dirnames if d not in (BLOBS_DIR, VERSIONS_DIR)]
+            for filename in filenames:
+                yield Path(dirname) / filename
+
+    def compact(self, keep_versions: int = 3, max_age: float = 0.0) -> CompactionStats:
+        """
+        Migrate any files in the older layout, keep at most `keep_versions` versions of
+        each path (and none older than `max_age` seconds, if set, though the newest version
+        is always kept), and delete blobs no longer referenced by any version.
+        """
+        stats = CompactionStats()
+
+        for legacy_path in list(self.legacy_files()):
+            self.add(legacy_path, str(legacy_path.relative_to(self.archive_dir)))
+            stats.legacy_files_migrated += 1
+
+        cutoff = time.time() - max_age if max_age else 0.0
+        referenced: Set[str] = set()
+        for key in list(self.keys()):
+            versions = self.versions(key)
+            kept = versions[-keep_versions:] if keep_versions > 0 else versions[-1:]
+            if cutoff:
+                kept = [v for v in kept[:-1] if v.archived_at >= cutoff] + kept[-1:]
+            if len(kept) < len(versions):
+                stats.versions_removed += len(versions) - len(kept)
+                self._save_versions(key, kept)
+            referenced.update(v.sha1 for v in kept)
+
+        if self.blobs_dir.exists():
+            for blob_path in list(self.blobs_dir.glob("*/*")):
+                if blob_path.name not in referenced:
+                    stats.bytes_reclaimed += blob_path.stat().st_size
+                    stats.blobs_removed += 1
+                    os.unlink(blob_path)
+
+        log.info("Compacted archive %s: %s", fmt_loc(self.archive_dir), stats)
+        return stats
+
+
+## Tests
+
+
+def test_content_archive():
+    import shutil
+
+    archive_dir = Path("tmp/test_content_archive")
+    shutil.rmtree(archive_dir, ignore_errors=True)
+    work_dir = archive_dir.parent / "test_content_archive_files"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    archive = ContentArchive(archive_dir)
+
+    def write(name: str, content: str) -> Path:
+        path = work_dir / name
+        path.write_text(content)
+        return path
+
+    # Identical versions share one blob.
+    for content in ["v1", "v2", "v1", "v1"]:
+        archive.add(write("a.txt", content), "docs/a.txt")
+    archive.add(write("b.txt", "v1"), "docs/b.txt")
+    assert [v.size for v in archive.versions("docs/a.txt")] == [2, 2, 2, 2]
+    assert sorted(archive.keys()) == ["docs/a.txt", "docs/b.txt"]
+    assert len(list(archive.blobs_dir.glob("*/*"))) == 2
+
+    # Restoring pops the newest version.
+    archive.restore("docs/a.txt", work_dir / "a.txt")
+    assert (work_dir / "a.txt").read_text() == "v1"
+    assert len(archive.versions("docs/a.txt")) == 3
+
+    # Existing files are never overwritten.
+    try:
+        archive.restore("docs/a.txt", work_dir / "a.txt")
+        assert False
+    except FileExists:
+        pass
+    assert len(archive.versions("docs/a.txt")) == 3
+
+    # Legacy files are migrated and old versions are dropped.
+    (archive_dir / "docs").mkdir(parents=True, exist_ok=True)
+    (archive_dir / "docs" / "c.txt").write_text("legacy")
+    stats = archive.compact(keep_versions=1)
+    assert stats.legacy_files_migrated == 1
+    assert stats.versions_removed == 2
+    assert stats.blobs_removed == 1
+    assert stats.bytes_reclaimed == 2
+    assert archive.versions("docs/c.txt")[0].size == 6
+    assert not (archive_dir / "docs" / "c.txt").exists()
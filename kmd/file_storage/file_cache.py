@@ -1,8 +1,9 @@
 import copy
+import os
 import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Generic, Optional, Tuple, TypeVar
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
 
 from cachetools import LRUCache
 
@@ -13,6 +14,11 @@ log = get_logger(__name__)
 
 T = TypeVar("T")
 
+WatchFilter = Callable[[Path], bool]
+"""
+Whether changes to the file at a (resolved) path are currently being watched.
+"""
+
 
 @dataclass
 class CacheStats:
@@ -25,10 +31,16 @@ class CacheStats:
 class FileMtimeCache(Generic[T]):
     """
     A simple in-memory cache that stores loaded values from files.
+
+    Entries are checked against the file's mtime on every read, except for files a
+    file watcher reports it is watching when they are cached, where the watcher is
+    responsible for calling `delete()` when files change.
     """
 
     def __init__(self, max_size, name: str, log_freq: int = 500):
-        self.cache: LRUCache[str, Tuple[str, T]] = LRUCache(maxsize=max_size)
+        # Values are (mtime hash, value, trusted), where trusted entries need no mtime check.
+        self.cache: LRUCache[str, Tuple[str, T, bool]] = LRUCache(maxsize=max_size)
+        self.watched: Dict[str, WatchFilter] = {}
         self.lock = threading.RLock()
         self.stats = CacheStats()
         self.prev_stats = CacheStats()  # Initialize prev_stats with CacheStats
@@ -44,32 +56,47 @@ class FileMtimeCache(Generic[T]):
         and the file hasn't changed; otherwise, returns None.
         """
         key = self._cache_key(path)
+        with self.lock:
+            cache_entry = self.cache.get(key)
+            if cache_entry and cache_entry[2]:
+                self.stats.hits += 1
+                trusted_value = cache_entry[1]
+            else:
+                trusted_value = None
+        if trusted_value is not None:
+            return copy.deepcopy(trusted_value)
+
         mtime_hash = file_mtime_hash(path)
         with self.lock:
             self.log_stats()
             cache_entry = self.cache.get(key)
             if cache_entry:
-                cached_mtime_hash, cached_value = cache_entry
+                cached_mtime_hash, _cached_value, _trusted = cache_entry
                 if cached_mtime_hash == mtime_hash:
                     self.stats.hits += 1
-                    return copy.deepcopy(cached_value)
                 else:
                     # Cache is outdated.
                     del self.cache[key]
-            self.stats.misses += 1
+                    cache_entry = None
+            if not cache_entry:
+                self.stats.misses += 1
 
-        return None
+        # Cached values are never mutated, so copying doesn't need the lock.
+        return copy.deepcopy(cache_entry[1]) if cache_entry else None
 
-    def update(self, path: Path, value: T) -> None:
+    def update(self, path: Path, value: T, mtime_hash: Optional[str] = None) -> None:
         """
-        Updates the cache with the new value for the given path.
+        Updates the cache with the new value for the given path. If the value was read
+        from the file, pass the `file_mtime_hash()` from before it was read, so that if
+        the file changed since, the entry is stale instead of wrong.
         """
         key = self._cache_key(path)
         value = copy.deepcopy(value)
-        mtime_hash = file_mtime_hash(path)
+        if not mtime_hash:
+            mtime_hash = file_mtime_hash(path)
         with self.lock:
             self.log_stats()
-            self.cache[key] = (mtime_hash, value)
+            self.cache[key] = (mtime_hash, value, self._is_watched(key))
             self.stats.updates += 1
 
     def delete(self, path: Path) -> None:
@@ -83,6 +110,41 @@ class FileMtimeCache(Generic[T]):
                 del self.cache[key]
                 self.stats.deletes += 1
 
+    def delete_tree(self, path: Path) -> None:
+        """
+        Removes cached values for the given path and any paths within it.
+        """
+        key = self._cache_key(path)
+        prefix = key.rstrip(os.sep) + os.sep
+        with self.lock:
+            self.log_stats()
+            for cached_key in [k for k in self.cache if k == key or k.startswith(prefix)]:
+                del self.cache[cached_key]
+                self.stats.deletes += 1
+
+    def set_watched(self, dir: Path, is_watched: Optional[WatchFilter]) -> None:
+        """
+        Mark a directory as watched, so mtimes of files within it that `is_watched`
+        accepts when they are cached aren't checked on reads. Pass None to stop treating
+        it as watched.
+        """
+        key = self._cache_key(dir)
+        with self.lock:
+            if is_watched:
+                self.watched[key] = is_watched
+            else:
+                self.watched.pop(key, None)
+                # Entries cached while watched need checking again.
+                for cached_key, (mtime_hash, value, trusted) in list(self.cache.items()):
+                    if trusted and cached_key.startswith(key + os.sep):
+                        self.cache[cached_key] = (mtime_hash, value, False)
+
+    def _is_watched(self, key: str) -> bool:
+        for dir_key, is_watched in self.watched.items():
+            if key.startswith(dir_key + os.sep) and is_watched(Path(key)):
+                return True
+        return False
+
     def log_stats(self) -> None:
         """
         Logs the cache statistics if any of the counters have changed by more than 100
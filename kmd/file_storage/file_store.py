@@ -1,19 +1,31 @@
 import functools
+import itertools
 import os
 import threading
 import time
 from os import path
 from os.path import join, relpath
 from pathlib import Path
-from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, TypeVar
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Set, Tuple, TypeVar
 
 from kmd.config.logger import get_logger, log_file_path
+from kmd.config.settings import global_settings
 from kmd.config.text_styles import EMOJI_SAVED, EMOJI_WARN
 
 from kmd.errors import FileExists, FileNotFound, InvalidFilename, SkippableError
-from kmd.file_formats.item_file_format import read_item, write_item
+from kmd.file_formats.item_file_format import (
+    normalized_item,
+    read_item,
+    uncache_items,
+    watch_item_cache,
+    write_item,
+)
+from kmd.file_storage.content_archive import ArchivedVersion, CompactionStats, ContentArchive
 from kmd.file_storage.metadata_dirs import MetadataDirs
+from kmd.file_storage.parallel_scan import scan_items, ScanResult
+from kmd.file_storage.precondition_index import PreconditionIndex
 from kmd.file_storage.store_filenames import folder_for_type, join_suffix, parse_item_filename
+from kmd.file_storage.store_watcher import DEFAULT_POLL_INTERVAL, StoreWatcher, watch_store
 from kmd.file_tools.file_walk import walk_by_dir
 from kmd.file_tools.ignore_files import IgnoreChecker
 from kmd.model.args_model import fmt_loc, Locator
@@ -23,10 +35,12 @@ from kmd.model.items_model import Item, ItemId, ItemType
 from kmd.model.paths_model import StorePath
 from kmd.query.vector_index import WsVectorIndex
 from kmd.shell_ui.shell_output import cprint
-from kmd.util.format_utils import fmt_lines
+from kmd.util.format_utils import fmt_count_items, fmt_lines
 from kmd.util.log_calls import format_duration, log_calls
+from kmd.util.read_write_lock import ReadWriteLock
 
 from kmd.util.strif import copyfile_atomic, hash_file, move_file
+from kmd.util.tracing import trace_span
 from kmd.util.uniquifier import Uniquifier
 from kmd.util.url import is_url, Url
 from kmd.workspaces.param_state import ParamState
@@ -41,12 +55,26 @@ T = TypeVar("T")
 
 def synchronized(method: Callable[..., T]) -> Callable[..., T]:
     """
-    Simple way to synchronize a few methods.
+    Run the method holding the store's write lock, for methods that mutate state.
     """
 
     @functools.wraps(method)
     def synchronized_method(self, *args: Any, **kwargs: Any) -> T:
-        with self._lock:
+        with self._lock.write():
+            return method(self, *args, **kwargs)
+
+    return synchronized_method
+
+
+def synchronized_read(method: Callable[..., T]) -> Callable[..., T]:
+    """
+    Run the method holding the store's read lock, which is shared with other readers.
+    Such methods must not call `synchronized` methods.
+    """
+
+    @functools.wraps(method)
+    def synchronized_method(self, *args: Any, **kwargs: Any) -> T:
+        with self._lock.read():
             return method(self, *args, **kwargs)
 
     return synchronized_method
@@ -56,6 +84,8 @@ class FileStore:
     """
     The main class to manage files in a workspace, holding settings and files with items.
     Should be thread safe since file operations are atomic and mutable state is synchronized.
+    Mutations take an exclusive lock but lookups share a read lock, and loading items
+    (which uses the item cache) takes no store lock at all.
     """
 
     # TODO: Consider using a pluggable filesystem (fsspec AbstractFileSystem).
@@ -64,91 +94,237 @@ class FileStore:
         self.base_dir = base_dir.resolve()
         self.name = workspace_name(self.base_dir)
         self.is_sandbox = is_sandbox
-        self._lock = threading.RLock()
+        self._lock = ReadWriteLock()
+        self._reload_lock = threading.Lock()
+
+        # TODO: Move this to its own IdentifierIndex class, and make it exactly mirror disk state.
+        self.uniquifier = Uniquifier()
+        self.id_map: Dict[ItemId, StorePath] = {}
+        # The inverse of id_map, so changed paths can be unindexed without a scan.
+        self.path_ids: Dict[StorePath, ItemId] = {}
+        # Index updates made while a reload is scanning files, to replay afterwards.
+        self._index_log: Optional[List[Callable[[], Any]]] = None
+        self._watcher: Optional[StoreWatcher] = None
+        self.precondition_index = PreconditionIndex(self.base_dir, self.load)
+        self._versions = itertools.count()
+        self.version = next(self._versions)
+        """Changes whenever items are added, modified, or removed (including outside of kmd)."""
+
         self.reload()
 
-    @synchronized
     def reload(self):
         """
-        Load or reload all state.
+        Load or reload all state. Reading all items to rebuild the id index is done
+        without holding the store lock, so other threads can keep using the store.
+        This also warms the item cache.
+        """
+        with self._reload_lock:
+            self._reload_settings()
+            self.scan_result = self._scan_items()
+            self._id_index_init(self.scan_result.items)
+            self.precondition_index.sync(p for p, _item in self.scan_result.items)
+            self.version = next(self._versions)
+
+        if global_settings().watch_files:
+            self.start_watching()
+
+    def start_watching(self, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        """
+        Watch for files changed outside of kmd and update the item cache, id index,
+        and selections as they change. A watcher that stopped on an error is replaced.
         """
+        if self._watcher and self._watcher.is_running:
+            return
+        self._watcher = watch_store(
+            self.base_dir,
+            self.is_ignored,
+            self._handle_file_changes,
+            self._handle_missed_changes,
+            poll_interval,
+        )
+        watch_item_cache(self.base_dir, self._watcher.is_watched)
+
+    @property
+    def is_watching(self) -> bool:
+        return self._watcher is not None and self._watcher.is_running
+
+    def stop_watching(self):
+        if self._watcher:
+            watch_item_cache(self.base_dir, None)
+            self._watcher.stop()
+            self._watcher = None
+
+    def _items_changed(
+        self, changed: Iterable[StorePath] = (), removed: Iterable[StorePath] = ()
+    ) -> None:
+        """
+        Record that items were created, modified, or removed, for anything that depends
+        on the store's contents. Removed paths may be directories.
+        """
+        self.version = next(self._versions)
+        self.precondition_index.update(changed, removed)
+
+    def _handle_file_changes(self, changed: Set[StorePath], removed: Set[StorePath]):
+        """
+        Update state for files changed outside of kmd. Removed paths may be directories.
+        Changed items are read before taking the lock.
+        """
+        uncache_items(self.base_dir / p for p in changed | removed)
+        self._items_changed(changed, removed)
+
+        loaded: List[Tuple[StorePath, Item]] = []
+        for store_path in changed:
+            if not parse_item_filename(store_path)[3]:
+                continue
+            try:
+                loaded.append((store_path, self.load(store_path)))
+            except (SkippableError, FileNotFoundError) as e:
+                log.info("Could not read changed file, skipping: %s: %s", fmt_loc(store_path), e)
+
+        with self._lock.write():
+            unindexed = {p for p in changed | removed if p in self.path_ids}
+            for removed_path in removed:
+                if removed_path not in self.path_ids and not parse_item_filename(removed_path)[3]:
+                    # Probably a directory, so everything within it was removed.
+                    unindexed.update(
+                        p for p in self.path_ids if Path(p).is_relative_to(removed_path)
+                    )
+            for store_path in unindexed:
+                self._id_unindex_id(self.path_ids[store_path])
+            for store_path, item in loaded:
+                self._id_index_loaded(store_path, item)
+            if removed:
+                self._remove_selection_paths(removed)
+
+    def _handle_missed_changes(self):
+        """
+        Check everything again after the watcher missed changes (events overflowed) or
+        stopped on an error. A stopped watcher is replaced on reload if watching is
+        enabled, and otherwise cached items are checked against file mtimes from then on.
+        """
+        log.warning(
+            "File watcher missed changes, so reloading workspace: %s", fmt_loc(self.base_dir)
+        )
+        watch_item_cache(self.base_dir, None)
+        self.reload()
+        watcher = self._watcher
+        if watcher and watcher.is_running:
+            watch_item_cache(self.base_dir, watcher.is_watched)
+
+    @synchronized
+    def _reload_settings(self):
         self.start_time = time.time()
         self.info_logged = False
         self.warnings: List[str] = []
-
-        # TODO: Move this to its own IdentifierIndex class, and make it exactly mirror disk state.
-        self.uniquifier = Uniquifier()
-        self.id_map: Dict[ItemId, StorePath] = {}
+        self._index_log = []
 
         self.dirs = MetadataDirs(self.base_dir)
         self.dirs.initialize()
 
         self.vector_index = WsVectorIndex(self.base_dir / self.dirs.index_dir)
 
+        # Previous versions of items, stored by content hash.
+        self.archive_store = ContentArchive(self.base_dir / self.dirs.archive_dir)
+
         # Initialize selection with history support.
         self.selections = SelectionHistory.init(self.base_dir / self.dirs.selection_yml)
 
         # Initialize ignore checker.
         self.is_ignored = IgnoreChecker.from_file(self.base_dir / self.dirs.ignore_file)
 
-        self._id_index_init()
-
-        # Filter out any non-existent paths from the initial selection.
-        if self.selections.history:
-            self._filter_selection_paths()
-
         self.params = ParamState(self.base_dir / self.dirs.params_yml)
 
-        self.end_time = time.time()
-
-        # Warm the item cache in a separate thread.
-        from kmd.file_storage.file_cache_warmer import warm_file_store
-
-        warm_file_store(self)
-
     def __str__(self):
         return f"FileStore(~{self.name})"
 
-    def _id_index_init(self):
+    def _scan_items(self) -> ScanResult:
+        """
+        Read all items in the store, in parallel for large stores.
+        """
+        store_paths = [p for p in self.walk_items() if parse_item_filename(p)[3]]
+        return scan_items(self.base_dir, store_paths)
+
+    @synchronized
+    def _id_index_init(self, scanned: List[Tuple[StorePath, Optional[Item]]]):
+        """
+        Rebuild the id index from scanned items, then replay any index updates
+        that were made while scanning.
+        """
+        index_log = self._index_log or []
+        self._index_log = None
+        self.uniquifier = Uniquifier()
+        self.id_map = {}
+        self.path_ids = {}
+
         num_dups = 0
-        for store_path in self.walk_items():
-            dup_path = self._id_index_item(store_path)
-            if dup_path:
-                num_dups += 1
+        for store_path, item in scanned:
+            if item:
+                dup_path = self._id_index_loaded(store_path, item)
+                if dup_path:
+                    num_dups += 1
+            else:
+                self._add_to_uniquifier(store_path)
+        for update in index_log:
+            update()
 
         if num_dups > 0:
             self.warnings.append(
                 f"Found {num_dups} duplicate items in store. See `logs` for details."
             )
 
-    @synchronized
+        # Filter out any non-existent paths from the initial selection.
+        if self.selections.history:
+            self._filter_selection_paths()
+
+        self.end_time = time.time()
+
     def _id_index_item(self, store_path: StorePath) -> Optional[StorePath]:
         """
-        Update metadata index with a new item.
+        Update metadata index with a new item. The item is read before taking the lock.
         """
+        try:
+            item = self.load(store_path)
+        except SkippableError as e:
+            log.warning("Could not read file, skipping: %s: %s", fmt_loc(store_path), e)
+            with self._lock.write():
+                self._add_to_uniquifier(store_path)
+            return None
+
+        return self._id_index_loaded(store_path, item)
+
+    def _add_to_uniquifier(self, store_path: StorePath) -> bool:
         name, item_type, _format, file_ext = parse_item_filename(store_path)
         if not file_ext:
             log.debug("Skipping file with unrecognized name or extension: %s", fmt_loc(store_path))
-            return None
+            return False
 
         full_suffix = join_suffix(item_type.name, file_ext.name) if item_type else file_ext.name
         self.uniquifier.add(name, full_suffix)
+        return True
 
-        dup_path = None
+    @synchronized
+    def _id_index_loaded(self, store_path: StorePath, item: Item) -> Optional[StorePath]:
+        """
+        Update metadata index with an item already in memory, without reloading it.
+        Returns the path of any other item with the same id.
+        """
+        if self._index_log is not None:
+            self._index_log.append(functools.partial(self._id_index_loaded, store_path, item))
+        self._add_to_uniquifier(store_path)
 
-        try:
-            item = self.load(store_path)
-            item_id = item.item_id()
-            if item_id:
-                old_path = self.id_map.get(item_id)
-                if old_path and old_path != store_path:
-                    dup_path = old_path
-                    log.info(
-                        "Duplicate items (%s):\n%s", item_id, fmt_lines([old_path, store_path])
-                    )
-                self.id_map[item_id] = store_path
-        except SkippableError as e:
-            log.warning("Could not read file, skipping: %s: %s", fmt_loc(store_path), e)
+        dup_path = None
+        item_id = item.item_id()
+        if item_id:
+            old_path = self.id_map.get(item_id)
+            if old_path and old_path != store_path:
+                dup_path = old_path
+                log.info("Duplicate items (%s):\n%s", item_id, fmt_lines([old_path, store_path]))
+                self.path_ids.pop(old_path, None)
+            old_id = self.path_ids.get(store_path)
+            if old_id and old_id != item_id:
+                self.id_map.pop(old_id, None)
+            self.id_map[item_id] = store_path
+            self.path_ids[store_path] = item_id
 
         return dup_path
 
@@ -161,13 +337,19 @@ class FileStore:
             item = self.load(store_path)
             item_id = item.item_id()
             if item_id:
-                try:
-                    self.id_map.pop(item_id, None)
-                except KeyError:
-                    pass  # If we happen to reload a store it might no longer be in memory.
+                self._id_unindex_id(item_id)
         except (FileNotFoundError, InvalidFilename):
             pass
 
+    @synchronized
+    def _id_unindex_id(self, item_id: ItemId):
+        if self._index_log is not None:
+            self._index_log.append(functools.partial(self._id_unindex_id, item_id))
+        # If we happen to reload a store it might no longer be in memory.
+        store_path = self.id_map.pop(item_id, None)
+        if store_path:
+            self.path_ids.pop(store_path, None)
+
     @synchronized
     def _new_filename_for(self, item: Item) -> Tuple[str, Optional[str]]:
         """
@@ -208,7 +390,7 @@ class FileStore:
         else:
             return None
 
-    @synchronized
+    @synchronized_read
     def find_by_id(self, item: Item) -> Optional[StorePath]:
         """
         Best effort to see if an item with the same identity is already in the store.
@@ -229,8 +411,6 @@ class FileStore:
                             "Item with the same id already saved (disk check):\n%s",
                             fmt_lines([fmt_loc(default_path), item_id]),
                         )
-                        store_path = default_path
-                        self.id_map[item_id] = default_path
                         return default_path
             if store_path and self.exists(store_path):
                 log.message(
@@ -296,72 +476,160 @@ class FileStore:
         Save the item. Uses the store_path if it's already set or generates a new one.
         Updates item.store_path.
         """
-        # If external file already exists within the workspace, the file is already saved (without metadata).
-        if item.external_path and Path(item.external_path).resolve().is_relative_to(self.base_dir):
-            log.message("External file already saved: %s", fmt_loc(item.external_path))
-            rel_path = Path(item.external_path).relative_to(self.base_dir)
-            # Indicate this is really an item with a store path, not an external path.
-            item.store_path = str(rel_path)
-            item.external_path = None
-            return StorePath(rel_path)
-        else:
-            # Otherwise it's still in memory or in a file outside the workspace and we need to save it.
-            store_path, found, old_store_path = self.store_path_for(item, as_tmp=as_tmp)
+        return self.save_batch([item], as_tmp=as_tmp, overwrite=overwrite)[0]
+
+    @synchronized
+    def _plan_saves(
+        self, items: List[Item], as_tmp: bool, overwrite: bool
+    ) -> Tuple[List[StorePath], Dict[StorePath, Item]]:
+        """
+        Decide on the store path for each item and which items actually need to be written.
+        Items with the same identity within the batch are saved once (the last one wins)
+        and items identical to the previous version of a similarly named item are not
+        written at all.
+        """
+        store_paths: List[StorePath] = []
+        writes: Dict[StorePath, Item] = {}
+        batch_ids: Dict[ItemId, StorePath] = {}
+
+        for item in items:
+            # If external file already exists within the workspace, the file is already
+            # saved (without metadata).
+            if item.external_path and Path(item.external_path).resolve().is_relative_to(
+                self.base_dir
+            ):
+                log.message("External file already saved: %s", fmt_loc(item.external_path))
+                store_paths.append(StorePath(Path(item.external_path).relative_to(self.base_dir)))
+                continue
+
+            item_id = item.item_id()
+            if item_id and item_id in batch_ids and not as_tmp:
+                store_path, found, old_store_path = batch_ids[item_id], True, None
+            else:
+                store_path, found, old_store_path = self.store_path_for(item, as_tmp=as_tmp)
 
             if not overwrite and found:
                 log.message("Skipping save of item already saved: %s", fmt_loc(store_path))
-                item.store_path = str(store_path)
-                return store_path
+                store_paths.append(store_path)
+                continue
 
-            full_path = self.base_dir / store_path
+            # Check if it's an exact duplicate of the previous file, to reduce clutter.
+            # This is done in memory, comparing with the item as it would be written.
+            if old_store_path and not item.external_path:
+                try:
+                    old_item = self.load(old_store_path)
+                    if normalized_item(item).content_equals(old_item):
+                        log.message(
+                            "New item is identical to previous version, will keep old item: %s",
+                            fmt_loc(old_store_path),
+                        )
+                        store_paths.append(old_store_path)
+                        continue
+                except SkippableError as e:
+                    log.info("Could not compare with previous version: %s", e)
 
-            log.info("Saving item to %s: %s", fmt_loc(full_path), item)
+            if item_id:
+                batch_ids[item_id] = store_path
+            writes[store_path] = item
+            store_paths.append(store_path)
 
-            # If we're overwriting an existing file, archive it first.
-            if full_path.exists():
-                try:
-                    self.archive(store_path, quiet=True)
-                except Exception as e:
-                    log.info("Exception archiving existing file: %s", e)
+        return store_paths, writes
 
-            # Now save the new item.
-            try:
-                if item.external_path:
-                    copyfile_atomic(item.external_path, full_path)
-                else:
-                    write_item(item, full_path)
-            except IOError as e:
-                log.error("Error saving item: %s", e)
-                try:
-                    self.unarchive(store_path)
-                except Exception:
-                    pass
-                raise e
+    def _write_item_file(self, item: Item, store_path: StorePath) -> None:
+        full_path = self.base_dir / store_path
 
-            # Set filesystem file creation and modification times as well.
-            if item.created_at:
-                created_time = item.created_at.timestamp()
-                modified_time = item.modified_at.timestamp() if item.modified_at else created_time
-                os.utime(full_path, (modified_time, modified_time))
+        log.info("Saving item to %s: %s", fmt_loc(full_path), item)
 
-            # Check if it's an exact duplicate of the previous file, to reduce clutter.
-            if old_store_path:
-                old_item = self.load(old_store_path)
-                new_item = self.load(store_path)  # Reload it to get normalized text.
-                if new_item.content_equals(old_item):
-                    log.message(
-                        "New item is identical to previous version, will keep old item: %s",
-                        fmt_loc(old_store_path),
-                    )
-                    os.unlink(full_path)
-                    store_path = old_store_path
+        with trace_span("write", "io", path=store_path):
+            if item.external_path:
+                copyfile_atomic(item.external_path, full_path, make_parents=True)
+            else:
+                write_item(item, full_path)
 
-        # Update in-memory store_path only after successful save.
-        item.store_path = str(store_path)
-        self._id_index_item(store_path)
+        # Set filesystem file creation and modification times as well.
+        if item.created_at:
+            created_time = item.created_at.timestamp()
+            modified_time = item.modified_at.timestamp() if item.modified_at else created_time
+            os.utime(full_path, (modified_time, modified_time))
 
-        log.message("%s Saved item:\n%s", EMOJI_SAVED, fmt_lines([fmt_loc(store_path)]))
-        return store_path
+    @synchronized
+    def save_batch(
+        self, items: List[Item], as_tmp: bool = False, overwrite: bool = True
+    ) -> List[StorePath]:
+        """
+        Save several items as a single unit, returning their store paths in the same order.
+        Duplicates are resolved in memory, all files are written in one pass, and the id
+        index is updated once at the end. If any write fails, files already written in
+        this batch are removed, overwritten files are restored, and the error is re-raised,
+        so either all items are saved or none are. Updates each item's store_path only
+        after all writes succeed.
+        """
+        prev_keys = set(self.uniquifier.keys)
+        prev_id_map = dict(self.id_map)
+        prev_path_ids = dict(self.path_ids)
+
+        try:
+            store_paths, writes = self._plan_saves(items, as_tmp=as_tmp, overwrite=overwrite)
+        except Exception:
+            self.uniquifier.keys = prev_keys
+            raise
+
+        # Now write all new items, archiving any previous versions first.
+        written: List[StorePath] = []
+        archived: List[StorePath] = []
+        try:
+            for store_path, item in writes.items():
+                full_path = self.base_dir / store_path
+                if full_path.exists():
+                    self._id_unindex_item(store_path)
+                    self._archive_file(store_path)
+                    archived.append(store_path)
+                self._write_item_file(item, store_path)
+                written.append(store_path)
+        except Exception as e:
+            log.error("Error saving items, rolling back %s writes: %s", len(written), e)
+            for store_path in reversed(written):
+                try:
+                    os.unlink(self.base_dir / store_path)
+                except OSError:
+                    pass
+            for store_path in reversed(archived):
+                try:
+                    self.archive_store.restore(str(store_path), self.base_dir / store_path)
+                except Exception as restore_error:
+                    log.warning(
+                        "Could not restore archived file %s: %s",
+                        fmt_loc(store_path),
+                        restore_error,
+                    )
+            self.uniquifier.keys = prev_keys
+            self.id_map = prev_id_map
+            self.path_ids = prev_path_ids
+            raise e
+
+        # Commit: update in-memory store paths and the id index only after successful save.
+        for item, store_path in zip(items, store_paths):
+            item.store_path = str(store_path)
+            if item.external_path and Path(item.external_path).resolve().is_relative_to(
+                self.base_dir
+            ):
+                # Indicate this is really an item with a store path, not an external path.
+                item.external_path = None
+        for store_path, item in writes.items():
+            self._id_index_loaded(store_path, item)
+        self._items_changed(changed=writes.keys())
+
+        if len(store_paths) == 1:
+            log.message("%s Saved item:\n%s", EMOJI_SAVED, fmt_lines([fmt_loc(store_paths[0])]))
+        elif store_paths:
+            log.message(
+                "%s Saved %s (%s written):\n%s",
+                EMOJI_SAVED,
+                fmt_count_items(len(store_paths)),
+                len(writes),
+                fmt_lines(fmt_loc(p) for p in store_paths),
+            )
+        return store_paths
 
     @log_calls(level="debug")
     def load(self, store_path: StorePath) -> Item:
@@ -374,20 +642,20 @@ class FileStore:
         """
         Get a hash of the item at the given path.
         """
-        return hash_file(self.base_dir / store_path, algorithm="sha1").with_prefix
+        with trace_span("hash", "io", path=store_path):
+            return hash_file(self.base_dir / store_path, algorithm="sha1").with_prefix
 
-    def import_item(
+    def _import_prepare(
         self,
         locator: Locator,
         as_type: Optional[ItemType] = None,
         reimport: bool = False,
-    ) -> StorePath:
+    ) -> StorePath | Item:
         """
-        Add resources from files or URLs. If a locator is a path, copy it into the store.
-        If it's already there, just return the store path. If `as_type` is specified,
-        it will be used to override the item type, otherwise we go with our best guess.
+        Do everything needed to import a locator except saving. Returns the store path if
+        the locator is already in the store (or was copied in as-is), or otherwise the
+        item that still needs to be saved.
         """
-
         if is_url(str(locator)):
             # Import a URL as a resource.
             orig_url = Url(str(locator))
@@ -395,9 +663,7 @@ class FileStore:
             if url != orig_url:
                 log.message("Canonicalized URL: %s -> %s", orig_url, url)
             item_type = as_type or ItemType.resource
-            item = Item(item_type, url=url, format=Format.url)
-            store_path = self.save(item)
-            return store_path
+            return Item(item_type, url=url, format=Format.url)
         elif isinstance(locator, StorePath) and not reimport:
             log.info("Store path already imported: %s", fmt_loc(locator))
             return locator
@@ -443,8 +709,7 @@ class FileStore:
 
                 # This will only have a store path if it was already in the store; otherwise
                 # we'll pick a new store path.
-                store_path = self.save(item)
-                log.info("Imported text file: %s", item.as_str())
+                return item
             else:
                 log.message("Importing non-text file: %s", fmt_loc(path))
                 # Binary or other files we just copy over as-is, preserving the name.
@@ -458,7 +723,20 @@ class FileStore:
 
                 log.message("Importing resource: %s -> %s", fmt_loc(path), fmt_loc(store_path))
                 copyfile_atomic(path, self.base_dir / store_path, make_parents=True)
-            return store_path
+                return store_path
+
+    def import_item(
+        self,
+        locator: Locator,
+        as_type: Optional[ItemType] = None,
+        reimport: bool = False,
+    ) -> StorePath:
+        """
+        Add resources from files or URLs. If a locator is a path, copy it into the store.
+        If it's already there, just return the store path. If `as_type` is specified,
+        it will be used to override the item type, otherwise we go with our best guess.
+        """
+        return self.import_items(locator, as_type=as_type, reimport=reimport)[0]
 
     def import_items(
         self,
@@ -466,7 +744,30 @@ class FileStore:
         as_type: Optional[ItemType] = None,
         reimport: bool = False,
     ) -> List[StorePath]:
-        return [self.import_item(locator, as_type, reimport) for locator in locators]
+        """
+        Import several locators, as with `import_item()`, saving all new items in
+        one batch.
+        """
+        prepared = [self._import_prepare(locator, as_type, reimport) for locator in locators]
+
+        to_save = [p for p in prepared if isinstance(p, Item)]
+        saved_paths = iter(self.save_batch(to_save))
+
+        return [next(saved_paths) if isinstance(p, Item) else p for p in prepared]
+
+    def _remove_selection_paths(self, removed: Set[StorePath]):
+        """
+        Remove paths that were removed (or are within removed directories) from all
+        selections.
+        """
+        targets = {
+            p
+            for selection in self.selections.history
+            for p in selection.paths
+            if p in removed or any(Path(p).is_relative_to(r) for r in removed)
+        }
+        if targets:
+            self.selections.remove_values(list(targets))
 
     def _filter_selection_paths(self):
         """
@@ -483,7 +784,7 @@ class FileStore:
                 len(self.selections.history),
                 len(non_existent),
             )
-        self.selections.remove_values(non_existent)
+            self.selections.remove_values(list(non_existent))
 
     @synchronized
     def _remove_references(self, store_paths: List[StorePath]):
@@ -493,6 +794,7 @@ class FileStore:
         self.selections.remove_values(store_paths)
         for store_path in store_paths:
             self._id_unindex_item(store_path)
+        self._items_changed(removed=store_paths)
         # TODO: Update metadata of all relations that point to this path too.
 
     @synchronized
@@ -504,11 +806,13 @@ class FileStore:
         for store_path, new_store_path in replacements:
             self._id_unindex_item(store_path)
             self._id_index_item(new_store_path)
+        self._items_changed(
+            changed=[new for _old, new in replacements], removed=[old for old, _new in replacements]
+        )
         # TODO: Update metadata of all relations that point to this path too.
 
-    def archive(
-        self, store_path: StorePath, missing_ok: bool = False, quiet: bool = False
-    ) -> StorePath:
+    @synchronized
+    def archive(self, store_path: StorePath, missing_ok: bool = False, quiet: bool = False) -> None:
         """
         Archive the item by moving it into the archive directory.
         """
@@ -519,29 +823,58 @@ class FileStore:
                 fmt_loc(self.dirs.archive_dir),
             )
         orig_path = self.base_dir / store_path
-        archive_path = self.dirs.archive_dir / store_path
         if missing_ok and not orig_path.exists():
             log.message("Item to archive not found so moving on: %s", fmt_loc(orig_path))
-            return store_path
-        move_file(orig_path, archive_path)
+            return
+        # Remove references first, while the item can still be loaded to unindex it.
         self._remove_references([store_path])
+        self._archive_file(store_path)
+
+    @synchronized
+    def rename(self, store_path: StorePath, new_store_path: StorePath) -> None:
+        """
+        Move an item to a new path, which must not exist, and update references to it.
+        """
+        move_file(self.base_dir / store_path, self.base_dir / new_store_path, keep_backup=False)
+        self._rename_items([(store_path, new_store_path)])
 
-        archive_path = StorePath(self.dirs.archive_dir / store_path)
-        return archive_path
+    @synchronized
+    def _archive_file(self, store_path: StorePath) -> ArchivedVersion:
+        """
+        Move the file at the given path into the archive, without updating references.
+        """
+        return self.archive_store.add(self.base_dir / store_path, str(store_path))
 
+    @synchronized
     def unarchive(self, store_path: StorePath) -> StorePath:
         """
-        Unarchive the item by moving back out of the archive directory.
-        Path may be with or without the archive dir prefix.
+        Unarchive the item by restoring its most recently archived version.
+        Path may be with or without the archive dir prefix. Fails if an item already
+        exists at the original path, so it is never overwritten.
         """
         full_input_path = (self.base_dir / store_path).resolve()
         full_archive_path = (self.base_dir / self.dirs.archive_dir).resolve()
         if full_input_path.is_relative_to(full_archive_path):
             store_path = StorePath(relpath(full_input_path, full_archive_path))
         original_path = self.base_dir / store_path
-        move_file(full_input_path, original_path)
+        legacy_path = full_archive_path / store_path
+        if legacy_path.is_file():
+            # Archived with the older layout, as a plain file.
+            move_file(legacy_path, original_path, keep_backup=False)
+        else:
+            self.archive_store.restore(str(store_path), original_path)
+        self._id_index_item(StorePath(store_path))
+        self._items_changed(changed=[StorePath(store_path)])
         return StorePath(store_path)
 
+    @synchronized
+    def compact_archive(self, keep_versions: int = 3, max_age: float = 0.0) -> CompactionStats:
+        """
+        Drop old archived versions beyond the retention limits and delete content
+        no longer referenced by any version.
+        """
+        return self.archive_store.compact(keep_versions=keep_versions, max_age=max_age)
+
     def log_store_info(self, once: bool = False):
         if once and self.info_logged:
             return
@@ -566,7 +899,11 @@ class FileStore:
                 + "Create or switch to another workspace with the `workspace` command."
             )
 
-        log.info("File store startup took %s.", format_duration(self.end_time - self.start_time))
+        log.info(
+            "File store startup took %s (scanned %s).",
+            format_duration(self.end_time - self.start_time),
+            self.scan_result,
+        )
         # TODO: Log more info like number of items by type.
 
     def walk_items(
@@ -610,3 +947,196 @@ class FileStore:
         new_store_path = self.save(item)
 
         return new_store_path
+
+
+## Tests
+
+
+def test_save_batch():
+    import shutil
+
+    ws_dir = Path("tmp/test_save_batch.kb")
+    shutil.rmtree(ws_dir, ignore_errors=True)
+    ws = FileStore(ws_dir, is_sandbox=False)
+
+    def new_doc(title: str, body: str, format: Format = Format.markdown) -> Item:
+        return Item(ItemType.doc, title=title, body=body, format=format)
+
+    items = [new_doc(f"Doc {i}", f"Body {i}.") for i in range(3)]
+    version = ws.version
+    store_paths = ws.save_batch(items)
+    assert ws.version != version
+    assert store_paths == [StorePath(f"docs/doc_{i}.doc.md") for i in range(3)]
+    assert all(ws.exists(p) for p in store_paths)
+    assert [item.store_path for item in items] == [str(p) for p in store_paths]
+
+    # A new item identical to the previous version is not written again.
+    assert ws.save_batch([new_doc("Doc 0", "Body 0.")]) == [store_paths[0]]
+    assert not ws.exists(StorePath("docs/doc_0_1.doc.md"))
+
+    # If any write fails, nothing from the batch is saved.
+    good = new_doc("Good", "Good body.")
+    bad = new_doc("Bad", "Bad body.", format=Format.pdf)
+    try:
+        ws.save_batch([good, bad])
+        assert False, "Expected batch save to fail"
+    except ValueError:
+        pass
+    assert good.store_path is None
+    assert not ws.exists(StorePath("docs/good.doc.md"))
+    assert ws.save(good) == StorePath("docs/good.doc.md")
+
+
+def test_archive_versions():
+    import shutil
+
+    ws_dir = Path("tmp/test_archive_versions.kb")
+    shutil.rmtree(ws_dir, ignore_errors=True)
+    ws = FileStore(ws_dir, is_sandbox=False)
+
+    doc = Item(ItemType.doc, title="Doc", body="Version 1.", format=Format.markdown)
+    store_path = ws.save(doc)
+    for body in ["Version 2.", "Version 1.", "Version 3."]:
+        doc.body = body
+        ws.save(doc)
+
+    # Three overwritten versions, but only two distinct ones are stored.
+    versions = ws.archive_store.versions(store_path)
+    assert len(versions) == 3
+    assert len({v.sha1 for v in versions}) == 2
+
+    ws.archive(store_path)
+    assert not ws.exists(store_path)
+    assert ws.unarchive(StorePath(ws.dirs.archive_dir / store_path)) == store_path
+    assert ws.load(store_path).body.strip() == "Version 3."
+
+    # Unarchiving never overwrites the live item.
+    try:
+        ws.unarchive(store_path)
+        assert False
+    except FileExistsError:
+        pass
+    assert ws.load(store_path).body.strip() == "Version 3."
+
+    stats = ws.compact_archive(keep_versions=1)
+    assert stats.versions_removed == 2
+    # Restored content is no longer referenced by any version, so it is removed too.
+    assert stats.blobs_removed == 2
+    assert len(ws.archive_store.versions(store_path)) == 1
+
+
+def test_concurrent_access():
+    import random
+    import shutil
+
+    ws_dir = Path("tmp/test_concurrent_access.kb")
+    shutil.rmtree(ws_dir, ignore_errors=True)
+    ws = FileStore(ws_dir, is_sandbox=False)
+
+    def new_concept(i: int) -> Item:
+        return Item(
+            ItemType.concept, title=f"Concept {i}", body=f"Body {i}.", format=Format.markdown
+        )
+
+    num_writers = 4
+    items_per_writer = 15
+    errors: List[Exception] = []
+    done = threading.Event()
+
+    def writer(n: int):
+        try:
+            for i in range(n * items_per_writer, (n + 1) * items_per_writer):
+                if i % 5 == 0:
+                    ws.save_batch([new_concept(i), new_concept(i + 1000)])
+                else:
+                    ws.save(new_concept(i))
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            while not done.is_set():
+                i = random.randrange(num_writers * items_per_writer)
+                store_path = ws.find_by_id(new_concept(i))
+                if store_path:
+                    assert ws.load(store_path).title == f"Concept {i}"
+                for store_path in list(ws.walk_items())[:5]:
+                    ws.load(store_path)
+        except Exception as e:
+            errors.append(e)
+
+    def reloader():
+        try:
+            ws.reload()
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(num_writers)]
+    for t in readers + writers:
+        t.start()
+    reload_thread = threading.Thread(target=reloader)
+    reload_thread.start()
+    for t in writers + [reload_thread]:
+        t.join()
+    done.set()
+    for t in readers:
+        t.join()
+
+    assert not errors, errors
+
+    # Every saved item is indexed exactly once, at a path that exists.
+    for i in range(num_writers * items_per_writer):
+        store_path = ws.find_by_id(new_concept(i))
+        assert store_path and ws.exists(store_path)
+    assert len(ws.id_map) == len(set(ws.id_map.values()))
+    assert len(list(ws.walk_items())) == len(ws.id_map)
+
+
+def test_watch_changes():
+    import shutil
+
+    from kmd.workspaces.selections import Selection
+
+    ws_dir = Path("tmp/test_watch_changes.kb")
+    shutil.rmtree(ws_dir, ignore_errors=True)
+    ws = FileStore(ws_dir, is_sandbox=False)
+
+    def new_concept(title: str) -> Item:
+        return Item(ItemType.concept, title=title, body="Body.", format=Format.markdown)
+
+    path_a = ws.save(new_concept("Alpha"))
+    path_b = ws.save(new_concept("Beta"))
+    ws.selections.push(Selection(paths=[path_a, path_b]))
+    ws.start_watching(poll_interval=0.1)
+    try:
+        # Edit one file and delete another, as if in an editor or with git.
+        full_path_a = ws.base_dir / path_a
+        full_path_a.write_text(full_path_a.read_text().replace("Alpha", "Gamma"))
+        os.unlink(ws.base_dir / path_b)
+
+        for _ in range(50):
+            if ws.find_by_id(new_concept("Gamma")) and not ws.find_by_id(new_concept("Beta")):
+                break
+            time.sleep(0.1)
+
+        assert ws.find_by_id(new_concept("Gamma")) == path_a
+        assert not ws.find_by_id(new_concept("Alpha"))
+        assert not ws.find_by_id(new_concept("Beta"))
+        assert ws.load(path_a).title == "Gamma"
+        assert ws.selections.current.paths == [path_a]
+
+        # If the watcher misses changes, everything is reloaded.
+        full_path_a.write_text(full_path_a.read_text().replace("Gamma", "Delta"))
+        ws._handle_missed_changes()
+        assert ws.find_by_id(new_concept("Delta")) == path_a
+        assert ws.path_ids == {p: i for i, p in ws.id_map.items()}
+
+        # A watcher that stopped is replaced.
+        assert ws._watcher
+        ws._watcher.stop()
+        assert not ws.is_watching
+        ws.start_watching(poll_interval=0.1)
+        assert ws.is_watching
+    finally:
+        ws.stop_watching()
@@ -45,6 +45,11 @@ class MetadataDirs:
     history_dir: StorePath = StorePath(f"{DOT_DIR}/history")
     shell_history_yml: StorePath = StorePath(f"{DOT_DIR}/history/shell_history.yml")
     assistant_history_yml: StorePath = StorePath(f"{DOT_DIR}/history/assistant_history.yml")
+    run_records_jsonl: StorePath = StorePath(f"{DOT_DIR}/history/run_records.jsonl")
+
+    batch_dir: StorePath = StorePath(f"{DOT_DIR}/batch")
+
+    traces_dir: StorePath = StorePath(f"{DOT_DIR}/traces")
 
     tmp_dir: StorePath = StorePath(f"{DOT_DIR}/tmp")
 
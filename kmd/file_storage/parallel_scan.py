@@ -0,0 +1,176 @@
+"""
+Read many items at once, as on a cold start of a large workspace, splitting the
+(CPU-bound) parsing across worker processes.
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from kmd.config.logger import get_logger
+from kmd.errors import SkippableError
+from kmd.file_formats.item_file_format import cache_item, parse_item, read_item
+from kmd.model.items_model import Item
+from kmd.model.paths_model import StorePath
+from kmd.util.format_utils import fmt_count_items
+from kmd.util.log_calls import format_duration
+from kmd.util.strif import file_mtime_hash
+
+log = get_logger(__name__)
+
+PARALLEL_SCAN_MIN_ITEMS = 2000
+"""Below this many items, starting worker processes isn't worth it."""
+
+SCAN_CHUNK_SIZE = 250
+
+MAX_READ_ATTEMPTS = 3
+
+
+@dataclass
+class ScanResult:
+    items: List[Tuple[StorePath, Optional[Item]]] = field(default_factory=list)
+    """Items read, in the order given. Unreadable items are None. Deleted files are omitted."""
+
+    workers: int = 1
+    elapsed: float = 0.0
+    retried: int = 0
+
+    @property
+    def items_per_sec(self) -> float:
+        return len(self.items) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return "%s in %s (%d/s, %s)" % (
+            fmt_count_items(len(self.items), "item"),
+            format_duration(self.elapsed),
+            self.items_per_sec,
+            fmt_count_items(self.workers, "worker"),
+        )
+
+
+# (store path, mtime hash before reading, item, error message)
+_ChunkResult = List[Tuple[StorePath, Optional[str], Optional[Item], Optional[str]]]
+
+
+def _read_chunk(base_dir: Path, store_paths: List[StorePath]) -> Tuple[_ChunkResult, int]:
+    """
+    Read a chunk of items in a worker process. An item is re-read if its file changes
+    while it is being read, so the mtime hash returned is always for the content read.
+    """
+    results: _ChunkResult = []
+    retried = 0
+    for store_path in store_paths:
+        path = base_dir / store_path
+        try:
+            for attempt in range(MAX_READ_ATTEMPTS):
+                mtime_hash = file_mtime_hash(path)
+                item = parse_item(path, base_dir)
+                if file_mtime_hash(path) == mtime_hash:
+                    break
+                retried += 1
+            else:
+                # Still changing, so don't let it be cached.
+                mtime_hash = None
+            results.append((store_path, mtime_hash, item, None))
+        except FileNotFoundError:
+            pass  # Deleted during the scan.
+        except SkippableError as e:
+            results.append((store_path, None, None, str(e)))
+    return results, retried
+
+
+def _pool_context():
+    # Fork is unsafe with threads running, but spawn would re-import everything in
+    # each worker. A forkserver imports once and forks workers from that.
+    if sys.platform == "win32":
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def scan_items(
+    base_dir: Path,
+    store_paths: List[StorePath],
+    max_workers: Optional[int] = None,
+    min_parallel: int = PARALLEL_SCAN_MIN_ITEMS,
+    chunk_size: int = SCAN_CHUNK_SIZE,
+) -> ScanResult:
+    """
+    Read all the given items, in parallel if there are enough of them to be worth it,
+    adding them to the item cache as we go.
+    """
+    start_time = time.time()
+    result = ScanResult()
+    workers = min(max_workers or os.cpu_count() or 1, len(store_paths) // chunk_size + 1)
+
+    if workers <= 1 or len(store_paths) < min_parallel:
+        for store_path in store_paths:
+            try:
+                result.items.append((store_path, read_item(base_dir / store_path, base_dir)))
+            except FileNotFoundError:
+                pass
+            except SkippableError as e:
+                log.warning("Could not read file, skipping: %s: %s", store_path, e)
+                result.items.append((store_path, None))
+    else:
+        result.workers = workers
+        chunks = [store_paths[i : i + chunk_size] for i in range(0, len(store_paths), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as executor:
+            for chunk_results, retried in executor.map(partial(_read_chunk, base_dir), chunks):
+                result.retried += retried
+                for store_path, mtime_hash, item, error in chunk_results:
+                    if error:
+                        log.warning("Could not read file, skipping: %s: %s", store_path, error)
+                    elif item and mtime_hash:
+                        cache_item(base_dir / store_path, item, mtime_hash)
+                    result.items.append((store_path, item))
+
+    result.elapsed = time.time() - start_time
+    log.info("Scanned %s", result)
+    return result
+
+
+## Tests
+
+
+def test_scan_items():
+    import shutil
+
+    from kmd.file_formats.item_file_format import write_item
+    from kmd.model.file_formats_model import Format
+    from kmd.model.items_model import ItemType
+
+    base_dir = Path("tmp/test_scan_items").resolve()
+    shutil.rmtree(base_dir, ignore_errors=True)
+    (base_dir / "docs").mkdir(parents=True)
+
+    store_paths = []
+    for i in range(40):
+        store_path = StorePath(f"docs/doc_{i}.doc.md")
+        item = Item(ItemType.doc, title=f"Doc {i}", body=f"Body {i}.", format=Format.markdown)
+        write_item(item, base_dir / store_path)
+        store_paths.append(store_path)
+    # A file deleted before it's read is omitted.
+    store_paths.append(StorePath("docs/missing.doc.md"))
+
+    serial = scan_items(base_dir, store_paths)
+    assert serial.workers == 1
+    assert [p for p, _item in serial.items] == store_paths[:-1]
+
+    parallel = scan_items(base_dir, store_paths, max_workers=2, min_parallel=0)
+    assert parallel.workers == 1  # Too few items for more than one chunk.
+
+    # Smaller chunks to test the process pool.
+    parallel = scan_items(base_dir, store_paths, max_workers=2, min_parallel=0, chunk_size=10)
+    assert parallel.workers == 2
+    assert [(p, item and item.title) for p, item in parallel.items] == [
+        (p, item and item.title) for p, item in serial.items
+    ]
+    assert parallel.items_per_sec > 0
@@ -0,0 +1,258 @@
+"""
+Memoized precondition results, so finding the items that match a precondition (as on
+every completion) doesn't need to load and check every item in the workspace.
+"""
+
+import threading
+from collections import Counter, deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from kmd.config.logger import get_logger
+from kmd.model.args_model import fmt_loc
+from kmd.model.items_model import Item
+from kmd.model.paths_model import StorePath
+from kmd.model.preconditions_model import Precondition
+from kmd.util.strif import file_mtime_hash, hash_file
+
+log = get_logger(__name__)
+
+
+def _is_memoizable(precondition: Precondition) -> bool:
+    # Preconditions are identified by name, and lambdas all share one name.
+    return "<lambda>" not in precondition.name
+
+
+class PreconditionIndex:
+    """
+    Results of preconditions on items, memoized by a hash of the item's content (and
+    filename suffixes, since item type and format may come from the filename), so
+    results survive renames and reloads of unchanged items.
+
+    For each precondition queried, the set of matching paths is then kept current
+    incrementally: changed paths are rechecked on the next query and removed paths are
+    dropped. Changes are queued without taking the index lock, so store mutations never
+    wait on a slow query.
+    """
+
+    def __init__(self, base_dir: Path, load: Callable[[StorePath], Item]):
+        self.base_dir = base_dir
+        self.load = load
+        self._lock = threading.RLock()
+        self._changes: Deque[Tuple[Set[StorePath], Set[StorePath]]] = deque()
+
+        self.paths: Optional[Set[StorePath]] = None
+        """All item paths, or None if not yet synced with the store."""
+
+        # Path -> (mtime hash, content key) as of the last check.
+        self._keys: Dict[StorePath, Tuple[str, str]] = {}
+        self._key_refs: Counter[str] = Counter()
+        # Content key -> precondition name -> result.
+        self._results: Dict[str, Dict[str, bool]] = {}
+        # Precondition name -> matching paths, and paths still to (re)check.
+        self._matching: Dict[str, Set[StorePath]] = {}
+        self._pending: Dict[str, Set[StorePath]] = {}
+
+    def update(self, changed: Iterable[StorePath] = (), removed: Iterable[StorePath] = ()):
+        """
+        Record paths that were created or modified, and paths that were removed (which
+        may be directories). Safe to call from any thread while holding any lock.
+        """
+        self._changes.append((set(changed), set(removed)))
+
+    def sync(self, store_paths: Iterable[StorePath]) -> None:
+        """
+        Sync with a full listing of item paths, to catch any changes not reported via
+        `update()`. Paths already known are checked for changes by mtime.
+        """
+        with self._lock:
+            self._apply_changes()
+            current = set(store_paths)
+            known = self.paths or set()
+            changed = current - known
+            for store_path in current & set(self._keys):
+                try:
+                    if file_mtime_hash(self.base_dir / store_path) != self._keys[store_path][0]:
+                        changed.add(store_path)
+                except FileNotFoundError:
+                    current.discard(store_path)
+            self._remove(known - current)
+            self.paths = current
+            self._mark_changed(changed)
+
+    def matching(self, precondition: Precondition) -> Set[StorePath]:
+        """
+        All paths of items matching the precondition. Only items that changed since
+        the last query (or content not seen before) are loaded and checked.
+        """
+        with self._lock:
+            self._apply_changes()
+            paths = self.paths or set()
+            if precondition is Precondition.always:
+                return set(paths)
+            if not _is_memoizable(precondition):
+                return {p for p in paths if self._evaluate(precondition, p)}
+
+            name = precondition.name
+            if name not in self._matching:
+                self._matching[name] = set()
+                self._pending[name] = set(paths)
+            matching = self._matching[name]
+            pending = self._pending[name]
+            checked = len(pending)
+            while pending:
+                store_path = pending.pop()
+                if self.check(precondition, store_path):
+                    matching.add(store_path)
+            if checked:
+                log.info(
+                    "Checked precondition %s on %s items, %s match",
+                    precondition,
+                    checked,
+                    len(matching),
+                )
+            return set(matching)
+
+    def check(self, precondition: Precondition, store_path: StorePath) -> bool:
+        """
+        Check a precondition on a single item, using a memoized result if the item's
+        content was checked before.
+        """
+        if not _is_memoizable(precondition):
+            return self._evaluate(precondition, store_path)
+        with self._lock:
+            key = self._content_key(store_path)
+            if key is None:
+                return False
+            results = self._results.setdefault(key, {})
+            if precondition.name not in results:
+                results[precondition.name] = self._evaluate(precondition, store_path)
+            return results[precondition.name]
+
+    def _evaluate(self, precondition: Precondition, store_path: StorePath) -> bool:
+        try:
+            return precondition(self.load(store_path))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            log.info("Ignoring exception checking item %s: %s", fmt_loc(store_path), e)
+            return False
+
+    def _content_key(self, store_path: StorePath) -> Optional[str]:
+        full_path = self.base_dir / store_path
+        try:
+            mtime_hash = file_mtime_hash(full_path)
+            cached = self._keys.get(store_path)
+            if cached and cached[0] == mtime_hash:
+                return cached[1]
+            key = hash_file(full_path, algorithm="sha1").hex + "".join(Path(store_path).suffixes)
+        except FileNotFoundError:
+            return None
+        # Add the new reference first, in case the content is unchanged.
+        self._key_refs[key] += 1
+        self._forget_key(store_path)
+        self._keys[store_path] = (mtime_hash, key)
+        return key
+
+    def _forget_key(self, store_path: StorePath) -> None:
+        old = self._keys.pop(store_path, None)
+        if old:
+            key = old[1]
+            self._key_refs[key] -= 1
+            if self._key_refs[key] <= 0:
+                # No item has this content any more.
+                del self._key_refs[key]
+                self._results.pop(key, None)
+
+    def _apply_changes(self) -> None:
+        while self._changes:
+            changed, removed = self._changes.popleft()
+            if self.paths is None:
+                continue  # Everything is checked on the first sync anyway.
+            if removed:
+                removed_paths = {
+                    p
+                    for p in self.paths
+                    if any(p == r or Path(p).is_relative_to(r) for r in removed)
+                }
+                self._remove(removed_paths - changed)
+            self.paths.update(changed)
+            self._mark_changed(changed)
+
+    def _mark_changed(self, store_paths: Set[StorePath]) -> None:
+        # Content keys are rechecked by mtime when these paths are next checked.
+        for name, matching in self._matching.items():
+            matching.difference_update(store_paths)
+            self._pending[name].update(store_paths)
+
+    def _remove(self, store_paths: Set[StorePath]) -> None:
+        if self.paths is not None:
+            self.paths.difference_update(store_paths)
+        for store_path in store_paths:
+            self._forget_key(store_path)
+        for name, matching in self._matching.items():
+            matching.difference_update(store_paths)
+            self._pending[name].difference_update(store_paths)
+
+
+## Tests
+
+
+def test_precondition_index():
+    import shutil
+
+    from kmd.file_formats.item_file_format import read_item, write_item
+    from kmd.model.file_formats_model import Format
+    from kmd.model.items_model import ItemType
+
+    base_dir = Path("tmp/test_precondition_index").resolve()
+    shutil.rmtree(base_dir, ignore_errors=True)
+    (base_dir / "docs").mkdir(parents=True)
+
+    def write(name: str, body: str) -> StorePath:
+        store_path = StorePath(f"docs/{name}.doc.md")
+        item = Item(ItemType.doc, title=name, body=body, format=Format.markdown)
+        write_item(item, base_dir / store_path)
+        return store_path
+
+    loads: List[StorePath] = []
+
+    def load(store_path: StorePath) -> Item:
+        loads.append(store_path)
+        return read_item(base_dir / store_path, base_dir)
+
+    @Precondition
+    def mentions_cats(item: Item) -> bool:
+        return "cats" in (item.body or "")
+
+    a = write("a", "About cats.")
+    b = write("b", "About dogs.")
+    index = PreconditionIndex(base_dir, load)
+    index.sync([a, b])
+
+    assert index.matching(mentions_cats) == {a}
+    assert len(loads) == 2
+
+    # Memoized, so nothing is loaded again.
+    assert index.matching(mentions_cats) == {a}
+    assert index.check(mentions_cats, a)
+    assert len(loads) == 2
+
+    # Only changed items are rechecked.
+    write("b", "About cats and dogs.")
+    c = write("c", "About birds.")
+    index.update(changed=[b, c])
+    assert index.matching(mentions_cats) == {a, b}
+    assert sorted(loads[2:]) == [b, c]
+
+    # A copy with the same content reuses the memoized result.
+    shutil.copyfile(base_dir / a, base_dir / "docs/d.doc.md")
+    d = StorePath("docs/d.doc.md")
+    index.sync([a, b, c, d])
+    assert index.matching(mentions_cats) == {a, b, d}
+    assert len(loads) == 4
+
+    # Removed directories drop everything within them.
+    index.update(removed=[StorePath("docs")])
+    assert index.matching(mentions_cats) == set()
+    assert index.paths == set()
@@ -1,5 +1,6 @@
+from functools import cache
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 from kmd.config.logger import get_logger
 
@@ -10,7 +11,10 @@ from kmd.model.items_model import ItemType
 log = get_logger(__name__)
 
 
-_type_to_folder = {name: plural(name) for name, _value in ItemType.__members__.items()}
+@cache
+def _type_to_folder() -> Dict[str, str]:
+    # Not computed at import time, since pluralizing needs the (slow to import) inflect.
+    return {name: plural(name) for name, _value in ItemType.__members__.items()}
 
 
 def folder_for_type(item_type: ItemType) -> Path:
@@ -23,7 +27,7 @@ def folder_for_type(item_type: ItemType) -> Path:
     export -> exports
     etc.
     """
-    return Path(_type_to_folder[item_type.name])
+    return Path(_type_to_folder()[item_type.name])
 
 
 def join_suffix(base_slug: str, full_suffix: str) -> str:
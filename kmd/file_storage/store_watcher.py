@@ -0,0 +1,463 @@
+"""
+Watch a workspace directory for files changed outside of kmd (e.g. in an editor or by
+git), so caches and indexes can be updated incrementally instead of by a full reload.
+
+Uses inotify on Linux and falls back to polling file mtimes elsewhere.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from kmd.config.logger import get_logger
+from kmd.file_tools.file_walk import walk_by_dir
+from kmd.file_tools.ignore_files import IgnoreFilter
+from kmd.model.args_model import fmt_loc
+from kmd.model.paths_model import StorePath
+
+log = get_logger(__name__)
+
+
+ChangeHandler = Callable[[Set[StorePath], Set[StorePath]], None]
+"""
+Called with the paths of files that were changed or created, and paths that were removed.
+A removed path may be a directory, in which case everything within it was removed.
+"""
+
+MissedChangesHandler = Callable[[], None]
+"""
+Called if changes may have been missed, because events overflowed or the watcher stopped
+on an error, so everything needs to be checked again.
+"""
+
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Batch up events that arrive within this many seconds of each other.
+DEBOUNCE_SECS = 0.1
+
+
+class StoreWatcher(ABC):
+    """
+    Base class for a watcher running on a daemon thread. Subclasses implement `_run()`.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        is_ignored: IgnoreFilter,
+        on_changes: ChangeHandler,
+        on_missed: Optional[MissedChangesHandler] = None,
+    ):
+        self.base_dir = base_dir.resolve()
+        self.is_ignored = is_ignored
+        self.on_changes = on_changes
+        self.on_missed = on_missed
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "StoreWatcher":
+        self._thread = threading.Thread(target=self._run_safely, daemon=True)
+        self._thread.start()
+        log.info("Started %s on: %s", self.__class__.__name__, fmt_loc(self.base_dir))
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def is_running(self) -> bool:
+        return not self._stop.is_set()
+
+    def is_watched(self, path: Path) -> bool:
+        """
+        Whether changes to the file at this full path are being watched and will be
+        reported.
+        """
+        return (
+            self.is_running
+            and self._watches_dir(path.parent)
+            and self._store_path(path) is not None
+        )
+
+    def _watches_dir(self, dir_path: Path) -> bool:
+        return True
+
+    def _run_safely(self) -> None:
+        try:
+            self._run()
+        except Exception as e:
+            log.error("File watcher stopped on error: %s", e)
+            self._stop.set()
+            self._missed_changes()
+
+    @abstractmethod
+    def _run(self) -> None:
+        pass
+
+    def _store_path(self, path: Path, is_dir: bool = False) -> Optional[StorePath]:
+        """
+        The store path for a full path, or None if it's outside the store or ignored.
+        """
+        try:
+            rel_path = path.relative_to(self.base_dir)
+        except ValueError:
+            return None
+        if any(
+            self.is_ignored(
+                Path(*rel_path.parts[: i + 1]), is_dir=is_dir or i < len(rel_path.parts) - 1
+            )
+            for i in range(len(rel_path.parts))
+        ):
+            return None
+        return StorePath(rel_path)
+
+    def _notify(self, changed: Set[StorePath], removed: Set[StorePath]) -> None:
+        changed = changed - removed
+        if changed or removed:
+            log.info(
+                "Files changed outside kmd: %s changed, %s removed", len(changed), len(removed)
+            )
+            try:
+                self.on_changes(changed, removed)
+            except Exception as e:
+                log.error("Error handling file changes: %s", e)
+
+    def _missed_changes(self) -> None:
+        if self.on_missed:
+            try:
+                self.on_missed()
+            except Exception as e:
+                log.error("Error handling missed file changes: %s", e)
+
+
+class PollingWatcher(StoreWatcher):
+    """
+    Watch by periodically walking the store and comparing file mtimes and sizes.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        is_ignored: IgnoreFilter,
+        on_changes: ChangeHandler,
+        on_missed: Optional[MissedChangesHandler] = None,
+        interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        super().__init__(base_dir, is_ignored, on_changes, on_missed)
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+    def _watches_dir(self, dir_path: Path) -> bool:
+        # Changes are only seen on the next poll, so cached files still need mtime checks.
+        return False
+
+    def _take_snapshot(self) -> Dict[StorePath, Tuple[float, int]]:
+        snapshot: Dict[StorePath, Tuple[float, int]] = {}
+        for flist in walk_by_dir(self.base_dir, relative_to=self.base_dir, ignore=self.is_ignored):
+            for filename in flist.filenames:
+                store_path = StorePath(os.path.join(flist.parent_dir, filename))
+                try:
+                    stat = (self.base_dir / store_path).stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[store_path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def poll(self) -> None:
+        """
+        Check for changes once.
+        """
+        snapshot = self._take_snapshot()
+        changed = {p for p, stat in snapshot.items() if self._snapshot.get(p) != stat}
+        removed = set(self._snapshot) - set(snapshot)
+        self._snapshot = snapshot
+        self._notify(changed, removed)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+
+# Constants from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify() -> ctypes.CDLL:
+    libc_name = ctypes.util.find_library("c")
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    # Raises AttributeError if inotify isn't available (e.g. on macOS).
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class InotifyWatcher(StoreWatcher):
+    """
+    Watch all (non-ignored) directories of the store with inotify. Linux only.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        is_ignored: IgnoreFilter,
+        on_changes: ChangeHandler,
+        on_missed: Optional[MissedChangesHandler] = None,
+    ):
+        super().__init__(base_dir, is_ignored, on_changes, on_missed)
+        self._libc = _load_inotify()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, Path] = {}
+        # Directories with a live watch, since only changes within these are reported.
+        self._watched_dirs: Set[Path] = set()
+        self._watch_tree(self.base_dir)
+
+    def _add_watch(self, dir_path: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            log.warning(
+                "Could not watch directory %s: %s",
+                fmt_loc(dir_path),
+                os.strerror(ctypes.get_errno()),
+            )
+        else:
+            self._watches[wd] = dir_path
+            self._watched_dirs.add(dir_path)
+
+    def _watches_dir(self, dir_path: Path) -> bool:
+        return dir_path in self._watched_dirs
+
+    def _watch_tree(self, dir_path: Path) -> Set[StorePath]:
+        """
+        Watch a directory and all its subdirectories. Returns the files in it, since a
+        new directory may have been populated before we started watching it.
+        """
+        files: Set[StorePath] = set()
+        for flist in walk_by_dir(dir_path, relative_to=self.base_dir, ignore=self.is_ignored):
+            self._add_watch(self.base_dir / flist.parent_dir)
+            files.update(
+                StorePath(os.path.join(flist.parent_dir, name)) for name in flist.filenames
+            )
+        return files
+
+    def _read_events(self, changed: Set[StorePath], removed: Set[StorePath]) -> bool:
+        """
+        Read pending events into `changed` and `removed`. Returns True if events overflowed,
+        so some changes were missed.
+        """
+        overflowed = False
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return overflowed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                dir_path = self._watches.pop(wd, None)
+                if dir_path:
+                    self._watched_dirs.discard(dir_path)
+                continue
+            dir_path = self._watches.get(wd)
+            if not dir_path or not name:
+                continue
+
+            path = dir_path / os.fsdecode(name)
+            is_dir = bool(mask & IN_ISDIR)
+            store_path = self._store_path(path, is_dir=is_dir)
+            if not store_path:
+                continue
+
+            if is_dir:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.update(self._watch_tree(path))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    # Files within are reported individually if deleted, but not if moved.
+                    removed.add(store_path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                removed.add(store_path)
+                changed.discard(store_path)
+            elif mask & (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_TO):
+                changed.add(store_path)
+                removed.discard(store_path)
+
+        return overflowed
+
+    def _run(self) -> None:
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        try:
+            while not self._stop.is_set():
+                if not poller.poll(500):
+                    continue
+                changed: Set[StorePath] = set()
+                removed: Set[StorePath] = set()
+                overflowed = False
+                # Collect events until things settle down a bit.
+                while poller.poll(int(DEBOUNCE_SECS * 1000)):
+                    overflowed = self._read_events(changed, removed) or overflowed
+                if overflowed:
+                    log.warning("File watch events overflowed, so checking all files again.")
+                    self._missed_changes()
+                else:
+                    self._notify(changed, removed)
+        finally:
+            os.close(self._fd)
+
+
+def watch_store(
+    base_dir: Path,
+    is_ignored: IgnoreFilter,
+    on_changes: ChangeHandler,
+    on_missed: Optional[MissedChangesHandler] = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> StoreWatcher:
+    """
+    Start watching the store at `base_dir`, using inotify if possible and otherwise polling.
+    """
+    try:
+        watcher: StoreWatcher = InotifyWatcher(base_dir, is_ignored, on_changes, on_missed)
+    except (OSError, AttributeError) as e:
+        log.info("inotify not available, polling for file changes instead: %s", e)
+        watcher = PollingWatcher(
+            base_dir, is_ignored, on_changes, on_missed, interval=poll_interval
+        )
+    return watcher.start()
+
+
+## Tests
+
+
+def _check_watcher(make_watcher: Callable[[Path, ChangeHandler], StoreWatcher], name: str):
+    import shutil
+    import time
+
+    base_dir = Path(f"tmp/test_store_watcher_{name}")
+    shutil.rmtree(base_dir, ignore_errors=True)
+    (base_dir / "docs").mkdir(parents=True)
+    (base_dir / "docs" / "a.doc.md").write_text("a")
+
+    all_changed: Set[StorePath] = set()
+    all_removed: Set[StorePath] = set()
+
+    def on_changes(changed: Set[StorePath], removed: Set[StorePath]):
+        all_changed.update(changed)
+        all_removed.update(removed)
+
+    def wait_for(condition: Callable[[], bool]) -> bool:
+        for _ in range(50):
+            if condition():
+                return True
+            time.sleep(0.1)
+        return False
+
+    watcher = make_watcher(base_dir, on_changes).start()
+    trusted = not isinstance(watcher, PollingWatcher)
+    try:
+        assert watcher.is_watched(watcher.base_dir / "docs" / "a.doc.md") == trusted
+        assert not watcher.is_watched(watcher.base_dir / "docs" / ".hidden.md")
+        time.sleep(0.2)
+        (base_dir / "docs" / "b.doc.md").write_text("b")
+        (base_dir / "docs" / ".hidden.md").write_text("ignored")
+        (base_dir / "notes").mkdir()
+        (base_dir / "notes" / "c.note.md").write_text("c")
+        os.unlink(base_dir / "docs" / "a.doc.md")
+
+        assert wait_for(
+            lambda: {StorePath("docs/b.doc.md"), StorePath("notes/c.note.md")} <= all_changed
+            and StorePath("docs/a.doc.md") in all_removed
+        ), (all_changed, all_removed)
+        assert StorePath("docs/.hidden.md") not in all_changed
+        assert watcher.is_watched(watcher.base_dir / "notes" / "c.note.md") == trusted
+    finally:
+        watcher.stop()
+    assert not watcher.is_watched(watcher.base_dir / "docs" / "b.doc.md")
+
+
+def test_polling_watcher():
+    from kmd.file_tools.ignore_files import is_ignored_default
+
+    _check_watcher(
+        lambda base_dir, on_changes: PollingWatcher(
+            base_dir, is_ignored_default, on_changes, interval=0.1
+        ),
+        "polling",
+    )
+
+
+def test_inotify_watcher():
+    from kmd.file_tools.ignore_files import is_ignored_default
+
+    try:
+        _load_inotify()
+    except AttributeError:
+        return  # Not on Linux.
+
+    _check_watcher(
+        lambda base_dir, on_changes: InotifyWatcher(base_dir, is_ignored_default, on_changes),
+        "inotify",
+    )
+
+    # Only directories with a live watch are trusted.
+    watcher = InotifyWatcher(Path("tmp/test_store_watcher_inotify"), is_ignored_default, print)
+    watcher._add_watch(watcher.base_dir / "missing")
+    assert not watcher.is_watched(watcher.base_dir / "missing" / "d.doc.md")
+    os.close(watcher._fd)
+
+
+def test_watcher_stopped_on_error():
+    from kmd.file_tools.ignore_files import is_ignored_default
+
+    class FailingWatcher(PollingWatcher):
+        def poll(self) -> None:
+            raise OSError("Simulated failure")
+
+    base_dir = Path("tmp/test_store_watcher_failing")
+    base_dir.mkdir(parents=True, exist_ok=True)
+    missed = threading.Event()
+    watcher = FailingWatcher(base_dir, is_ignored_default, print, missed.set, interval=0.01)
+    watcher.start()
+    assert missed.wait(5)
+    assert not watcher.is_running
+    assert not watcher.is_watched(watcher.base_dir / "a.doc.md")
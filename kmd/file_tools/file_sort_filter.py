@@ -1,10 +1,16 @@
+import csv
+import heapq
+import io
+import itertools
+import os
+from dataclasses import fields
 from datetime import datetime, timezone
 from enum import Enum
+from functools import total_ordering
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple
 
 import humanfriendly
-import pandas as pd
 from pydantic.dataclasses import dataclass
 
 from kmd.config.logger import get_logger
@@ -49,14 +55,34 @@ class FileInfo:
     type: FileType
 
 
+FILE_INFO_FIELDS = [field.name for field in fields(FileInfo)]
+
+
 def type_suffix(file_info: FileInfo) -> str:
     return "/" if file_info.type == FileType.dir else ""
 
 
-def get_file_info(file_path: Path, base_path: Path, follow_symlinks: bool = False) -> FileInfo:
-    stat = file_path.stat(follow_symlinks=follow_symlinks)
+def get_file_info(
+    file_path: Path,
+    base_path: Path,
+    follow_symlinks: bool = False,
+    entry: Optional[os.DirEntry] = None,
+) -> FileInfo:
+    """
+    Get info on a file. If we have a `DirEntry` from walking the directory, we use
+    its cached type and stat instead of checking the file again.
+    """
+    if entry:
+        stat = entry.stat(follow_symlinks=follow_symlinks)
+        is_dir = entry.is_dir()
+        # Walked paths are already absolute and resolved, except for symlinks.
+        full_path = os.path.realpath(entry.path) if entry.is_symlink() else entry.path
+    else:
+        stat = file_path.stat(follow_symlinks=follow_symlinks)
+        is_dir = file_path.is_dir()
+        full_path = str(file_path.resolve())
     return FileInfo(
-        path=str(file_path.resolve()),
+        path=full_path,
         relative_path=str(file_path.relative_to(base_path)),
         filename=file_path.name,
         suffix=file_path.suffix,
@@ -65,7 +91,7 @@ def get_file_info(file_path: Path, base_path: Path, follow_symlinks: bool = Fals
         accessed=datetime.fromtimestamp(stat.st_atime, tz=timezone.utc),
         created=datetime.fromtimestamp(stat.st_ctime, tz=timezone.utc),
         modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
-        type=FileType.dir if file_path.is_dir() else FileType.file,
+        type=FileType.dir if is_dir else FileType.file,
     )
 
 
@@ -98,9 +124,33 @@ class FileListing:
     size_matching: int
     since_timestamp: float
 
-    def as_dataframe(self) -> pd.DataFrame:
-        df = pd.DataFrame([file.__dict__ for file in self.files])
-        return df
+    @classmethod
+    def empty(cls, start_paths: List[Path], since_seconds: float = 0.0) -> "FileListing":
+        since_timestamp = (
+            datetime.now(timezone.utc).timestamp() - since_seconds if since_seconds else 0.0
+        )
+        return cls(
+            files=[],
+            start_paths=start_paths,
+            files_total=0,
+            files_matching=0,
+            files_ignored=0,
+            dirs_ignored=0,
+            files_skipped=0,
+            dirs_skipped=0,
+            size_total=0,
+            size_matching=0,
+            since_timestamp=since_timestamp,
+        )
+
+    def as_csv(self) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(FILE_INFO_FIELDS)
+        for info in self.files:
+            values = (getattr(info, field) for field in FILE_INFO_FIELDS)
+            writer.writerow(v.value if isinstance(v, Enum) else v for v in values)
+        return buffer.getvalue()
 
     @property
     def total_ignored(self) -> int:
@@ -111,45 +161,46 @@ class FileListing:
         return self.files_skipped + self.dirs_skipped
 
 
-def collect_files(
-    start_paths: List[Path],
+def _group_start_paths(start_paths: List[Path]) -> List[Path]:
+    """
+    Reorder start paths so files in the same directory are adjacent, in order of first
+    appearance, so they are walked (and their files yielded) together.
+    """
+    groups: Dict[Path, List[Path]] = {}
+    for path in start_paths:
+        groups.setdefault(path if path.is_dir() else path.parent, []).append(path)
+    return [path for paths in groups.values() for path in paths]
+
+
+def iter_files(
+    listing: FileListing,
     max_depth: int = -1,
     max_files_per_subdir: int = -1,
     max_files_total: int = -1,
     ignore: Optional[IgnoreFilter] = None,
-    since_seconds: float = 0.0,
     base_path: Optional[Path] = None,
     include_dirs: bool = False,
-) -> FileListing:
-    files_info: List[FileInfo] = []
-
-    for path in start_paths:
+) -> Generator[FileInfo, None, None]:
+    """
+    Walk the start paths of the listing and yield info on matching files as they are
+    found, updating the totals in the listing as we go (but not `listing.files`).
+    Files in the same directory are yielded together.
+    """
+    for path in listing.start_paths:
         if not path.exists():
             raise FileNotFound(f"Path not found: {fmt_loc(path)}")
 
-    since_timestamp = (
-        datetime.now(timezone.utc).timestamp() - since_seconds if since_seconds else 0.0
-    )
+    since_timestamp = listing.since_timestamp
     if since_timestamp:
         log.info(
-            "Collecting files modified in last %s seconds (since %s).",
-            since_seconds,
+            "Collecting files modified since %s.",
             datetime.fromtimestamp(since_timestamp),
         )
 
-    files_total = 0
-    size_total = 0
-    size_matching = 0
-
-    dirs_ignored = 0
-    files_ignored = 0
-    dirs_skipped = 0
-    files_skipped = 0
-
     if not base_path:
         base_path = Path(".")
 
-    for path in start_paths:
+    for path in _group_start_paths(listing.start_paths):
 
         log.debug("Walking folder: %s", fmt_loc(path))
 
@@ -166,44 +217,264 @@ def collect_files(
 
                 log.debug("Walking folder: %s: %s", fmt_loc(flist.parent_dir), flist.filenames)
 
-                files_ignored += flist.files_ignored
-                dirs_ignored += flist.dirs_ignored
-                files_skipped += flist.files_skipped
-                dirs_skipped += flist.dirs_skipped
+                listing.files_ignored += flist.files_ignored
+                listing.dirs_ignored += flist.dirs_ignored
+                listing.files_skipped += flist.files_skipped
+                listing.dirs_skipped += flist.dirs_skipped
 
                 dir_path = base_path / flist.parent_dir
 
                 if flist.dirnames:
                     for dirname in flist.dirnames:
-                        info = get_file_info(dir_path / dirname, base_path)
+                        info = get_file_info(
+                            dir_path / dirname, base_path, entry=flist.entries.get(dirname)
+                        )
 
                         if not since_timestamp or info.modified.timestamp() > since_timestamp:
-                            files_info.append(info)
+                            listing.files_matching += 1
+                            yield info
 
                 for filename in flist.filenames:
-                    info = get_file_info(dir_path / filename, base_path)
+                    info = get_file_info(
+                        dir_path / filename, base_path, entry=flist.entries.get(filename)
+                    )
 
-                    if not since_timestamp or info.modified.timestamp() > since_timestamp:
-                        files_info.append(info)
-                        size_matching += info.size
+                    listing.files_total += 1
+                    listing.size_total += info.size
 
-                    files_total += 1
-                    size_total += info.size
+                    if not since_timestamp or info.modified.timestamp() > since_timestamp:
+                        listing.files_matching += 1
+                        listing.size_matching += info.size
+                        yield info
 
         except FileNotFound as e:
             log.warning("File unexpectedly missing: %s", e)
             continue
 
-    return FileListing(
-        files=files_info,
-        start_paths=start_paths,
-        files_total=files_total,
-        files_matching=len(files_info),
-        files_ignored=files_ignored,
-        dirs_ignored=dirs_ignored,
-        files_skipped=files_skipped,
-        dirs_skipped=dirs_skipped,
-        size_total=size_total,
-        size_matching=size_matching,
-        since_timestamp=since_timestamp,
+
+def collect_files(
+    start_paths: List[Path],
+    max_depth: int = -1,
+    max_files_per_subdir: int = -1,
+    max_files_total: int = -1,
+    ignore: Optional[IgnoreFilter] = None,
+    since_seconds: float = 0.0,
+    base_path: Optional[Path] = None,
+    include_dirs: bool = False,
+) -> FileListing:
+    listing = FileListing.empty(start_paths, since_seconds)
+    listing.files = list(
+        iter_files(
+            listing,
+            max_depth=max_depth,
+            max_files_per_subdir=max_files_per_subdir,
+            max_files_total=max_files_total,
+            ignore=ignore,
+            base_path=base_path,
+            include_dirs=include_dirs,
+        )
     )
+    return listing
+
+
+@total_ordering
+class _Descending:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.value == other.value
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.value < self.value
+
+
+def file_sort_key(sort: SortOption, reverse: bool = False) -> Callable[[FileInfo], Any]:
+    """
+    Sort key for `FileInfo`, by the given field and then by filename (or by creation
+    time, if sorting by filename). Only the primary field is reversed.
+    """
+    primary = sort.value
+    secondary = "filename" if primary != "filename" else "created"
+
+    def key(info: FileInfo) -> Any:
+        value = getattr(info, primary)
+        return (_Descending(value) if reverse else value, getattr(info, secondary))
+
+    return key
+
+
+class TopFiles:
+    """
+    Keep the first `limit` files in sort order (or in the order seen, if there is no
+    sort key) and a count of all files, in memory proportional to `limit`.
+    """
+
+    def __init__(self, key: Optional[Callable[[FileInfo], Any]], limit: int):
+        self.key = key
+        self.limit = limit
+        self.count = 0
+        self._heap: List[Tuple[Any, int, FileInfo]] = []
+        self._files: List[FileInfo] = []
+
+    def add(self, info: FileInfo) -> None:
+        self.count += 1
+        if not self.key:
+            if self.limit <= 0 or len(self._files) < self.limit:
+                self._files.append(info)
+        elif self.limit <= 0:
+            self._files.append(info)
+        else:
+            # Max-heap on the key (via descending wrapper), so the worst kept file is on top.
+            entry = (_Descending(self.key(info)), -self.count, info)
+            if len(self._heap) < self.limit:
+                heapq.heappush(self._heap, entry)
+            elif entry > self._heap[0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def files(self) -> List[FileInfo]:
+        if not self.key:
+            return self._files
+        elif self.limit <= 0:
+            return sorted(self._files, key=self.key)
+        else:
+            return [info for _key, _seq, info in sorted(self._heap, reverse=True)]
+
+
+STREAM_CHUNK_SIZE = 100
+
+FileGroup = Tuple[Optional[str], List[FileInfo], Optional[int]]
+"""
+A group name (None if not grouped), the files to show, and the number of files in the
+group (None if not grouped, as then it is only known once the listing is complete).
+"""
+
+
+def group_files(
+    files: Iterable[FileInfo],
+    groupby: Optional[GroupByOption] = None,
+    sort: Optional[SortOption] = None,
+    reverse: bool = False,
+    max_per_group: int = 0,
+) -> Generator[FileGroup, None, None]:
+    """
+    Group, sort, and limit files from a stream, without holding more than a group (or
+    `max_per_group` files of each group) in memory. Groups by parent are yielded as
+    soon as each directory is walked, so files in the same directory must be adjacent,
+    as `iter_files()` yields them. Without grouping or sorting, files are yielded
+    in chunks as they are found.
+    """
+    key = file_sort_key(sort, reverse) if sort else None
+
+    if groupby == GroupByOption.parent:
+        for parent, group in itertools.groupby(files, key=lambda info: info.parent):
+            top = TopFiles(key, max_per_group)
+            for info in group:
+                top.add(info)
+            yield parent, top.files(), top.count
+    elif groupby == GroupByOption.suffix:
+        tops: Dict[str, TopFiles] = {}
+        for info in files:
+            if info.suffix not in tops:
+                tops[info.suffix] = TopFiles(key, max_per_group)
+            tops[info.suffix].add(info)
+        for suffix in sorted(tops):
+            yield suffix, tops[suffix].files(), tops[suffix].count
+    elif key:
+        top = TopFiles(key, max_per_group)
+        for info in files:
+            top.add(info)
+        yield None, top.files(), None
+    else:
+        it = iter(files)
+        remaining = max_per_group if max_per_group > 0 else -1
+        while remaining != 0:
+            chunk_size = STREAM_CHUNK_SIZE if remaining < 0 else min(STREAM_CHUNK_SIZE, remaining)
+            chunk = list(itertools.islice(it, chunk_size))
+            if not chunk:
+                break
+            yield None, chunk, None
+            if remaining > 0:
+                remaining -= len(chunk)
+        # Finish the walk so the listing totals are complete.
+        for _ in it:
+            pass
+
+
+## Tests
+
+
+def test_group_files():
+    from datetime import timedelta
+
+    def info(parent: str, filename: str, size: int, age_days: int) -> FileInfo:
+        modified = datetime(2024, 1, 1, tzinfo=timezone.utc) - timedelta(days=age_days)
+        return FileInfo(
+            path=f"/base/{parent}/{filename}",
+            relative_path=f"{parent}/{filename}",
+            filename=filename,
+            suffix=Path(filename).suffix,
+            parent=parent,
+            size=size,
+            accessed=modified,
+            created=modified,
+            modified=modified,
+            type=FileType.file,
+        )
+
+    files = [
+        info("a", "x.md", 30, 3),
+        info("a", "y.txt", 10, 1),
+        info("a", "z.md", 20, 2),
+        info("b", "w.md", 40, 0),
+    ]
+
+    def names(groups: List[FileGroup]) -> List[Tuple[Optional[str], List[str], Optional[int]]]:
+        return [(name, [f.filename for f in shown], total) for name, shown, total in groups]
+
+    assert names(list(group_files(files, GroupByOption.parent, SortOption.size, False, 2))) == [
+        ("a", ["y.txt", "z.md"], 3),
+        ("b", ["w.md"], 1),
+    ]
+    assert names(list(group_files(files, GroupByOption.suffix, SortOption.modified, True))) == [
+        (".md", ["w.md", "z.md", "x.md"], 3),
+        (".txt", ["y.txt"], 1),
+    ]
+    assert names(list(group_files(files, None, SortOption.filename, True, 3))) == [
+        (None, ["z.md", "y.txt", "x.md"], None)
+    ]
+
+    # Unsorted, ungrouped files stream without consuming more than needed up front.
+    consumed = []
+
+    def stream():
+        for f in files:
+            consumed.append(f)
+            yield f
+
+    groups = group_files(stream(), max_per_group=2)
+    assert names([next(groups)]) == [(None, ["x.md", "y.txt"], None)]
+    assert len(consumed) == 2
+    assert list(groups) == []
+    assert len(consumed) == 4
+
+
+def test_iter_files_by_parent():
+    import shutil
+
+    base_dir = Path("tmp/test_iter_files_by_parent")
+    shutil.rmtree(base_dir, ignore_errors=True)
+    (base_dir / "d").mkdir(parents=True)
+    for name in ["a.txt", "b.txt", "d/c.txt"]:
+        (base_dir / name).write_text(name)
+
+    start_paths = [base_dir / "a.txt", base_dir / "d", base_dir / "b.txt"]
+    listing = FileListing.empty(start_paths, 0.0)
+    files = iter_files(listing, base_path=base_dir)
+    groups = [
+        (name, [f.filename for f in shown], total)
+        for name, shown, total in group_files(files, GroupByOption.parent)
+    ]
+    assert groups == [(".", ["a.txt", "b.txt"], 2), ("d", ["c.txt"], 1)]
@@ -1,8 +1,8 @@
 import os
-from dataclasses import dataclass
-from os.path import abspath, relpath
+from dataclasses import dataclass, field
+from os.path import relpath
 from pathlib import Path
-from typing import Generator, List, Optional
+from typing import Dict, Generator, List, Optional, Tuple
 
 from kmd.config.logger import get_logger
 from kmd.errors import FileNotFound
@@ -28,6 +28,32 @@ class FileList:
     files_skipped: int
     dirs_skipped: int
     num_files: int  # Total number of files in the directory before capping
+    entries: Dict[str, os.DirEntry] = field(default_factory=dict, repr=False, compare=False)
+    """
+    The `os.DirEntry` for each file and directory listed, so callers can use `stat()` on
+    these (which caches results) instead of a separate stat.
+    """
+
+
+def _scan_dir(dir_path: str) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """
+    List files and directories. Like `os.walk()`, symlinks to directories count as
+    directories.
+    """
+    files: List[os.DirEntry] = []
+    dirs: List[os.DirEntry] = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            (dirs if is_dir else files).append(entry)
+    return files, dirs
+
+
+def _entry_name(entry: os.DirEntry) -> str:
+    return entry.name
 
 
 def walk_by_dir(
@@ -40,10 +66,11 @@ def walk_by_dir(
     include_dirs: bool = False,
 ) -> Generator[FileList, None, None]:
     """
-    Simple wrapper around `os.walk`. Yields all files in each folder as a
-    `FileList`. Filenames are relative to `parent_dir`, which is relative to
-    `relative_to`. Handles sorting by name and skipping ignored files and
-    directories based on the `ignore` filter.
+    Walk a directory tree with `os.scandir`, top down in sorted order. Yields all
+    files in each folder as a `FileList`. Filenames are relative to `parent_dir`,
+    which is relative to `relative_to`. Ignored directories are pruned without being
+    listed. Ignore rules are checked against paths relative to `relative_to` (or to
+    `start_path` if it is outside `relative_to`).
 
     :param max_depth: Maximum depth to recurse into directories. -1 means no limit.
     :param max_files_per_subdir: Maximum number of files to yield per subdirectory.
@@ -75,81 +102,144 @@ def walk_by_dir(
         )
         return
 
-    files_so_far = 0
-    for dirname, dirnames, filenames in os.walk(start_path):
-        current_depth = len(Path(dirname).relative_to(start_path).parts)
+    if relative_to and start_path.is_relative_to(relative_to):
+        match_root = str(relative_to)
+    else:
+        match_root = str(start_path)
 
-        dirnames_copy = dirnames
+    files_so_far = 0
+    stack: List[Tuple[str, int]] = [(str(start_path), 0)]
+    while stack:
+        dirname, current_depth = stack.pop()
+        try:
+            file_entries, dir_entries = _scan_dir(dirname)
+        except OSError as e:
+            log.info("Skipping directory that can't be listed: %s: %s", fmt_loc(dirname), e)
+            continue
 
         # Handle max_depth, truncating recursion if needed.
         if max_depth >= 0 and current_depth >= max_depth:
-            dirnames[:] = []
+            dir_entries = []
 
         # Original counts.
-        num_dirs = len(dirnames)
-        num_files = len(filenames)
+        num_dirs = len(dir_entries)
+        num_files = len(file_entries)
 
-        # Filter out ignored directories.
+        rel_dir = relpath(dirname, match_root)
+        prefix = "" if rel_dir == "." else rel_dir.replace(os.sep, "/") + "/"
+
+        # Filter out ignored directories, so we never list them.
         if ignore:
-            # Careful: ignore("foo") is false even if "foo/" is ignored.
-            dirnames[:] = [d for d in dirnames if not ignore(d, is_dir=True)]
-            dirs_ignored = num_dirs - len(dirnames)
+            dir_entries = [d for d in dir_entries if not ignore(prefix + d.name, is_dir=True)]
+            dirs_ignored = num_dirs - len(dir_entries)
         else:
             dirs_ignored = 0
 
         # Sort directories and files.
         # TODO: Custom sort function so walk can prioritize by other criteria.
-        dirnames.sort()
-        filenames.sort()
+        dir_entries.sort(key=_entry_name)
+        file_entries.sort(key=_entry_name)
 
         # Filter out ignored files.
         if ignore:
-            filenames = [
-                f for f in filenames if not ignore(f) and not ignore(os.path.join(dirname, f))
-            ]
-            files_ignored = num_files - len(filenames)
+            file_entries = [f for f in file_entries if not ignore(prefix + f.name)]
+            files_ignored = num_files - len(file_entries)
         else:
             files_ignored = 0
 
         # Now cap number of files.
-        num_files_uncapped = num_files_capped = len(filenames)
-        num_dirs_uncapped = num_dirs_capped = len(dirnames)
+        num_files_uncapped = num_files_capped = len(file_entries)
+        num_dirs_uncapped = num_dirs_capped = len(dir_entries)
 
         # Apply max_files_per_subdir (but not at the top level, since that's confusing).
-        at_top_level = dirname == str(start_path)
+        at_top_level = current_depth == 0
         if max_files_per_subdir > 0 and not at_top_level:
-            filenames = filenames[:max_files_per_subdir]
+            file_entries = file_entries[:max_files_per_subdir]
 
         # Apply max_files limit
         if max_files_total > 0:
             files_remaining = max_files_total - files_so_far
             if files_remaining <= 0:
                 # Stop traversal
-                dirnames[:] = []
-                num_dirs_capped = 0
                 break
             if num_files_capped > files_remaining:
-                filenames = filenames[:files_remaining]
-                num_files_capped = len(filenames)
+                file_entries = file_entries[:files_remaining]
+                num_files_capped = len(file_entries)
 
         files_so_far += num_files_capped
 
-        parent_dir = relpath(abspath(dirname), relative_to) if relative_to else dirname
+        parent_dir = relpath(dirname, relative_to) if relative_to else dirname
 
         should_include_dirs = include_dirs and current_depth <= max_depth
 
+        entries = {e.name: e for e in file_entries}
+        if should_include_dirs:
+            entries.update((e.name, e) for e in dir_entries)
+
         yield FileList(
             parent_dir,
-            filenames,
-            dirnames_copy if should_include_dirs else None,
+            [e.name for e in file_entries],
+            [e.name for e in dir_entries] if should_include_dirs else None,
             files_ignored,
             dirs_ignored,
             files_skipped=num_files_uncapped - num_files_capped,
             dirs_skipped=num_dirs_uncapped - num_dirs_capped,
             num_files=num_files,
+            entries=entries,
         )
 
         # Check if max_files limit is reached after adding files
         if max_files_total > 0 and files_so_far >= max_files_total:
-            dirnames[:] = []
             break
+
+        # Descend in sorted order. Like `os.walk()`, don't follow symlinks to directories.
+        stack.extend(
+            (d.path, current_depth + 1) for d in reversed(dir_entries) if not d.is_symlink()
+        )
+
+
+## Tests
+
+
+def test_walk_by_dir():
+    import shutil
+
+    from kmd.file_tools.ignore_files import is_ignored_default
+
+    base_dir = Path("tmp/test_walk_by_dir")
+    shutil.rmtree(base_dir, ignore_errors=True)
+    for path in [
+        "b.txt",
+        "a.txt",
+        ".hidden.txt",
+        "docs/c.md",
+        "docs/sub/d.md",
+        "docs/__pycache__/e.pyc",
+        "node_modules/pkg/f.js",
+        "z/g.txt",
+    ]:
+        (base_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (base_dir / path).write_text(path)
+
+    flists = list(walk_by_dir(base_dir, relative_to=base_dir, ignore=is_ignored_default))
+    assert [(f.parent_dir, f.filenames) for f in flists] == [
+        (".", ["a.txt", "b.txt"]),
+        ("docs", ["c.md"]),
+        ("docs/sub", ["d.md"]),
+        ("z", ["g.txt"]),
+    ]
+    assert flists[0].files_ignored == 1 and flists[0].dirs_ignored == 1
+    assert flists[1].dirs_ignored == 1
+    assert flists[0].entries["a.txt"].stat().st_size == len("a.txt")
+
+    # Ignore rules are relative to `relative_to`, even when walking a subdirectory.
+    sub_flists = list(
+        walk_by_dir(base_dir / "docs", relative_to=base_dir, ignore=is_ignored_default)
+    )
+    assert [f.parent_dir for f in sub_flists] == ["docs", "docs/sub"]
+
+    capped = list(walk_by_dir(base_dir, relative_to=base_dir, max_files_total=3))
+    assert sum(len(f.filenames) for f in capped) == 3
+
+    shallow = list(walk_by_dir(base_dir, relative_to=base_dir, max_depth=0, include_dirs=True))
+    assert len(shallow) == 1 and shallow[0].dirnames == []
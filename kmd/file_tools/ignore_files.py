@@ -1,3 +1,5 @@
+import os
+import re
 from pathlib import Path
 from typing import List, Protocol, Set
 
@@ -83,11 +85,30 @@ class IgnoreFilter(Protocol):
 
 
 class IgnoreChecker(IgnoreFilter):
+    """
+    Checks paths against gitignore-style patterns. All patterns are compiled into a
+    single regex, so each check is one match no matter how many patterns there are.
+    """
+
     def __init__(self, lines: List[str]):
-        from pathspec.gitignore import GitIgnoreSpec
+        from pathspec.patterns.gitwildmatch import GitWildMatchPattern
 
         self.lines = lines
-        self.spec = GitIgnoreSpec.from_lines(lines)
+
+        # Later patterns take precedence, so put them first, as the first alternative
+        # that matches wins. The group name tells us if it was an include or exclude.
+        alternatives: List[str] = []
+        self._is_ignore: List[bool] = []
+        for line in reversed(lines):
+            regex, include = GitWildMatchPattern.pattern_to_regex(line.rstrip("\n"))
+            if regex is None or include is None:
+                continue
+            # Named groups must be unique, so drop the ones pathspec uses internally.
+            regex = regex.replace("(?P<ps_d>", "(?:")
+            alternatives.append(f"(?P<p{len(self._is_ignore)}>{regex})")
+            self._is_ignore.append(include)
+
+        self._regex = re.compile("|".join(alternatives)) if alternatives else None
 
     @classmethod
     def from_file(cls, path: Path) -> "IgnoreChecker":
@@ -97,18 +118,31 @@ class IgnoreChecker(IgnoreFilter):
         log.info("Loading ignore file (%s lines): %s", len(lines), fmt_loc(path))
         return cls(lines)
 
+    def _match(self, path_str: str) -> bool:
+        assert self._regex
+        match = self._regex.match(path_str)
+        return bool(match and match.lastgroup and self._is_ignore[int(match.lastgroup[1:])])
+
     def matches(self, path: str | Path, *, is_dir: bool = False) -> bool:
+        if not self._regex:
+            return False
+
+        path_str = str(path)
+        if os.sep != "/":
+            path_str = path_str.replace(os.sep, "/")
+        if path_str.startswith("./"):
+            path_str = path_str[2:]
+        path_str = path_str.lstrip("/")
+
         # Don't match "."!
-        if Path(str(path)) == Path("."):
+        if not path_str or path_str == ".":
             return False
 
         # If it's a directory, make sure we check with a trailing slash to fit
         # gitignore rules.
-        patterns = [str(path)]
-        if is_dir and not str(path).endswith("/"):
-            patterns.append(str(path) + "/")
-
-        return any(self.spec.match_file(p) for p in patterns)
+        if self._match(path_str):
+            return True
+        return is_dir and not path_str.endswith("/") and self._match(path_str + "/")
 
     def __call__(self, path: str | Path, *, is_dir: bool = False) -> bool:
         return self.matches(path, is_dir=is_dir)
@@ -156,3 +190,45 @@ def add_to_ignore(path: Path, line: str) -> None:
 
     with path.open("a") as f:
         f.write(line.strip() + "\n")
+
+
+## Tests
+
+
+def test_ignore_checker():
+    from pathspec.gitignore import GitIgnoreSpec
+
+    lines = DEFAULT_IGNORE_PATTERNS.splitlines() + [
+        "/top_only.md",
+        "docs/**/*.log",
+        "*.md",
+        "!keep.md",
+    ]
+    checker = IgnoreChecker(lines)
+    spec = GitIgnoreSpec.from_lines(lines)
+
+    paths = [
+        "notes.txt",
+        ".hidden",
+        "docs/.hidden/file.txt",
+        "docs/file.pyc",
+        "build",
+        "src/build",
+        "src/build/out.txt",
+        "node_modules",
+        "top_only.md",
+        "docs/top_only.md",
+        "docs/a/b/c.log",
+        "c.log",
+        "readme.md",
+        "docs/keep.md",
+        "backup.txt~",
+    ]
+    for path in paths:
+        for is_dir in [False, True]:
+            expected = spec.match_file(path) or (is_dir and spec.match_file(path + "/"))
+            assert checker(path, is_dir=is_dir) == expected, (path, is_dir)
+
+    assert not checker(".")
+    assert checker("build", is_dir=True) and not checker("build")
+    assert not checker("docs/keep.md") and checker("docs/other.md")
@@ -1,8 +1,11 @@
 import json
+import threading
+import time
+from dataclasses import dataclass
 from enum import Enum
 from functools import cache
 from pathlib import Path
-from typing import Callable, Dict, List, Optional
+from typing import Callable, Dict, Hashable, List, Optional
 
 from pydantic import ValidationError
 
@@ -33,12 +36,34 @@ from kmd.shell_ui.shell_output import cprint, print_assistance
 from kmd.text_wrap.markdown_normalization import normalize_markdown
 from kmd.util.log_calls import log_calls
 from kmd.util.parse_shell_args import shell_unquote
+from kmd.util.strif import file_mtime_hash
 from kmd.util.type_utils import not_none
 from kmd.workspaces.workspaces import current_workspace, workspace_param_value
 
 
 log = get_logger(__name__)
 
+ASSISTANT_STATE_MAX_LINES = 200
+"""Max lines of output from each command included in the assistant's current state."""
+
+FILES_MAX_AGE = 60.0
+"""
+The file listing includes files that aren't store items (and so don't change the store's
+version, even if the workspace is watched), so the cached listing is only reused for
+this many seconds.
+"""
+
+
+@dataclass(frozen=True)
+class _StateSection:
+    key: Hashable
+    output: str
+    timestamp: float
+
+
+_state_sections: Dict[str, _StateSection] = {}
+_state_lock = threading.Lock()
+
 
 class AssistanceType(Enum):
     """
@@ -93,22 +118,59 @@ def assist_preamble(
     return preamble
 
 
-def _insert_output(func: Callable, name: str) -> str:
+def _insert_output(func: Callable, name: str, max_lines: int = ASSISTANT_STATE_MAX_LINES) -> str:
     with record_console() as console:
         try:
             func()
+            output = console.export_text()
         except (KmdRuntimeError, ValueError, FileNotFoundError) as e:
             log.info("Skipping assistant input for %s: %s", name, e)
             output = f"(No {name} available)"
 
-    output = console.export_text()
-    log.info("Including %s lines of output to assistant for %s", output.count("\n"), name)
+    lines = output.splitlines()
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"… ({len(lines) - max_lines} more lines)"]
+        output = "\n".join(lines) + "\n"
+    log.info("Including %s lines of output to assistant for %s", len(lines), name)
 
     return f"(output from command`{name}`:)\n\n{output}"
 
 
+def _cached_output(
+    func: Callable, name: str, key: Hashable, max_age: Optional[float] = None
+) -> str:
+    """
+    Output of a command for the assistant's current state, reusing the last output as
+    long as the key (which should change whenever the output would) is the same.
+    """
+    with _state_lock:
+        section = _state_sections.get(name)
+    if section and section.key == key:
+        if max_age is None or time.time() - section.timestamp < max_age:
+            log.info("Reusing assistant input for %s", name)
+            return section.output
+
+    # The key is from before running, so any change while running invalidates it.
+    section = _StateSection(key, _insert_output(func, name), time.time())
+    with _state_lock:
+        _state_sections[name] = section
+    return section.output
+
+
+def _file_key(path: Path) -> Optional[str]:
+    try:
+        return file_mtime_hash(path)
+    except FileNotFoundError:
+        return None
+
+
 @log_calls(level="warning", if_slower_than=0.5)
 def assist_current_state() -> Message:
+    """
+    The current state of the workspace, for the assistant. Each part is cached until
+    the store's items, the selection, or the command history change (and the file
+    listing for at most `FILES_MAX_AGE`), so this is fast even for large workspaces.
+    """
     from kmd.commands.workspace_commands import (
         applicable_actions,
         files,
@@ -134,6 +196,10 @@ def assist_current_state() -> Message:
 
     log.info("Assistant current workspace state: %s", ws_info)
 
+    history_key = (ws_base_dir, _file_key(ws_base_dir / ws.dirs.shell_history_yml))
+    selection_key = (ws_base_dir, id(ws.selections), ws.selections.version)
+    files_key = (Path.cwd(), ws_base_dir, ws.version)
+
     # FIXME: Add @-mentioned files into context.
 
     current_state_message = Message(
@@ -144,20 +210,20 @@ def assist_current_state() -> Message:
 
         The last few commands issued by the user are:
 
-        {_insert_output(lambda: history(max=30), "history")}
+        {_cached_output(lambda: history(max=30), "history", history_key)}
 
         The user's current selection is below:
 
-        {_insert_output(select, "selection")}
+        {_cached_output(select, "selection", selection_key)}
 
         The actions with preconditions that match this selection, so are available to run on the
         current selection, are below:
 
-        {_insert_output(applicable_actions, "applicable_actions")}
+        {_cached_output(applicable_actions, "applicable_actions", (selection_key, ws.version))}
 
         And here is an overview of the files in the current directory:
 
-        {_insert_output(lambda: files(brief=True), "files --brief")}
+        {_cached_output(lambda: files(brief=True), "files --brief", files_key, FILES_MAX_AGE)}
         """
     )
     log.info(
@@ -3,6 +3,7 @@ from typing import List, Optional
 from kmd.action_defs import look_up_action
 from kmd.commands.command_registry import CommandFunction, look_up_command
 from kmd.errors import InvalidInput, NoMatch
+from kmd.exec.action_manifest import ActionInfo
 from kmd.file_formats.chat_format import ChatHistory, ChatMessage, ChatRole
 from kmd.help.assistant import assist_preamble, assistance_unstructured
 from kmd.help.docstrings import parse_docstring
@@ -34,7 +35,7 @@ def _print_command_help(
     name: str,
     description: Optional[str] = None,
     param_info: Optional[List[Param]] = None,
-    precondition: Optional[Precondition] = None,
+    precondition: Optional[Precondition | str] = None,
     verbose: bool = True,
     is_action: bool = False,
 ):
@@ -109,10 +110,11 @@ def print_command_function_help(command: CommandFunction, verbose: bool = True):
     )
 
 
-def print_action_help(action: Action, verbose: bool = True):
+def print_action_help(action: Action | ActionInfo, verbose: bool = True):
     params: List[Param] = []
     if verbose:
-        params = list(action.params) + list(RUNTIME_ACTION_PARAMS.values())
+        action_params = action.param_list if isinstance(action, ActionInfo) else list(action.params)
+        params = action_params + list(RUNTIME_ACTION_PARAMS.values())
 
     _print_command_help(
         action.name,
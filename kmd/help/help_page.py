@@ -36,12 +36,12 @@ def print_builtin_commands_help() -> None:
 
 
 def print_actions_help(base_actions_only: bool = False) -> None:
-    from kmd.action_defs import load_all_actions
+    from kmd.action_defs import action_manifest, BASE_ACTIONS
     from kmd.help.command_help import print_action_help
 
-    actions = load_all_actions(base_only=base_actions_only)
-    for action in actions.values():
-        print_action_help(action, verbose=False)
+    for action_info in action_manifest().values():
+        if not base_actions_only or action_info.package == BASE_ACTIONS:
+            print_action_help(action_info, verbose=False)
 
 
 def quote_item(item: str) -> str:
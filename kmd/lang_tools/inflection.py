@@ -1,7 +1,5 @@
 from typing import List, Optional
 
-from inflect import engine
-
 from kmd.lang_tools.spacy_loader import nlp
 from kmd.text_docs.wordtoks import is_word
 from kmd.util.lazyobject import lazyobject
@@ -10,6 +8,9 @@ from kmd.util.log_calls import tally_calls
 
 @lazyobject
 def inflect():
+    # Slow to import, so only import when first used.
+    from inflect import engine
+
     return engine()
 
 
@@ -1,15 +1,19 @@
 from functools import cache
-
-import spacy
-from spacy.cli.download import download
-from spacy.language import Language
+from typing import TYPE_CHECKING
 
 from kmd.config.logger import get_logger
 
+if TYPE_CHECKING:
+    from spacy.language import Language
+
 log = get_logger(__name__)
 
 
-def spacy_download(model_name: str) -> Language:
+def spacy_download(model_name: str) -> "Language":
+    # Slow to import, so only import when a model is first needed.
+    import spacy
+    from spacy.cli.download import download
+
     try:
         return spacy.load(model_name)
     except OSError:
@@ -0,0 +1,244 @@
+"""
+Process-wide adaptive concurrency limits for LLM and embedding calls, one per model
+(and so per provider), shared by all actions.
+
+Limits adapt with AIMD (additive increase, multiplicative decrease), as in TCP
+congestion control: each successful call made at the limit raises it a little (by
+about one per `limit` calls) and a rate limit error (or a sudden rise in latency) cuts
+it, at most once per window of calls. Rate-limited calls are retried with backoff.
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, TypeVar
+
+from kmd.config.logger import get_logger
+from kmd.util.task_stack import check_cancelled
+from kmd.util.tracing import trace_span
+
+log = get_logger(__name__)
+
+
+LIMIT_INITIAL = 4
+LIMIT_MIN = 1
+LIMIT_MAX = 64
+
+DECREASE_FACTOR = 0.5
+"""Factor to cut the limit by on rate limit errors."""
+
+LATENCY_DECREASE_FACTOR = 0.9
+"""Factor to cut the limit by when latency is high."""
+
+LATENCY_HIGH_RATIO = 3.0
+"""
+Recent latency this many times the long-run average is taken as a sign of overload.
+(We compare averages, not individual calls, since latency varies a lot with output size.)
+"""
+
+LATENCY_MIN_SAMPLES = 10
+
+RATE_LIMIT_RETRIES = 6
+
+RETRY_DELAY = 1.0
+"""Base delay before retrying a rate-limited call, doubled on each retry."""
+
+
+T = TypeVar("T")
+
+
+def is_rate_limit_error(e: BaseException) -> bool:
+    """
+    Check for rate limit errors from LiteLLM (and underlying provider libraries) without
+    importing them.
+    """
+    return type(e).__name__ == "RateLimitError" or getattr(e, "status_code", None) == 429
+
+
+def _ewma(average: float, value: float, alpha: float) -> float:
+    return value if not average else (1 - alpha) * average + alpha * value
+
+
+@dataclass
+class LimiterStats:
+    limit: float
+    in_flight: int = 0
+    max_in_flight: int = 0
+    calls: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    retries: int = 0
+    decreases: int = 0
+    waits: int = 0
+    wait_time: float = 0.0
+    avg_latency: float = 0.0
+    """Moving average of recent successful call latency."""
+    baseline_latency: float = 0.0
+    """Slower moving average of successful call latency."""
+
+    def __str__(self) -> str:
+        return (
+            f"limit {self.limit:.1f}, {self.in_flight} in flight (max {self.max_in_flight}), "
+            f"{self.calls} calls, {self.errors} errors, {self.rate_limited} rate limited, "
+            f"{self.retries} retries, {self.waits} waits ({self.wait_time:.1f}s), "
+            f"latency {self.avg_latency:.2f}s (baseline {self.baseline_latency:.2f}s)"
+        )
+
+
+class AdaptiveLimiter:
+    """
+    Limits concurrent calls to one model, adjusting the limit with AIMD.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = LIMIT_INITIAL,
+        min_limit: float = LIMIT_MIN,
+        max_limit: float = LIMIT_MAX,
+        retries: int = RATE_LIMIT_RETRIES,
+        retry_delay: float = RETRY_DELAY,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.stats = LimiterStats(limit=initial_limit)
+
+        self._cond = threading.Condition()
+        # Calls started since the last decrease, so we decrease at most once per window.
+        self._since_decrease = 0
+
+    def _acquire(self) -> None:
+        stats = self.stats
+        with self._cond:
+            if stats.in_flight >= int(stats.limit):
+                stats.waits += 1
+                start = time.time()
+                self._cond.wait_for(lambda: stats.in_flight < int(stats.limit))
+                stats.wait_time += time.time() - start
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+            stats.calls += 1
+            self._since_decrease += 1
+
+    def _release(self, latency: float, rate_limited: bool, failed: bool) -> None:
+        stats = self.stats
+        with self._cond:
+            stats.in_flight -= 1
+            if rate_limited:
+                stats.rate_limited += 1
+                self._decrease(DECREASE_FACTOR, "rate limited")
+            elif failed:
+                stats.errors += 1
+            else:
+                stats.avg_latency = _ewma(stats.avg_latency, latency, 0.2)
+                stats.baseline_latency = _ewma(stats.baseline_latency, latency, 0.02)
+                if (
+                    stats.calls >= LATENCY_MIN_SAMPLES
+                    and stats.avg_latency > LATENCY_HIGH_RATIO * stats.baseline_latency
+                ):
+                    self._decrease(LATENCY_DECREASE_FACTOR, "high latency")
+                elif stats.in_flight + 1 >= int(stats.limit):
+                    # Only increase if we're using the current limit.
+                    stats.limit = min(self.max_limit, stats.limit + 1 / stats.limit)
+            self._cond.notify_all()
+
+    def _decrease(self, factor: float, reason: str) -> None:
+        stats = self.stats
+        # Calls already in flight were started at the old limit, so don't decrease again
+        # for their results.
+        if self._since_decrease < stats.limit:
+            return
+        self._since_decrease = 0
+        stats.decreases += 1
+        stats.limit = max(self.min_limit, stats.limit * factor)
+        log.info("Concurrency limit for %s now %.1f (%s)", self.name, stats.limit, reason)
+
+    def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Call `func` within the concurrency limit, retrying with backoff if rate limited.
+        """
+        for attempt in range(self.retries + 1):
+            check_cancelled()
+            self._acquire()
+            start = time.time()
+            try:
+                with trace_span(self.name, "llm", attempt=attempt + 1):
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                self._release(time.time() - start, rate_limited=rate_limited, failed=True)
+                if not rate_limited or attempt == self.retries:
+                    raise
+                delay = self.retry_delay * 2**attempt * random.uniform(0.5, 1.5)
+                log.warning(
+                    "Rate limited by %s, will retry in %.1fs (attempt %s/%s): %s",
+                    self.name,
+                    delay,
+                    attempt + 1,
+                    self.retries,
+                    e,
+                )
+                with self._cond:
+                    self.stats.retries += 1
+                time.sleep(delay)
+            else:
+                self._release(time.time() - start, rate_limited=False, failed=False)
+                return result
+
+        raise AssertionError("Unreachable")
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(model_name: str) -> AdaptiveLimiter:
+    """
+    The shared limiter for a model.
+    """
+    with _limiters_lock:
+        if model_name not in _limiters:
+            _limiters[model_name] = AdaptiveLimiter(model_name)
+        return _limiters[model_name]
+
+
+def limiter_stats() -> Dict[str, LimiterStats]:
+    with _limiters_lock:
+        return {name: limiter.stats for name, limiter in _limiters.items()}
+
+
+## Tests
+
+
+def test_adaptive_limiter():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from kmd.llms.mock_llm import mock_completion_call, set_mock_settings
+
+    # A simulated endpoint that rate limits beyond 6 concurrent calls.
+    set_mock_settings(latency=0.02, max_concurrent=6)
+    limiter = AdaptiveLimiter("mock/llm", initial_limit=2, retry_delay=0.01)
+    messages = [{"role": "user", "content": "Hello."}]
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = list(
+            executor.map(
+                lambda _: limiter.run(mock_completion_call, "mock/llm", messages), range(300)
+            )
+        )
+    set_mock_settings(latency=0.0, max_concurrent=0)
+
+    stats = limiter.stats
+    assert results == ["Hello."] * 300
+    assert stats.in_flight == 0
+    # It increased to use the capacity, hit the limit, and backed off.
+    assert stats.max_in_flight > 2
+    assert stats.rate_limited > 0 and stats.decreases > 0
+    assert stats.retries == stats.rate_limited
+    # Most calls went through without being rate limited.
+    assert stats.rate_limited < 0.2 * stats.calls
+    assert stats.limit <= 12
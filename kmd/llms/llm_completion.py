@@ -1,41 +1,155 @@
-from typing import cast, Dict, List, Optional, Type, Union
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import cast, Dict, List, Optional, Type, TYPE_CHECKING, Union
 
-import litellm
-from litellm.types.utils import Choices, Message as LiteLLMMessage, ModelResponse
 from pydantic import BaseModel
-from pydantic.dataclasses import dataclass
 from slugify import slugify
 
-from kmd.config.logger import get_logger
+from kmd.config.logger import get_logger, log_partial_dir
 from kmd.config.settings import LogLevel
 from kmd.errors import ApiResultError
+from kmd.exec.run_records import record_llm_call
 from kmd.file_formats.chat_format import ChatHistory, ChatMessage, ChatRole
+from kmd.llms.concurrency_limiter import limiter_for
 from kmd.llms.fuzzy_parsing import is_no_results
+from kmd.llms.mock_llm import is_mock_model, register_mock_provider
+from kmd.model.args_model import fmt_loc
 from kmd.model.language_models import LLM
 from kmd.model.messages_model import Message, MessageTemplate
 from kmd.util.log_calls import log_calls
+from kmd.util.task_stack import task_stack
 
+if TYPE_CHECKING:
+    from litellm.types.utils import Message as LiteLLMMessage, ModelResponse
 
 log = get_logger(__name__)
 
 
+STREAM_PROGRESS_INTERVAL = 5.0
+"""Seconds between progress reports while streaming a completion."""
+
+
 @dataclass
 class LLMCompletionResult:
-    message: LiteLLMMessage
+    message: "LiteLLMMessage"
     content: str
 
 
+def _record_usage(model_name: str, llm_output: "ModelResponse", latency: float) -> None:
+    import litellm
+
+    usage = getattr(llm_output, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cost = 0.0
+    if not is_mock_model(model_name):
+        try:
+            cost = litellm.completion_cost(completion_response=llm_output, model=model_name)
+        except Exception as e:
+            log.info("Could not get cost of LLM completion from %s: %s", model_name, e)
+    record_llm_call(model_name, prompt_tokens, completion_tokens, cost, latency)
+
+
+def _report_stream_progress(model_name: str, chunks: int, chars: int, elapsed: float) -> None:
+    progress = f"{model_name}: {chunks} chunks, {chars} chars, {chunks / elapsed:.0f} chunks/s"
+    if task_stack().stack:
+        task_stack().set_progress(progress)
+    else:
+        log.message("Streaming LLM output from %s", progress)
+
+
+def _stream_completion(
+    model_name: str, messages: List[Dict[str, str]], **kwargs
+) -> "ModelResponse":
+    """
+    Stream a completion, reporting progress and writing output to a partial output file
+    as it arrives. The file is removed once the completion is done (the full response is
+    saved as usual), but kept if the completion is interrupted, so received output isn't
+    lost.
+    """
+    import litellm
+
+    partial_dir = log_partial_dir()
+    partial_dir.mkdir(parents=True, exist_ok=True)
+    fd, partial_path = tempfile.mkstemp(
+        prefix=f"llm_stream.{slugify(model_name, separator='_')}.",
+        suffix=".partial.txt",
+        dir=partial_dir,
+    )
+
+    stream_chunks = []
+    num_chunks = num_chars = 0
+    start_time = last_report = time.time()
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            response = litellm.completion(
+                model_name,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs,
+            )
+            for chunk in response:
+                stream_chunks.append(chunk)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                f.write(delta)
+                f.flush()
+                num_chunks += 1
+                num_chars += len(delta)
+
+                now = time.time()
+                if num_chunks == 1:
+                    log.message(
+                        "Streaming LLM output from %s (first output after %.1fs) to: %s",
+                        model_name,
+                        now - start_time,
+                        fmt_loc(partial_path),
+                    )
+                if now - last_report >= STREAM_PROGRESS_INTERVAL:
+                    last_report = now
+                    _report_stream_progress(model_name, num_chunks, num_chars, now - start_time)
+    except BaseException:
+        if num_chars:
+            log.warning(
+                "LLM completion from %s interrupted after %s chars, partial output kept: %s",
+                model_name,
+                num_chars,
+                fmt_loc(partial_path),
+            )
+        else:
+            os.unlink(partial_path)
+        raise
+
+    os.unlink(partial_path)
+    if last_report > start_time and task_stack().stack:
+        task_stack().current_task.progress = ""
+
+    llm_output = litellm.stream_chunk_builder(stream_chunks, messages=messages)
+    if not llm_output:
+        raise ApiResultError(f"LLM completion failed: {model_name}: no output")
+    return cast("ModelResponse", llm_output)
+
+
 @log_calls(level="info")
 def llm_completion(
     model: LLM,
     messages: List[Dict[str, str]],
     save_objects: bool = True,
     response_format: Optional[Union[dict, Type[BaseModel]]] = None,
+    stream: bool = False,
     **kwargs,
 ) -> LLMCompletionResult:
     """
-    Perform an LLM completion with LiteLLM.
+    Perform an LLM completion with LiteLLM. With `stream`, output is streamed, so
+    progress is reported and partial output is saved as it arrives.
     """
+    # Slow to import, so only import when first used.
+    import litellm
+    from litellm.types.utils import Choices, ModelResponse
 
     chat_history = ChatHistory.from_dicts(messages)
     log.info("LLM completion from %s on %s", model, chat_history.size_summary())
@@ -46,16 +160,31 @@ def llm_completion(
     # )
 
     model_name = model if isinstance(model, str) else model.value
+    if is_mock_model(model_name):
+        register_mock_provider()
 
-    llm_output = cast(
-        ModelResponse,
-        litellm.completion(
-            model_name,
-            messages=messages,
-            response_format=response_format,
-            **kwargs,
-        ),  # type: ignore
-    )
+    start_time = time.time()
+    try:
+        # All calls go through a shared limiter for the model, to adapt to rate limits.
+        if stream:
+            llm_output = limiter_for(model_name).run(
+                _stream_completion, model_name, messages, response_format=response_format, **kwargs
+            )
+        else:
+            llm_output = cast(
+                ModelResponse,
+                limiter_for(model_name).run(
+                    litellm.completion,
+                    model_name,
+                    messages=messages,
+                    response_format=response_format,
+                    **kwargs,
+                ),  # type: ignore
+            )
+    except Exception as e:
+        record_llm_call(model_name, 0, 0, 0.0, time.time() - start_time, error=type(e).__name__)
+        raise
+    _record_usage(model_name, llm_output, time.time() - start_time)
 
     choices = cast(Choices, llm_output.choices[0])
 
@@ -94,6 +223,7 @@ def llm_template_completion(
     save_objects: bool = True,
     check_no_results: bool = True,
     response_format: Optional[Union[dict, Type[BaseModel]]] = None,
+    stream: bool = False,
     **kwargs,
 ) -> LLMCompletionResult:
     """
@@ -117,6 +247,7 @@ def llm_template_completion(
         ],
         save_objects=save_objects,
         response_format=response_format,
+        stream=stream,
         **kwargs,
     )
 
@@ -125,3 +256,24 @@ def llm_template_completion(
         result.content = ""
 
     return result
+
+
+## Tests
+
+
+def test_stream_completion():
+    from kmd.llms.mock_llm import set_mock_settings
+
+    messages = [{"role": "user", "content": "Some text to stream back, word by word."}]
+
+    def partial_files():
+        return set(log_partial_dir().glob("llm_stream.*.partial.txt"))
+
+    set_mock_settings(latency_per_token=0.001)
+    try:
+        before = partial_files()
+        result = llm_completion(LLM.mock, messages, save_objects=False, stream=True)
+        assert result.content == messages[0]["content"]
+        assert partial_files() == before
+    finally:
+        set_mock_settings(latency_per_token=0.0)
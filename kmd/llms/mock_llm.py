@@ -0,0 +1,300 @@
+"""
+A local mock LLM and embedding provider, for testing and benchmarking LLM-heavy
+actions offline. Select it like any other model, with `LLM.mock` or
+`EmbeddingModel.mock` (or any model name starting with `mock/`).
+
+Outputs are deterministic: completions echo the last user message (so transforms
+leave documents unchanged) and embeddings are derived from a hash of the text.
+Latency, token counts, errors, and rate limiting are configurable, with
+`set_mock_settings()` or with the `KMD_MOCK_LLM` environment variable, e.g.
+`KMD_MOCK_LLM="latency=0.5 error_rate=0.1 rate_limit_rate=0.05"`.
+"""
+
+import hashlib
+import os
+import random
+import re
+import struct
+import threading
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, Iterator, List, Optional
+
+from kmd.config.logger import get_logger
+from kmd.errors import InvalidInput
+from kmd.util.parse_key_vals import parse_key_value
+
+log = get_logger(__name__)
+
+MOCK_PROVIDER = "mock"
+
+MOCK_SETTINGS_ENV = "KMD_MOCK_LLM"
+
+MOCK_EMBEDDING_DIMENSIONS = 64
+
+
+@dataclass(frozen=True)
+class MockSettings:
+    latency: float = 0.0
+    """Seconds per call."""
+
+    latency_per_token: float = 0.0
+    """Additional seconds per output token."""
+
+    output_tokens: int = 0
+    """If set, output this many tokens (deterministic words) instead of echoing input."""
+
+    error_rate: float = 0.0
+    """Fraction of calls that fail with a server error."""
+
+    rate_limit_rate: float = 0.0
+    """Fraction of calls that fail with a rate limit error."""
+
+    max_concurrent: int = 0
+    """If set, calls beyond this many at once fail with a rate limit error."""
+
+    seed: int = 0
+    """Seed for which calls fail, so failures are reproducible."""
+
+    @classmethod
+    def parse(cls, settings_str: str) -> "MockSettings":
+        """
+        Parse settings like `latency=0.5 error_rate=0.1`.
+        """
+        types = {f.name: f.type for f in fields(cls)}
+        values: Dict[str, Any] = {}
+        for key_value in settings_str.replace(",", " ").split():
+            key, value = parse_key_value(key_value)
+            if key not in types:
+                raise InvalidInput(f"Unknown mock LLM setting: {key!r}")
+            values[key] = types[key](value)
+        return cls(**values)
+
+
+_settings: Optional[MockSettings] = None
+_random = random.Random(0)
+_lock = threading.Lock()
+_in_flight = 0
+
+
+def mock_settings() -> MockSettings:
+    global _settings
+    if _settings is None:
+        set_mock_settings(MockSettings.parse(os.environ.get(MOCK_SETTINGS_ENV, "")))
+    return _settings  # type: ignore
+
+
+def set_mock_settings(settings: Optional[MockSettings] = None, **changes: Any) -> MockSettings:
+    """
+    Set mock provider settings (or change some of the current ones). Also resets the
+    sequence of simulated failures.
+    """
+    global _settings
+    with _lock:
+        _settings = replace(settings or _settings or MockSettings(), **changes)
+        _random.seed(_settings.seed)
+    return _settings
+
+
+def is_mock_model(model_name: str) -> bool:
+    return model_name.startswith(f"{MOCK_PROVIDER}/")
+
+
+def count_tokens(text: str) -> int:
+    """
+    A rough token count, at about 4 characters per token.
+    """
+    return max(1, len(text) // 4) if text else 0
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _words(seed_text: str, n: int) -> str:
+    rng = random.Random(_digest(seed_text))
+    vocab = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+    return " ".join(rng.choice(vocab) for _ in range(n))
+
+
+def _simulate_call(model_name: str, output_tokens: int) -> None:
+    """
+    Wait and maybe fail, as configured.
+    """
+    global _in_flight
+
+    settings = mock_settings()
+    with _lock:
+        roll = _random.random()
+        over_capacity = bool(settings.max_concurrent) and _in_flight >= settings.max_concurrent
+        _in_flight += 1
+
+    try:
+        if over_capacity or roll < settings.rate_limit_rate:
+            from litellm import RateLimitError
+
+            raise RateLimitError(
+                "Mock rate limit exceeded", llm_provider=MOCK_PROVIDER, model=model_name
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            from litellm import InternalServerError
+
+            raise InternalServerError(
+                "Mock server error", llm_provider=MOCK_PROVIDER, model=model_name
+            )
+
+        delay = settings.latency + settings.latency_per_token * output_tokens
+        if delay > 0:
+            time.sleep(delay)
+    finally:
+        with _lock:
+            _in_flight -= 1
+
+
+def mock_completion_call(model_name: str, messages: List[Dict[str, Any]]) -> str:
+    """
+    A simulated completion call (with latency and failures), without going through
+    LiteLLM's completion path.
+    """
+    content = mock_completion_text(messages)
+    _simulate_call(model_name, count_tokens(content))
+    return content
+
+
+def mock_completion_text(messages: List[Dict[str, Any]]) -> str:
+    """
+    The deterministic output for these messages.
+    """
+    user_messages = [str(m.get("content", "")) for m in messages if m.get("role") == "user"]
+    last_input = user_messages[-1] if user_messages else ""
+    output_tokens = mock_settings().output_tokens
+    if output_tokens:
+        return _words("".join(str(m) for m in messages), output_tokens)
+    return last_input
+
+
+def mock_embedding(model_name: str, texts: List[str]) -> List[List[float]]:
+    """
+    Deterministic unit-length embeddings derived from a hash of each text.
+    """
+    _simulate_call(model_name, 0)
+    embeddings = []
+    for text in texts:
+        data = b"".join(
+            _digest(f"{i}:{text}") for i in range(MOCK_EMBEDDING_DIMENSIONS * 2 // 32 + 1)
+        )
+        values = [v - 32768 for v in struct.unpack_from(f"<{MOCK_EMBEDDING_DIMENSIONS}H", data)]
+        norm = sum(v * v for v in values) ** 0.5 or 1.0
+        embeddings.append([v / norm for v in values])
+    return embeddings
+
+
+def register_mock_provider() -> None:
+    """
+    Register the mock provider with LiteLLM, so `mock/` models work for completions.
+    Only done when a mock model is used, to avoid importing LiteLLM otherwise.
+    """
+    import litellm
+    from litellm import CustomLLM, ModelResponse, Usage
+
+    if any(p["provider"] == MOCK_PROVIDER for p in litellm.custom_provider_map):
+        return
+
+    class MockLLM(CustomLLM):
+        def completion(self, model: str, messages: list, *args, **kwargs) -> ModelResponse:
+            content = mock_completion_text(messages)
+            prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in messages)
+            completion_tokens = count_tokens(content)
+            _simulate_call(model, completion_tokens)
+            return ModelResponse(
+                model=model,
+                choices=[{"message": {"role": "assistant", "content": content}}],
+                usage=Usage(
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    total_tokens=prompt_tokens + completion_tokens,
+                ),
+            )
+
+        def streaming(self, model: str, messages: list, *args, **kwargs) -> Iterator:
+            content = mock_completion_text(messages)
+            prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in messages)
+            _simulate_call(model, 0)
+            # Stream a word (with any whitespace before it) at a time.
+            pieces = re.findall(r"\s*\S+", content) or [""]
+            for i, piece in enumerate(pieces):
+                time.sleep(mock_settings().latency_per_token)
+                is_last = i == len(pieces) - 1
+                completion_tokens = count_tokens(content)
+                yield {
+                    "text": piece,
+                    "tool_use": None,
+                    "is_finished": is_last,
+                    "finish_reason": "stop" if is_last else "",
+                    "usage": (
+                        {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        }
+                        if is_last
+                        else None
+                    ),
+                    "index": 0,
+                }
+
+        async def acompletion(self, model: str, messages: list, *args, **kwargs):
+            return self.completion(model, messages, *args, **kwargs)
+
+    with _lock:
+        litellm.custom_provider_map = [
+            *litellm.custom_provider_map,
+            {"provider": MOCK_PROVIDER, "custom_handler": MockLLM()},
+        ]
+    log.info("Registered mock LLM provider: %s", mock_settings())
+
+
+## Tests
+
+
+def test_mock_llm():
+    import litellm
+
+    set_mock_settings(MockSettings())
+    register_mock_provider()
+    messages = [
+        {"role": "system", "content": "Be helpful."},
+        {"role": "user", "content": "Hello, world."},
+    ]
+    response = litellm.completion("mock/llm", messages=messages)
+    assert response.choices[0].message.content == "Hello, world."  # type: ignore
+    assert response.usage.completion_tokens == count_tokens("Hello, world.")  # type: ignore
+
+    set_mock_settings(output_tokens=5)
+    text = mock_completion_text(messages)
+    assert len(text.split()) == 5 and text == mock_completion_text(messages)
+
+    # Failures are reproducible for a given seed.
+    def outcomes() -> List[str]:
+        set_mock_settings(MockSettings(error_rate=0.3, rate_limit_rate=0.3, seed=7))
+        results = []
+        for _ in range(20):
+            try:
+                litellm.completion("mock/llm", messages=messages)
+                results.append("ok")
+            except litellm.RateLimitError:
+                results.append("rate_limit")
+            except litellm.InternalServerError:
+                results.append("error")
+        return results
+
+    first = outcomes()
+    assert first == outcomes()
+    assert {"ok", "rate_limit", "error"} <= set(first)
+
+    set_mock_settings(MockSettings())
+    [a, b, a2] = mock_embedding("mock/embedding", ["apples", "oranges", "apples"])
+    assert a == a2 and a != b and len(a) == MOCK_EMBEDDING_DIMENSIONS
+    assert abs(sum(v * v for v in a) - 1.0) < 1e-9
+
+    assert MockSettings.parse("latency=0.5, seed=3") == MockSettings(latency=0.5, seed=3)
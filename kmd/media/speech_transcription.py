@@ -1,16 +1,15 @@
 from os.path import getsize
 from pathlib import Path
-from typing import List, NamedTuple, Optional, Tuple
-
-from deepgram import ClientOptionsFromEnv, DeepgramClient, FileSource, PrerecordedOptions
-from httpx import Timeout
-from openai import OpenAI
+from typing import List, NamedTuple, Optional, Tuple, TYPE_CHECKING
 
 from kmd.config import setup
 from kmd.config.logger import get_logger
 from kmd.errors import ContentError
 from kmd.text_formatting.html_in_md import html_speaker_id_span, html_timestamp_span
 
+if TYPE_CHECKING:
+    from deepgram import FileSource
+
 log = get_logger(__name__)
 
 
@@ -21,6 +20,8 @@ def openai_whisper_transcribe_audio_small(audio_file_path: str) -> str:
 
     https://help.openai.com/en/articles/7031512-whisper-api-faq
     """
+    from openai import OpenAI
+
     WHISPER_MAX_SIZE = 25 * 1024 * 1024
 
     size = getsize(audio_file_path)
@@ -55,6 +56,8 @@ class SpeakerSegment(NamedTuple):
 
 def deepgram_transcribe_audio(audio_file_path: Path, language: Optional[str] = None) -> str:
     """Transcribe an audio file using Deepgram."""
+    from deepgram import ClientOptionsFromEnv, DeepgramClient, PrerecordedOptions
+    from httpx import Timeout
 
     size = getsize(audio_file_path)
     log.info(
@@ -67,7 +70,7 @@ def deepgram_transcribe_audio(audio_file_path: Path, language: Optional[str] = N
     with open(audio_file_path, "rb") as audio_file:
         buffer_data = audio_file.read()
 
-    payload: FileSource = {
+    payload: "FileSource" = {
         "buffer": buffer_data,
     }
 
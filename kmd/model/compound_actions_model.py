@@ -1,19 +1,29 @@
-from typing import Iterable, List, Optional, Tuple
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from pydantic.dataclasses import dataclass
 
 from kmd.config.logger import get_logger
-from kmd.errors import InvalidInput
+from kmd.errors import InvalidInput, nonfatal_exceptions
 from kmd.exec.combiners import Combiner
+from kmd.lang_tools.inflection import plural
 from kmd.model.actions_model import Action, ActionInput, ActionResult
 from kmd.model.items_model import Item, State
 from kmd.model.paths_model import StorePath
-from kmd.util.task_stack import task_stack
+from kmd.util.task_stack import task_stack, TaskStack
+from kmd.util.thread_utils import submit_in_context
 from kmd.util.type_utils import not_none
 
 log = get_logger(__name__)
 
 
+PIPELINE_MAX_WORKERS = 8
+"""
+Items processed at once in a pipelined sequence. LLM calls are also limited per model
+(see `kmd.llms.concurrency_limiter`), so this mostly bounds other work in progress.
+"""
+
+
 def look_up_actions(action_names: Iterable[str]) -> List[Action]:
     from kmd.action_defs import look_up_action
 
@@ -43,51 +53,33 @@ class SequenceAction(Action):
         self.description = seq_description
 
     def run(self, items: ActionInput) -> ActionResult:
-        from kmd.exec.action_exec import run_action
         from kmd.workspaces.workspaces import current_workspace
 
         with task_stack().context(
             self.name, total_parts=len(self.action_names), unit="sequence step"
         ) as ts:
-            look_up_actions(self.action_names)  # Validate action names.
+            actions = look_up_actions(self.action_names)  # Validate action names.
 
             log.message("Begin action sequence `%s`", self.name)
 
             original_input_paths = [not_none(item.store_path) for item in items]
             transient_outputs: List[Item] = []
 
-            for i, action_name in enumerate(self.action_names):
-
+            for first, last in _pipeline_stages(actions):
                 for item in items:
                     if not item.store_path:
                         raise InvalidInput("Item must have a store path: %s", item)
 
-                log.message(
-                    "Action sequence `%s` step %s/%s: `%s`",
-                    self.name,
-                    i + 1,
-                    len(self.action_names),
-                    action_name,
-                )
-
-                item_paths = [not_none(item.store_path) for item in items]
-
-                # Output of this action is transient if it's not the last action.
-                last_action = i == len(self.action_names) - 1
-                output_state = None if last_action else State.transient
-
-                # Run this action.
-                result = run_action(action_name, *item_paths, override_state=output_state)
+                if actions[first].run_per_item and len(items) > 1:
+                    items, transient_items = self._run_pipelined(first, last, items)
+                else:
+                    items, transient_items = self._run_steps(first, last, items)
 
                 # Track transient items and archive them if all actions succeed.
-                for item in result.items:
-                    if item.state == State.transient:
-                        transient_outputs.append(item)
-
-                # Results are the input to the next action in the sequence.
-                items = result.items
+                transient_outputs.extend(transient_items)
 
-                ts.next()
+                for _ in range(first, last + 1):
+                    ts.next()
 
             # The final items should be derived from the original inputs.
             for item in items:
@@ -107,6 +99,115 @@ class SequenceAction(Action):
 
         return ActionResult(items)
 
+    def _run_steps(
+        self, first: int, last: int, items: List[Item], internal_call: bool = False
+    ) -> Tuple[List[Item], List[Item]]:
+        """
+        Run steps `first` through `last` of the sequence in order on the given items.
+        Returns the output items and any transient items.
+        """
+        from kmd.exec.action_exec import run_action
+
+        transient_items: List[Item] = []
+        for i in range(first, last + 1):
+            action_name = self.action_names[i]
+            log.message(
+                "Action sequence `%s` step %s/%s: `%s`",
+                self.name,
+                i + 1,
+                len(self.action_names),
+                action_name,
+            )
+
+            item_paths = [not_none(item.store_path) for item in items]
+
+            # Output of this action is transient if it's not the last action.
+            last_action = i == len(self.action_names) - 1
+            output_state = None if last_action else State.transient
+
+            # Run this action.
+            result = run_action(
+                action_name, *item_paths, override_state=output_state, internal_call=internal_call
+            )
+
+            transient_items.extend(item for item in result.items if item.state == State.transient)
+
+            # Results are the input to the next action in the sequence.
+            items = result.items
+
+        return items, transient_items
+
+    def _run_pipelined(
+        self, first: int, last: int, items: List[Item]
+    ) -> Tuple[List[Item], List[Item]]:
+        """
+        Run per-item steps `first` through `last` on each item concurrently, so each item
+        moves on to the next step as soon as it's done with the previous one. As with
+        other per-item actions, if an item fails, processing continues with the others.
+        """
+        stage_name = f"{self.name} steps {first + 1}-{last + 1}"
+        outputs: Dict[int, List[Item]] = {}
+        transient_items: List[Item] = []
+        errors: List[Exception] = []
+
+        with task_stack().context(stage_name, total_parts=len(items), unit="item") as ts:
+            with ThreadPoolExecutor(
+                max_workers=min(PIPELINE_MAX_WORKERS, len(items)),
+                thread_name_prefix="kmd-pipeline",
+            ) as executor:
+                futures = {
+                    # Run as internal calls, since concurrent runs shouldn't each change
+                    # the selection.
+                    submit_in_context(
+                        executor, self._run_steps, first, last, [item], internal_call=True
+                    ): i
+                    for i, item in enumerate(items)
+                }
+                try:
+                    for future in as_completed(futures):
+                        try:
+                            outputs[futures[future]], item_transients = future.result()
+                            transient_items.extend(item_transients)
+                            ts.next()
+                        except nonfatal_exceptions() as e:
+                            log.error(
+                                "Error processing item; continuing with others: %s: %s",
+                                e,
+                                items[futures[future]],
+                            )
+                            errors.append(e)
+                            ts.next(last_had_error=True)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        if errors:
+            log.error(
+                "%s %s occurred while processing items. See above!",
+                len(errors),
+                plural("error", len(errors)),
+            )
+        if not outputs:
+            raise errors[0]
+
+        return [item for i in sorted(outputs) for item in outputs[i]], transient_items
+
+
+def _pipeline_stages(actions: List[Action]) -> List[Tuple[int, int]]:
+    """
+    Group consecutive per-item steps into stages (as first and last step indices), since
+    they can be pipelined item by item. Other steps need all their inputs at once, so
+    they are stages of their own.
+    """
+    stages: List[Tuple[int, int]] = []
+    for i, action in enumerate(actions):
+        if stages and action.run_per_item and actions[stages[-1][1]].run_per_item:
+            stages[-1] = (stages[-1][0], i)
+        else:
+            stages.append((i, i))
+    return stages
+
 
 @dataclass
 class ComboAction(Action):
@@ -134,7 +235,6 @@ class ComboAction(Action):
         self.description = combo_description
 
     def run(self, items: ActionInput) -> ActionResult:
-        from kmd.exec.action_exec import run_action
         from kmd.exec.combiners import combine_as_paragraphs
 
         with task_stack().context(
@@ -149,23 +249,14 @@ class ComboAction(Action):
 
             item_paths = [not_none(item.store_path) for item in items]
 
-            results: List[ActionResult] = []
-
-            for i, action_name in enumerate(self.action_names):
-
-                log.message(
-                    "Action combo `%s` part %s/%s: %s",
-                    self.name,
-                    i + 1,
-                    len(self.action_names),
-                    action_name,
-                )
-
-                result = run_action(action_name, *item_paths, override_state=State.transient)
-
-                results.append(result)
+            log.message(
+                "Action combo `%s`: running %s actions concurrently: %s",
+                self.name,
+                len(self.action_names),
+                ", ".join(f"`{name}`" for name in self.action_names),
+            )
 
-                ts.next()
+            results = self._run_parts(item_paths, ts)
 
             combiner = self.combiner or combine_as_paragraphs
             combined_result = combiner(self, items, results)
@@ -179,3 +270,103 @@ class ComboAction(Action):
         log.debug("Combined result metadata: %s", combined_result.metadata())
 
         return ActionResult([combined_result])
+
+    def _run_parts(self, item_paths: List[StorePath], ts: TaskStack) -> List[ActionResult]:
+        """
+        Sub-actions are independent, so run them all at once. Returns their results in
+        the order of `action_names`.
+        """
+        with ThreadPoolExecutor(
+            max_workers=len(self.action_names), thread_name_prefix="kmd-combo"
+        ) as executor:
+            futures = [
+                submit_in_context(executor, self._run_part, action_name, item_paths)
+                for action_name in self.action_names
+            ]
+            for future in as_completed(futures):
+                ts.next(last_had_error=future.exception() is not None)
+
+        return [future.result() for future in futures]
+
+    def _run_part(self, action_name: str, item_paths: List[StorePath]) -> ActionResult:
+        from kmd.exec.action_exec import run_action
+
+        # Run as internal calls, since concurrent runs shouldn't each change the selection.
+        return run_action(
+            action_name, *item_paths, override_state=State.transient, internal_call=True
+        )
+
+
+## Tests
+
+
+def test_pipeline_stages():
+    from types import SimpleNamespace
+    from typing import cast
+
+    def steps(*per_item: bool) -> List[Action]:
+        return [cast(Action, SimpleNamespace(run_per_item=flag)) for flag in per_item]
+
+    assert _pipeline_stages(steps(True, True, False, True, True, True)) == [
+        (0, 1),
+        (2, 2),
+        (3, 5),
+    ]
+    assert _pipeline_stages(steps(False, False)) == [(0, 0), (1, 1)]
+    assert _pipeline_stages(steps(True)) == [(0, 0)]
+
+
+def test_run_pipelined():
+    import time
+
+    from kmd.model.items_model import ItemType
+
+    class StubSequence(SequenceAction):
+        def _run_steps(
+            self, first: int, last: int, items: List[Item], internal_call: bool = False
+        ) -> Tuple[List[Item], List[Item]]:
+            (item,) = items
+            if item.title == "bad":
+                raise InvalidInput("bad item")
+            # Later items finish first, so outputs must be put back in input order.
+            time.sleep(0.05 * (3 - int(not_none(item.title))))
+            output = Item(ItemType.doc, title=f"{item.title} done", store_path=item.store_path)
+            transient = Item(ItemType.doc, title=f"{item.title} step", state=State.transient)
+            return [output], [transient]
+
+    action = StubSequence(
+        name="stub_sequence", description="Stub.", action_names=("step1", "step2")
+    )
+
+    def doc(title: str) -> Item:
+        return Item(ItemType.doc, title=title, store_path=f"docs/{title}.doc.md")
+
+    outputs, transients = action._run_pipelined(0, 1, [doc("1"), doc("bad"), doc("2")])
+    assert [item.title for item in outputs] == ["1 done", "2 done"]
+    assert sorted(not_none(item.title) for item in transients) == ["1 step", "2 step"]
+
+    try:
+        action._run_pipelined(0, 1, [doc("bad"), doc("bad")])
+        assert False
+    except InvalidInput as e:
+        assert str(e) == "bad item"
+
+
+def test_combo_runs_concurrently():
+    import threading
+
+    from kmd.model.items_model import ItemType
+
+    parts = ("part1", "part2", "part3")
+    # Each part waits for all the others, so this only completes if they run at once.
+    barrier = threading.Barrier(len(parts), timeout=5)
+
+    class StubCombo(ComboAction):
+        def _run_part(self, action_name: str, item_paths: List[StorePath]) -> ActionResult:
+            barrier.wait()
+            return ActionResult([Item(ItemType.doc, title=action_name)])
+
+    action = StubCombo(name="stub_combo", description="Stub.", action_names=parts)
+    with task_stack().context(action.name, total_parts=len(parts)) as ts:
+        results = action._run_parts([StorePath("docs/a.doc.md")], ts)
+    assert [result.items[0].title for result in results] == list(parts)
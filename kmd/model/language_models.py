@@ -26,6 +26,9 @@ class LLM(Enum):
     groq_llama3_8b_8192 = "groq/llama3-8b-8192"
     groq_llama3_70b_8192 = "groq/llama3-70b-8192"
 
+    mock = "mock/llm"
+    """Local mock model, for offline testing. See `kmd.llms.mock_llm`."""
+
     def __str__(self):
         return self.value
 
@@ -40,6 +43,9 @@ class EmbeddingModel(Enum):
     text_embedding_3_large = "text-embedding-3-large"
     text_embedding_3_small = "text-embedding-3-small"
 
+    mock = "mock/embedding"
+    """Local mock model, for offline testing. See `kmd.llms.mock_llm`."""
+
 
 # These are the default models for various actions.
 # The user may override them with parameters.
@@ -178,6 +178,11 @@ RUNTIME_ACTION_PARAMS: Dict[str, Param] = {
         "Rerun an action that would otherwise be skipped because the output already exists.",
         type=bool,
     ),
+    "bg": Param(
+        "bg",
+        "Run the action as a background job, so the shell can be used while it runs.",
+        type=bool,
+    ),
 }
 
 USER_SETTABLE_PARAMS: Dict[str, Param] = {**GLOBAL_PARAMS, **COMMON_ACTION_PARAMS}
@@ -1,6 +1,6 @@
 import inspect
 from functools import cache
-from typing import List
+from typing import List, Optional
 
 from kmd.model.preconditions_model import Precondition
 
@@ -14,3 +14,42 @@ def all_preconditions() -> List[Precondition]:
         for _name, value in inspect.getmembers(precondition_defs)
         if isinstance(value, Precondition)
     ]
+
+
+@cache
+def precondition_by_name(name: str) -> Optional[Precondition]:
+    """
+    Look up a precondition by its displayed name (as in the action manifest), including
+    combinations like `is_text_doc & ~has_timestamps`. Returns None if any part isn't a
+    known precondition.
+    """
+    by_name = {p.name: p for p in all_preconditions()}
+    by_name[Precondition.always.name] = Precondition.always
+
+    def term(part: str) -> Precondition:
+        part = part.strip()
+        if part.startswith("~"):
+            return ~term(part[1:])
+        return by_name[part]
+
+    try:
+        return Precondition.or_all(
+            *(
+                Precondition.and_all(*(term(part) for part in alternative.split("&")))
+                for alternative in name.strip("`").split("|")
+            )
+        )
+    except KeyError:
+        return None
+
+
+## Tests
+
+
+def test_precondition_by_name():
+    from kmd.preconditions.precondition_defs import has_timestamps, is_text_doc
+
+    precondition = precondition_by_name(str(is_text_doc & ~has_timestamps))
+    assert precondition and str(precondition) == str(is_text_doc & ~has_timestamps)
+    assert precondition_by_name("`always`") is Precondition.always
+    assert precondition_by_name("`is_text_doc | no_such_precondition`") is None
@@ -27,7 +27,7 @@ def actions_matching_paths(
 
     def check_precondition(action: Action, store_path: StorePath) -> bool:
         if action.precondition:
-            return action.precondition(ws.load(store_path))
+            return ws.precondition_index.check(action.precondition, store_path)
         else:
             return include_no_precondition
 
@@ -36,17 +36,38 @@ def actions_matching_paths(
             yield action
 
 
+def paths_matching_precondition(ws: FileStore, precondition: Precondition) -> List[StorePath]:
+    """
+    Paths of all items matching the given precondition, in sorted order. Results are
+    memoized by item content, so only new or changed items are loaded and checked. If
+    the store isn't watching for file changes, the store is walked first to pick up
+    any files changed outside of kmd.
+    """
+    start_time = time.time()
+    index = ws.precondition_index
+    if not ws.is_watching or index.paths is None:
+        index.sync(ws.walk_items())
+    matching = sorted(index.matching(precondition))
+
+    duration = time.time() - start_time
+    if duration > 0.1:
+        log.info(
+            "Matched %s/%s items in %s",
+            len(matching),
+            len(index.paths or ()),
+            format_duration(duration),
+        )
+    return matching
+
+
 def items_matching_precondition(
     ws: FileStore, precondition: Precondition, max_results: int = 0
 ) -> Iterable[Item]:
     """
     Yield items matching the given precondition, up to max_results if specified.
     """
-    start_time = time.time()
     count = 0
-    files_checked = 0
-    for store_path in ws.walk_items():
-        files_checked += 1
+    for store_path in paths_matching_precondition(ws, precondition):
         if max_results > 0 and count >= max_results:
             break
         try:
@@ -56,16 +77,5 @@ def items_matching_precondition(
         except Exception as e:
             log.info("Ignoring exception loading item %s: %s", fmt_loc(store_path), e)
             continue
-        if precondition(item):
-            yield item
-            count += 1
-
-    duration = time.time() - start_time
-    if duration > 0.1:
-        log.info(
-            "Matched %s/%s items in %s (%s/s)",
-            count,
-            files_checked,
-            format_duration(duration),
-            int(files_checked / duration) if duration > 0 else 0,
-        )
+        yield item
+        count += 1
@@ -0,0 +1,293 @@
+"""
+Incremental rebuilds, like `make`: each derived item records the operation that made it,
+with hashes of its inputs, so we can tell which items are stale (an input has changed,
+or is itself stale) and recompute only those, in dependency order, running independent
+operations in parallel.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+from kmd.config.logger import get_logger
+from kmd.errors import InvalidOutput, nonfatal_exceptions, SkippableError
+from kmd.model.args_model import fmt_loc
+from kmd.model.items_model import State
+from kmd.model.operations_model import Operation, Source
+from kmd.model.params_model import ParamValues
+from kmd.model.paths_model import StorePath
+from kmd.util.thread_utils import submit_in_context
+
+log = get_logger(__name__)
+
+
+REBUILD_MAX_WORKERS = 4
+"""Operations to run at once. LLM calls are also limited per model."""
+
+
+@dataclass
+class RebuildJob:
+    """
+    An operation to run again, and the stale outputs it will replace.
+    """
+
+    operation: Operation
+    outputs: Dict[int, StorePath]
+    """Output number -> path of the stale item it replaces."""
+
+    reason: str
+    depends_on: Set[int] = field(default_factory=set)
+    """Indices of jobs that produce inputs of this one."""
+
+    def __str__(self) -> str:
+        return self.operation.command_line(with_options=True)
+
+
+@dataclass
+class RebuildPlan:
+    stale: Dict[StorePath, str]
+    """Stale items and why they are stale."""
+
+    missing: Dict[StorePath, StorePath]
+    """Items that can't be rebuilt -> an input that no longer exists."""
+
+    jobs: List[RebuildJob]
+
+
+@dataclass
+class RebuildResult:
+    rebuilt: List[StorePath] = field(default_factory=list)
+    failed: List[RebuildJob] = field(default_factory=list)
+    skipped: List[RebuildJob] = field(default_factory=list)
+    """Jobs not run because a job they depend on failed."""
+
+
+def plan_rebuild(
+    sources: Dict[StorePath, Source],
+    current_hash: Callable[[StorePath], Optional[str]],
+    targets: Optional[List[StorePath]] = None,
+) -> RebuildPlan:
+    """
+    Find stale items (among `targets` and everything upstream of them, or all items) and
+    group them into jobs. `sources` has the source of every derived item and
+    `current_hash` gives the hash of an item, or None if it doesn't exist.
+    """
+    stale: Dict[StorePath, str] = {}
+    missing: Dict[StorePath, StorePath] = {}
+    checked: Set[StorePath] = set()
+
+    def check(path: StorePath) -> bool:
+        if path in checked:
+            return path in stale
+        checked.add(path)  # Also guards against loops.
+        source = sources.get(path)
+        if not source:
+            return False
+        for input in source.operation.arguments:
+            input_hash = current_hash(input.path)
+            if input_hash is None:
+                missing[path] = input.path
+                stale.pop(path, None)
+                return False
+            if input.hash and input_hash != input.hash:
+                stale.setdefault(path, f"{fmt_loc(input.path)} changed")
+            elif check(input.path):
+                stale.setdefault(path, f"{fmt_loc(input.path)} is stale")
+        return path in stale
+
+    for path in targets if targets is not None else sources:
+        check(path)
+
+    # One job per operation, since one operation may have several stale outputs.
+    jobs_by_op: Dict[str, RebuildJob] = {}
+    for path, reason in stale.items():
+        source = sources[path]
+        key = source.operation.as_str()
+        if key not in jobs_by_op:
+            jobs_by_op[key] = RebuildJob(operation=source.operation, outputs={}, reason=reason)
+        jobs_by_op[key].outputs[source.output_num] = path
+    jobs = list(jobs_by_op.values())
+
+    producer = {path: i for i, job in enumerate(jobs) for path in job.outputs.values()}
+    for i, job in enumerate(jobs):
+        job.depends_on = {
+            producer[input.path]
+            for input in job.operation.arguments
+            if input.path in producer and producer[input.path] != i
+        }
+
+    return RebuildPlan(stale=stale, missing=missing, jobs=jobs)
+
+
+def run_jobs(
+    jobs: List[RebuildJob],
+    run_job: Callable[[RebuildJob], List[StorePath]],
+    max_workers: int = REBUILD_MAX_WORKERS,
+) -> RebuildResult:
+    """
+    Run each job once all jobs it depends on are done, with independent jobs in parallel.
+    Nonfatal errors fail just that job (and skip jobs depending on it).
+    """
+    result = RebuildResult()
+    remaining = {i: set(job.depends_on) for i, job in enumerate(jobs)}
+
+    def skip_dependents(failed_index: int) -> None:
+        for i, deps in list(remaining.items()):
+            if failed_index in deps:
+                del remaining[i]
+                result.skipped.append(jobs[i])
+                skip_dependents(i)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running: Dict[Future, int] = {}
+
+        def submit_ready() -> None:
+            for i, deps in list(remaining.items()):
+                if not deps:
+                    del remaining[i]
+                    running[submit_in_context(executor, run_job, jobs[i])] = i
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                try:
+                    result.rebuilt.extend(future.result())
+                except nonfatal_exceptions() as e:
+                    log.error("Could not rebuild with `%s`: %s", jobs[i], e)
+                    result.failed.append(jobs[i])
+                    skip_dependents(i)
+                except BaseException:
+                    for other in running:
+                        other.cancel()
+                    raise
+                for deps in remaining.values():
+                    deps.discard(i)
+            submit_ready()
+
+    return result
+
+
+def workspace_sources() -> Dict[StorePath, Source]:
+    """
+    Sources of all derived items in the current workspace that could be rebuilt.
+    """
+    from kmd.workspaces.workspaces import current_workspace
+
+    ws = current_workspace()
+    sources = {}
+    for store_path in ws.walk_items():
+        try:
+            item = ws.load(store_path)
+        except SkippableError:
+            continue
+        source = item.source
+        if (
+            source
+            and source.cacheable
+            and source.operation.arguments
+            and item.state != State.transient
+        ):
+            sources[store_path] = source
+    return sources
+
+
+def rebuild_job(job: RebuildJob) -> List[StorePath]:
+    """
+    Run a job's operation again and replace its stale outputs in place, archiving the
+    old versions, so paths (and items referring to them) stay the same. New outputs are
+    moved to the old paths.
+    """
+    from kmd.action_defs import look_up_action
+    from kmd.exec.action_exec import run_action
+    from kmd.workspaces.workspaces import current_workspace
+
+    ws = current_workspace()
+    operation = job.operation
+    action = look_up_action(operation.action_name).with_param_values(
+        ParamValues(dict(operation.options)), overwrite=True
+    )
+    args = [input.path.display_str() for input in operation.arguments]
+    log.message("Rebuilding (%s): %s", job.reason, operation.command_line())
+    result = run_action(action, *args, rerun=True, internal_call=True)
+
+    rebuilt = []
+    for output_num, old_path in sorted(job.outputs.items()):
+        if output_num >= len(result.items):
+            raise InvalidOutput(
+                f"Expected at least {output_num + 1} outputs from `{operation.action_name}` "
+                f"but got {len(result.items)}"
+            )
+        new_item = result.items[output_num]
+        if not new_item.store_path:
+            # Not saved, as it's the same as an existing item (with `skip_duplicates`), but
+            # save it anyway, with its new history.
+            ws.archive(old_path, missing_ok=True, quiet=True)
+            new_item.store_path = str(old_path)
+            ws.save(new_item)
+        elif StorePath(new_item.store_path) != old_path:
+            ws.archive(old_path, missing_ok=True, quiet=True)
+            ws.rename(StorePath(new_item.store_path), old_path)
+        rebuilt.append(old_path)
+    return rebuilt
+
+
+## Tests
+
+
+def test_plan_rebuild():
+    from kmd.model.operations_model import Input
+
+    def paths(*names: str) -> Set[StorePath]:
+        return {StorePath(name) for name in names}
+
+    def source(action: str, *inputs: str, output_num: int = 0) -> Source:
+        arguments = [Input(StorePath(p), hash=f"sha1:{p}") for p in inputs]
+        return Source(Operation(action, arguments, {}), output_num=output_num)
+
+    # a -> b -> c, a -> d1 and d2 (outputs of one operation), e -> f, and g (missing) -> h
+    sources = {
+        StorePath("b"): source("step", "a"),
+        StorePath("c"): source("step", "b"),
+        StorePath("d1"): source("split", "a", output_num=0),
+        StorePath("d2"): source("split", "a", output_num=1),
+        StorePath("f"): source("step", "e"),
+        StorePath("h"): source("step", "g"),
+    }
+    hashes = {p: f"sha1:{p}" for p in paths("a", "b", "c", "d1", "d2", "e", "f", "h")}
+    hashes[StorePath("a")] = "sha1:changed"
+
+    plan = plan_rebuild(sources, hashes.get)
+    assert set(plan.stale) == paths("b", "c", "d1", "d2")
+    assert plan.missing == {StorePath("h"): StorePath("g")}
+    ops = {str(job): job for job in plan.jobs}
+    assert set(ops) == {"step a", "step b", "split a"}
+    assert ops["split a"].outputs == {0: StorePath("d1"), 1: StorePath("d2")}
+    assert [plan.jobs[i] for i in ops["step b"].depends_on] == [ops["step a"]]
+    assert not ops["step a"].depends_on
+
+    plan = plan_rebuild(sources, hashes.get, targets=[StorePath("c"), StorePath("f")])
+    assert set(plan.stale) == paths("b", "c")
+
+    # Jobs run after their dependencies, and a failure skips its dependents.
+    order = []
+
+    def run_job(job: RebuildJob) -> List[StorePath]:
+        if str(job) == "split a":
+            raise InvalidOutput("failed")
+        order.append(str(job))
+        return list(job.outputs.values())
+
+    plan = plan_rebuild(sources, hashes.get)
+    result = run_jobs(plan.jobs, run_job)
+    assert order == ["step a", "step b"]
+    assert set(result.rebuilt) == paths("b", "c")
+    assert [str(job) for job in result.failed] == ["split a"]
+
+    jobs = plan.jobs
+    ops = {str(job): job for job in jobs}
+    ops["step a"].depends_on = {jobs.index(ops["split a"])}
+    result = run_jobs(jobs, run_job)
+    assert len(result.failed) == 1 and not result.rebuilt
+    assert sorted(str(job) for job in result.skipped) == ["step a", "step b"]
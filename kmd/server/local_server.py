@@ -16,7 +16,6 @@ from kmd.config.settings import (
     update_global_settings,
 )
 from kmd.errors import InvalidInput, InvalidState
-from kmd.server import local_server_routes
 from kmd.server.port_tools import find_available_local_port
 from kmd.util.format_utils import fmt_path
 
@@ -68,6 +67,8 @@ def _app_setup() -> "FastAPI":
     from fastapi import FastAPI, Request
     from fastapi.responses import JSONResponse
 
+    from kmd.server import local_server_routes
+
     app = FastAPI()
 
     app.include_router(local_server_routes.router)
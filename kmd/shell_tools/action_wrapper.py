@@ -1,18 +1,21 @@
 from typing import List
 
+from kmd.action_defs import look_up_action
 from kmd.config.logger import get_console, get_logger
 from kmd.config.text_styles import COLOR_ERROR, SPINNER
-
-from kmd.errors import NONFATAL_EXCEPTIONS
+from kmd.errors import InvalidInput, nonfatal_exceptions
 from kmd.exec.action_exec import run_action
+from kmd.exec.action_manifest import ActionInfo
+from kmd.exec.background_jobs import start_job
 from kmd.exec.history import record_command
+from kmd.exec.resolve_args import assemble_action_args
 from kmd.help.command_help import print_action_help
-from kmd.model.actions_model import Action
+from kmd.model.actions_model import Action, NO_ARGS
 from kmd.model.commands_model import Command
 from kmd.model.params_model import ParamValues
 from kmd.model.shell_model import ShellResult
 from kmd.shell_tools.exception_printing import summarize_traceback
-from kmd.shell_ui.shell_output import cprint
+from kmd.shell_ui.shell_output import cprint, print_status
 from kmd.util.log_calls import log_tallies
 from kmd.util.parse_shell_args import parse_shell_args
 
@@ -20,11 +23,26 @@ log = get_logger(__name__)
 
 
 class ShellCallableAction:
-    def __init__(self, action: Action):
-        self.action = action
+    """
+    An action callable from the shell. If created from an `ActionInfo`, the action
+    itself is only loaded when first called.
+    """
+
+    def __init__(self, action: Action | ActionInfo):
+        self._action = action if isinstance(action, Action) else None
         self.__name__ = action.name
         self.__doc__ = action.description
 
+    @property
+    def action(self) -> Action:
+        if self._action is None:
+            self._action = look_up_action(self.__name__)
+        return self._action
+
+    @action.setter
+    def action(self, action: Action):
+        self._action = action
+
     def __call__(self, args: List[str]) -> ShellResult:
         from kmd.shell_ui.shell_results import shell_before_exec
 
@@ -35,8 +53,9 @@ class ShellCallableAction:
 
             return ShellResult()
 
-        # Handle --rerun option at action invocation time.
+        # Handle --rerun and --bg options at action invocation time.
         rerun = bool(shell_args.options.get("rerun", False))
+        background = bool(shell_args.options.get("bg", False))
 
         log.info("Action shell args: %s", shell_args)
 
@@ -46,6 +65,9 @@ class ShellCallableAction:
         )
 
         try:
+            if background:
+                return self._start_job(shell_args.args, rerun, args)
+
             shell_before_exec()
             if not self.action.interactive_input:
                 with get_console().status(f"Running action {self.action.name}…", spinner=SPINNER):
@@ -53,7 +75,7 @@ class ShellCallableAction:
             else:
                 result = run_action(self.action, *args, rerun=rerun)
             # We don't return the result to keep the xonsh shell output clean.
-        except NONFATAL_EXCEPTIONS as e:
+        except nonfatal_exceptions() as e:
             cprint()
             log.error(f"[{COLOR_ERROR}]Action error:[/{COLOR_ERROR}] %s", summarize_traceback(e))
             log.info("Action error details: %s", e, exc_info=True)
@@ -76,5 +98,28 @@ class ShellCallableAction:
 
         return shell_result
 
+    def _start_job(self, action_args: List[str], rerun: bool, args: List[str]) -> ShellResult:
+        if self.action.interactive_input:
+            raise InvalidInput(
+                f"Action `{self.action.name}` needs input so can't run in background"
+            )
+
+        # Resolve the selection now, since it may change while the job runs.
+        if not action_args and self.action.uses_selection and self.action.expected_args != NO_ARGS:
+            selection_args, _ = assemble_action_args(use_selection=True)
+            action_args = [str(arg) for arg in selection_args]
+
+        action = self.action
+        command = Command.assemble(action, args)
+        job = start_job(
+            command.command_str(), lambda: run_action(action, *action_args, rerun=rerun)
+        )
+        record_command(command)
+        print_status(
+            f"Started job {job.name}: {command.command_str()}\n"
+            "Use `bg_jobs` to see progress and `bg_output` to see output."
+        )
+        return ShellResult()
+
     def __repr__(self):
         return f"CallableAction({str(self.action)})"
@@ -3,7 +3,7 @@ from typing import Callable, List, Optional, TypeVar
 from kmd.config.logger import get_logger
 from kmd.config.text_styles import COLOR_ERROR
 
-from kmd.errors import NONFATAL_EXCEPTIONS
+from kmd.errors import nonfatal_exceptions
 from kmd.shell_ui.shell_output import cprint
 
 
@@ -38,7 +38,7 @@ def wrap_with_exception_printing(func: Callable[..., R]) -> Callable[[List[str]]
                 (", ".join(str(arg) for arg in args)),
             )
             return func(*args)
-        except NONFATAL_EXCEPTIONS as e:
+        except nonfatal_exceptions() as e:
             log.error(f"[{COLOR_ERROR}]Command error:[/{COLOR_ERROR}] %s", summarize_traceback(e))
             cprint()
             log.info("Command error details: %s", e, exc_info=True)
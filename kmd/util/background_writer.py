@@ -0,0 +1,195 @@
+import atexit
+import os
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+
+from kmd.util.strif import atomic_output_file
+
+EXIT_FLUSH_TIMEOUT = 10.0
+"""Longest to wait at exit for queued writes, so a stuck write can't hang exit."""
+
+
+@dataclass
+class WriterStats:
+    files_written: int = 0
+    bytes_written: int = 0
+    files_pruned: int = 0
+    write_errors: int = 0
+    waits: int = 0
+    """Times a caller had to wait for the queue to drain."""
+
+
+class BackgroundWriter:
+    """
+    Writes files on a background thread, so callers don't wait on disk I/O.
+
+    Memory is bounded: if writing would put more than `max_queued_bytes` in the queue,
+    `write()` blocks until there is room. Queued writes are flushed at exit (waiting at
+    most `EXIT_FLUSH_TIMEOUT`).
+
+    If `max_dir_bytes` is set, it's a size limit for each directory written to. Once a
+    directory is over it, the oldest files in it are deleted until it's under 80% of it.
+    """
+
+    def __init__(self, name: str, max_queued_bytes: int, max_dir_bytes: int = 0):
+        self.name = name
+        self.max_queued_bytes = max_queued_bytes
+        self.max_dir_bytes = max_dir_bytes
+        self.stats = WriterStats()
+
+        self._cond = threading.Condition()
+        self._queue: Deque[Tuple[Path, bytes]] = deque()
+        self._queued_bytes = 0
+        self._writing = False
+        self._thread: Optional[threading.Thread] = None
+        # Directory -> its total size, tracked as we write, if there is a size limit.
+        self._dir_sizes: Dict[Path, int] = {}
+
+        atexit.register(self.flush, EXIT_FLUSH_TIMEOUT)
+
+    def write(self, path: Path, data: bytes | str) -> None:
+        """
+        Queue a file to be written (atomically, creating parent directories). Blocks
+        if the queue is full.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        size = len(data)
+
+        def has_room() -> bool:
+            # Anything fits in an empty queue, so big files are written one at a time.
+            return not self._queued_bytes or self._queued_bytes + size <= self.max_queued_bytes
+
+        with self._cond:
+            if not has_room():
+                self.stats.waits += 1
+                self._cond.wait_for(has_room)
+            self._queue.append((path, data))
+            self._queued_bytes += size
+            if not self._thread:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-writer", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything queued so far is written. Returns False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._writing, timeout)
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                path, data = self._queue.popleft()
+                self._writing = True
+
+            try:
+                with atomic_output_file(path, make_parents=True) as tmp_path:
+                    tmp_path.write_bytes(data)
+                self.stats.files_written += 1
+                self.stats.bytes_written += len(data)
+                if self.max_dir_bytes:
+                    self._enforce_limit(path.parent, len(data))
+            except Exception as e:
+                # Any error fails just this write, so the thread keeps going. Can't log
+                # here, as logging may itself be writing via this writer.
+                self.stats.write_errors += 1
+                print(f"Error writing {path}: {e}", file=sys.stderr)
+            finally:
+                with self._cond:
+                    self._queued_bytes -= len(data)
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _enforce_limit(self, dir: Path, added: int) -> None:
+        if dir in self._dir_sizes:
+            self._dir_sizes[dir] += added
+        else:
+            self._dir_sizes[dir] = sum(size for _path, size, _mtime in _list_files(dir))
+        if self._dir_sizes[dir] <= self.max_dir_bytes:
+            return
+
+        files = sorted(_list_files(dir), key=lambda f: f[2])
+        total = sum(size for _path, size, _mtime in files)
+        target = int(self.max_dir_bytes * 0.8)
+        for path, size, _mtime in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                self.stats.files_pruned += 1
+            except FileNotFoundError:
+                total -= size
+        self._dir_sizes[dir] = total
+
+
+def _list_files(dir: Path) -> list[Tuple[str, int, float]]:
+    """
+    Paths, sizes, and modification times of files in a directory.
+    """
+    files = []
+    try:
+        with os.scandir(dir) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+    except FileNotFoundError:
+        pass
+    return files
+
+
+## Tests
+
+
+def test_background_writer():
+    import shutil
+    import time
+
+    tmp_dir = Path("tmp/test_background_writer")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    writer = BackgroundWriter("test", max_queued_bytes=1000, max_dir_bytes=5000)
+    for i in range(20):
+        writer.write(tmp_dir / f"file_{i:02d}.txt", "x" * 500)
+        time.sleep(0.001)  # Distinct mtimes.
+    assert writer.flush(timeout=10)
+    assert writer.queued_bytes == 0
+    assert writer.stats.files_written == 20
+
+    # Oldest files were pruned to stay under the limit.
+    remaining = sorted(p.name for p in tmp_dir.iterdir())
+    assert sum((tmp_dir / name).stat().st_size for name in remaining) <= 5000
+    assert remaining[-1] == "file_19.txt"
+    assert "file_00.txt" not in remaining
+    assert writer.stats.files_pruned == 20 - len(remaining)
+
+    # Files bigger than the queue limit are still written.
+    writer.write(tmp_dir / "big.txt", b"y" * 3000)
+    assert writer.flush(timeout=10)
+    assert (tmp_dir / "big.txt").stat().st_size == 3000
+
+    # An unexpected error fails one write but the writer keeps going.
+    class FailingWriter(BackgroundWriter):
+        def _enforce_limit(self, dir: Path, added: int) -> None:
+            if not self.stats.write_errors:
+                raise ValueError("unexpected")
+
+    writer = FailingWriter("test", max_queued_bytes=1000, max_dir_bytes=5000)
+    for i in range(3):
+        writer.write(tmp_dir / f"retry_{i}.txt", "z" * 500)
+    assert writer.flush(timeout=10)
+    assert writer.stats.write_errors == 1 and writer.stats.files_written == 3
@@ -8,7 +8,6 @@ from typing import Any, Iterable, Optional
 import humanfriendly
 import regex
 from humanize import naturalsize
-from inflect import engine
 
 from kmd.util.lazyobject import lazyobject
 from kmd.util.strif import abbreviate_str
@@ -16,6 +15,9 @@ from kmd.util.strif import abbreviate_str
 
 @lazyobject
 def inflect():
+    # Slow to import, so only import when first used.
+    from inflect import engine
+
     return engine()
 
 
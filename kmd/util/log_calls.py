@@ -6,6 +6,7 @@ from typing import Any, Callable, cast, Dict, List, Literal, Optional, TypeVar
 
 from kmd.config.logger import get_logger
 from kmd.util.strif import abbreviate_str
+from kmd.util.tracing import trace_span
 
 log = get_logger(__name__)
 
@@ -158,7 +159,8 @@ def log_calls(
 
             start_time = time.time()
 
-            result = func(*args, **kwargs)
+            with trace_span(func_name, "call"):
+                result = func(*args, **kwargs)
 
             end_time = time.time()
             elapsed = end_time - start_time
@@ -247,15 +249,16 @@ def tally_calls(
     def decorator(func: F) -> F:
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            func_name = func_and_module_name(func)
+
             start_time = time.time()
 
-            result = func(*args, **kwargs)
+            with trace_span(func_name, "call"):
+                result = func(*args, **kwargs)
 
             end_time = time.time()
             elapsed = end_time - start_time
 
-            func_name = func_and_module_name(func)
-
             if func_name not in tally:
                 tally[func_name] = Tally()
 
@@ -0,0 +1,149 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Generator, Optional
+
+
+class ReadWriteLock:
+    """
+    A lock allowing any number of concurrent readers or a single writer.
+
+    Writers are preferred, so a steady stream of readers can't starve a writer. Both
+    read and write locks are reentrant, and a thread holding the write lock may also take
+    the read lock. But a thread holding only a read lock can't take the write lock, as two
+    such threads would deadlock, so this raises an error instead.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers: Dict[int, int] = {}
+        self._writer: Optional[int] = None
+        self._write_count = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me or me in self._readers:
+                self._readers[me] = self._readers.get(me, 0) + 1
+                return
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers[me] = 1
+
+    def release_read(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            count = self._readers.get(me)
+            if not count:
+                raise RuntimeError("Read lock released without being held")
+            if count > 1:
+                self._readers[me] = count - 1
+            else:
+                del self._readers[me]
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_count += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Can't acquire write lock while holding a read lock")
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._write_count = 1
+
+    def release_write(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                raise RuntimeError("Write lock released without being held")
+            self._write_count -= 1
+            if self._write_count == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Generator[None, None, None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Generator[None, None, None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+## Tests
+
+
+def test_read_write_lock():
+    import time
+
+    lock = ReadWriteLock()
+
+    # Reentrancy, and reads while holding the write lock.
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                pass
+    with lock.read():
+        with lock.read():
+            try:
+                lock.acquire_write()
+                assert False, "Expected upgrade to fail"
+            except RuntimeError:
+                pass
+
+    # Readers overlap with each other but never with a writer.
+    active_readers = 0
+    max_readers = 0
+    writer_active = False
+    overlaps = 0
+    state_lock = threading.Lock()
+
+    def reader():
+        nonlocal active_readers, max_readers, overlaps
+        for _ in range(20):
+            with lock.read():
+                with state_lock:
+                    active_readers += 1
+                    max_readers = max(max_readers, active_readers)
+                    overlaps += writer_active
+                time.sleep(0.001)
+                with state_lock:
+                    active_readers -= 1
+
+    def writer():
+        nonlocal writer_active, overlaps
+        for _ in range(10):
+            with lock.write():
+                with state_lock:
+                    writer_active = True
+                    overlaps += active_readers
+                time.sleep(0.001)
+                with state_lock:
+                    writer_active = False
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    threads += [threading.Thread(target=writer) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert overlaps == 0
+    assert max_readers > 1
@@ -1,7 +1,8 @@
 import threading
 from contextlib import contextmanager
-from dataclasses import dataclass
-from typing import List
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 from kmd.config.text_styles import (
     EMOJI_BREADCRUMB_SEP,
@@ -9,6 +10,8 @@ from kmd.config.text_styles import (
     EMOJI_TASK,
     TASK_STACK_HEADER,
 )
+from kmd.errors import Cancelled
+from kmd.util.tracing import NullSpan, Span, trace_span
 
 
 @dataclass
@@ -18,9 +21,25 @@ class TaskState:
     total_parts: int
     unit: str = ""
     errors: int = 0
+    progress: str = ""
+    """Progress within the current part, if any (like tokens received so far)."""
+    span: Span | NullSpan = field(default_factory=NullSpan, repr=False)
+    part_span: Span | NullSpan = field(default_factory=NullSpan, repr=False)
+    """Trace spans for the task and its current part, if tracing."""
+
+    def start_part_span(self):
+        if self.total_parts > 1 and self.current_part < self.total_parts:
+            self.part_span = trace_span(
+                f"{self.name} {self.unit or 'part'} {self.current_part + 1}/{self.total_parts}",
+                "task",
+            )
 
     def next(self):
+        self.part_span.end()
+        self.part_span = NullSpan()
         self.current_part += 1
+        self.progress = ""
+        self.start_part_span()
 
     def task_str(self):
         done_str = "(done)" if self.current_part == self.total_parts else None
@@ -38,7 +57,9 @@ class TaskState:
                 else f"({unit_str or parts_str})"
             )
 
-        pieces = [self.name, done_str, parenthetical]
+        progress_str = f"({self.progress})" if self.progress else None
+
+        pieces = [self.name, done_str, parenthetical, progress_str]
         return " ".join(filter(bool, pieces))
 
     def err_str(self):
@@ -65,13 +86,20 @@ class TaskStack:
         self.stack: List[TaskState] = []
 
     def push(self, name: str, total_parts: int = 1, unit: str = ""):
-        self.stack.append(TaskState(name, 0, total_parts, unit))
+        check_cancelled()
+        state = TaskState(name, 0, total_parts, unit, span=trace_span(name, "task"))
+        state.start_part_span()
+        self.stack.append(state)
         self.log()
 
     def pop(self) -> TaskState:
         if not self.stack:
             raise IndexError("Pop from empty task stack")
-        return self.stack.pop()
+        state = self.stack.pop()
+        state.part_span.end()
+        state.span.args["errors"] = state.errors
+        state.span.end()
+        return state
 
     def next(self, last_had_error: bool = False):
         """
@@ -82,6 +110,17 @@ class TaskStack:
             self.current_task.errors += 1
 
         self.log()
+        if not last_had_error:
+            check_cancelled()
+
+    def set_progress(self, progress: str):
+        """
+        Report progress within the current part of the current task, if there is one.
+        """
+        if self.stack:
+            self.current_task.progress = progress
+            self.log()
+        check_cancelled()
 
     @property
     def current_task(self) -> TaskState:
@@ -138,6 +177,8 @@ class TaskStack:
 
 _thread_local = threading.local()
 
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("cancel_event", default=None)
+
 
 def task_stack() -> TaskStack:
     if not hasattr(_thread_local, "task_stack"):
@@ -152,3 +193,26 @@ def task_stack_prefix_str() -> str:
         return task_stack.prefix_str()
     else:
         return ""
+
+
+@contextmanager
+def cancellable(event: threading.Event):
+    """
+    Tasks within this context (including on threads started with `submit_in_context`)
+    stop with `Cancelled` at their next step once the event is set.
+    """
+    token = _cancel_event.set(event)
+    try:
+        yield
+    finally:
+        _cancel_event.reset(token)
+
+
+def check_cancelled() -> None:
+    """
+    Raise `Cancelled` if the current task has been cancelled. Called at each step of
+    the task stack, so long-running work stops between items or parts.
+    """
+    event = _cancel_event.get()
+    if event and event.is_set():
+        raise Cancelled("Task was cancelled")
@@ -0,0 +1,28 @@
+import contextvars
+from concurrent.futures import Executor, Future
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+def submit_in_context(executor: Executor, func: Callable[..., T], *args, **kwargs) -> Future[T]:
+    """
+    Submit a call to an executor, to run in a copy of the current context, so context
+    variables (like the action run being recorded) carry over to the worker thread.
+    """
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, *args, **kwargs)
+
+
+## Tests
+
+
+def test_submit_in_context():
+    from concurrent.futures import ThreadPoolExecutor
+
+    var: contextvars.ContextVar[str] = contextvars.ContextVar("var", default="unset")
+    var.set("set")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert executor.submit(var.get).result() == "unset"
+        futures = [submit_in_context(executor, var.get) for _ in range(4)]
+        assert [f.result() for f in futures] == ["set"] * 4
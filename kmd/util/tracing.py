@@ -0,0 +1,205 @@
+"""
+Opt-in tracing of where time goes: spans for tasks (from the task stack), phases of
+action runs, calls to functions decorated with `log_calls` or `tally_calls`, LLM calls,
+and file I/O, exported as Chrome trace event JSON, for viewing as a timeline in Perfetto
+(https://ui.perfetto.dev) or `chrome://tracing`.
+
+When tracing is off, `trace_span()` just checks a global and returns a shared no-op
+span, so spans can be left in place everywhere.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from kmd.util.strif import atomic_output_file
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace "complete" events, with times in microseconds since
+    tracing started.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self.thread_names: Dict[int, str] = {}
+        self.pid = os.getpid()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self.start) * 1e6
+
+    def add_span(
+        self,
+        name: str,
+        cat: str,
+        start: float,
+        args: Dict[str, Any],
+        thread: Optional[threading.Thread] = None,
+    ) -> None:
+        thread = thread or threading.current_thread()
+        # Appends to lists and dicts are atomic, so no lock needed.
+        self.thread_names.setdefault(thread.ident or 0, thread.name)
+        self.events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start,
+                "dur": self.now() - start,
+                "pid": self.pid,
+                "tid": thread.ident or 0,
+                "args": {key: str(value) for key, value in args.items()},
+            }
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        thread_events = [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in list(self.thread_names.items())
+        ]
+        return {"traceEvents": thread_events + list(self.events), "displayTimeUnit": "ms"}
+
+
+class Span:
+    """
+    A span being timed. Use as a context manager, or call `end()`. Args (shown with the
+    span in the trace viewer) can be added until it ends.
+    """
+
+    __slots__ = ("tracer", "name", "cat", "args", "start", "thread")
+
+    def __init__(self, tracer: Tracer, name: str, cat: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = tracer.now()
+        self.thread = threading.current_thread()
+
+    def end(self) -> None:
+        self.tracer.add_span(self.name, self.cat, self.start, self.args, self.thread)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type:
+            self.args["error"] = exc_type.__name__
+        self.end()
+
+
+class NullSpan:
+    """
+    A span that does nothing, used when tracing is off.
+    """
+
+    __slots__ = ()
+
+    @property
+    def args(self) -> Dict[str, Any]:
+        return {}
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NULL_SPAN = NullSpan()
+
+_tracer: Optional[Tracer] = None
+
+
+def is_tracing() -> bool:
+    return _tracer is not None
+
+
+def trace_span(name: str, cat: str, **args: Any) -> Span | NullSpan:
+    """
+    A span to time, if tracing is on. Use as a context manager:
+    `with trace_span("name", "category", key=value): ...`
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, cat, args)
+
+
+def add_span(name: str, cat: str, start_time: float, **args: Any) -> None:
+    """
+    Add a span that started at `start_time` (from `time.perf_counter()`) and ends now,
+    if tracing.
+    """
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add_span(name, cat, (start_time - tracer.start) * 1e6, args)
+
+
+def start_tracing() -> None:
+    """
+    Start tracing (discarding any trace in progress).
+    """
+    global _tracer
+    _tracer = Tracer()
+
+
+def stop_tracing(path: Optional[Path] = None) -> int:
+    """
+    Stop tracing and, if a path is given, write the trace as Chrome trace event JSON.
+    Returns the number of spans.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return 0
+    if path:
+        with atomic_output_file(path, make_parents=True) as tmp_path:
+            tmp_path.write_text(json.dumps(tracer.to_json()), encoding="utf-8")
+    return len(tracer.events)
+
+
+## Tests
+
+
+def test_tracing():
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+
+    assert trace_span("off", "test") is _NULL_SPAN
+    with trace_span("off", "test") as span:
+        span.args["ignored"] = 1
+
+    start_tracing()
+    try:
+        with trace_span("outer", "test", item="a.md") as span:
+            span.args["tokens"] = 10
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="worker") as executor:
+                list(executor.map(lambda i: trace_span(f"inner {i}", "test").end(), range(4)))
+        add_span("added", "test", time.perf_counter())
+        with trace_span("fails", "test"):
+            raise ValueError("fail")
+    except ValueError:
+        pass
+    finally:
+        tmp_dir = Path("tmp/test_tracing")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        assert stop_tracing(tmp_dir / "trace.json") == 7
+    assert not is_tracing()
+
+    trace = json.loads((tmp_dir / "trace.json").read_text())
+    spans = {event["name"]: event for event in trace["traceEvents"] if event["ph"] == "X"}
+    threads = {event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"}
+    assert spans["outer"]["args"] == {"item": "a.md", "tokens": "10"}
+    assert spans["fails"]["args"] == {"error": "ValueError"}
+    assert spans["inner 0"]["ts"] >= spans["outer"]["ts"]
+    assert spans["outer"]["dur"] >= spans["inner 0"]["dur"]
+    assert any(name.startswith("worker") for name in threads)
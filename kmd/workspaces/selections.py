@@ -1,6 +1,8 @@
+import json
+import threading
 from functools import wraps
 from pathlib import Path
-from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple, TypeVar
 
 from frontmatter_format import new_yaml, yaml_util
 from pydantic import BaseModel, Field, field_serializer, field_validator, PrivateAttr
@@ -21,19 +23,38 @@ SELECTION_HISTORY_MAX = 50
 
 SELECTION_DISPLAY_MAX = 20
 
+JOURNAL_SUFFIX = ".journal"
 
-def persist_after(save_method: Callable[[SH], None]):
-    def decorator(func: Callable[..., T]) -> Callable[..., T]:
-        @wraps(func)
-        def wrapper(self: SH, *args, **kwargs) -> T:
-            result = func(self, *args, **kwargs)
-            log.info("Saving selection history after %s().", func.__name__)
-            save_method(self)
-            return result
+JOURNAL_COMPACT_MIN_BYTES = 64 * 1024
+"""
+The journal is compacted into the main file once it's larger than this and also
+larger than the main file, so rewrites are amortized over many small changes.
+"""
 
-        return wrapper
+_journaled_ops: Set[str] = set()
 
-    return decorator
+
+def journaled(func: Callable[..., T]) -> Callable[..., T]:
+    """
+    Record each successful call to this method in the journal, so the change can be
+    replayed on top of the last full save. Nested calls are only recorded once. Calls
+    hold the history lock, so changes from different threads are not interleaved.
+    """
+    _journaled_ops.add(func.__name__)
+
+    @wraps(func)
+    def wrapper(self: SH, *args, **kwargs) -> T:
+        with self._lock:
+            self._call_depth += 1
+            try:
+                result = func(self, *args, **kwargs)
+            finally:
+                self._call_depth -= 1
+            if self._call_depth == 0 and not self._replaying:
+                self._append_journal(func.__name__, args, kwargs)
+            return result
+
+    return wrapper
 
 
 class Selection(BaseModel):
@@ -62,20 +83,22 @@ class Selection(BaseModel):
         """
         self.paths.clear()
 
-    def remove_values(self, targets: Sequence[StorePath]) -> None:
+    def remove_values(self, targets: Sequence[StorePath] | Set[StorePath]) -> None:
         """
         Remove specified paths from the current selection.
         """
-        self.paths[:] = [p for p in self.paths if p not in targets]
+        target_set = targets if isinstance(targets, set) else set(targets)
+        if any(p in target_set for p in self.paths):
+            self.paths[:] = [p for p in self.paths if p not in target_set]
 
     def replace_values(self, replacements: Sequence[Tuple[StorePath, StorePath]]) -> None:
         """
         Replace paths in the current selection according to the replacement pairs.
         """
-        for old_path, new_path in replacements:
-            for idx, current_path in enumerate(self.paths):
-                if current_path == old_path:
-                    self.paths[idx] = new_path
+        replacement_map = dict(replacements)
+        for idx, current_path in enumerate(self.paths):
+            if current_path in replacement_map:
+                self.paths[idx] = replacement_map[current_path]
 
     def as_str(self, max_lines: int = SELECTION_DISPLAY_MAX) -> str:
         lines = [
@@ -96,53 +119,178 @@ class Selection(BaseModel):
         return self.as_brief_str()
 
 
+def _encode_arg(value: Any) -> Any:
+    if isinstance(value, Selection):
+        return value.model_dump()
+    elif isinstance(value, StorePath):
+        return value.display_str()
+    elif isinstance(value, (list, tuple, set)):
+        return [_encode_arg(v) for v in value]
+    else:
+        return value
+
+
+def _decode_arg(value: Any) -> Any:
+    if isinstance(value, dict):
+        return Selection.model_validate(value)
+    elif isinstance(value, str):
+        return StorePath(value)
+    elif isinstance(value, list):
+        return [_decode_arg(v) for v in value]
+    else:
+        return value
+
+
 class SelectionHistory(BaseModel):
     """
     A history stack of selections that can result from outputs of a sequence of commands.
+
+    Saved as a YAML file with the full history, plus an append-only journal of changes
+    since, so each change only costs I/O proportional to its size. Journal entries are
+    numbered and the YAML file records the last entry it includes, so a journal left
+    over from an interrupted compaction is never replayed twice.
     """
 
     history: List[Selection] = Field(default_factory=list)
     current_index: int = 0
 
     _save_path: Path = PrivateAttr()
+    _journal_path: Path = PrivateAttr()
     _max_history: int = PrivateAttr()
+    _journal_seq: int = PrivateAttr(default=0)
+    _journal_size: int = PrivateAttr(default=0)
+    _save_size: int = PrivateAttr(default=0)
+    _call_depth: int = PrivateAttr(default=0)
+    _replaying: bool = PrivateAttr(default=False)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    """Held for changes, which may come from background jobs as well as the shell."""
 
     model_config = {
         "arbitrary_types_allowed": True,
     }
 
     @classmethod
-    def init(cls, save_path: Path, max_history: int = SELECTION_HISTORY_MAX) -> "SelectionHistory":
+    def init(
+        cls,
+        save_path: Path,
+        max_history: int = SELECTION_HISTORY_MAX,
+        journal_path: Optional[Path] = None,
+    ) -> "SelectionHistory":
         """
-        Initialize selection history, loading from save_path if it exists.
+        Initialize selection history, loading from save_path (and replaying its journal)
+        if it exists.
         """
+        journal_path = journal_path or save_path.with_suffix(JOURNAL_SUFFIX)
         instance = cls()
-        instance._save_path = save_path
-        instance._max_history = max_history
         if save_path.exists():
             try:
                 with save_path.open("r") as f:
                     data = new_yaml().load(f)
                 instance = cls.model_validate(data)
-                instance._save_path = save_path
-                instance._max_history = max_history
+                instance._journal_seq = data.get("journal_seq", 0)
+                instance._save_size = save_path.stat().st_size
             except Exception as e:
                 log.warning(
                     f"Selection history can't be loaded, so will discard it (see trash): {save_path}: {e}"
                 )
                 native_trash(save_path)
-                instance._save()
+                if journal_path.exists():
+                    native_trash(journal_path)
+                instance = cls()
+
+        instance._save_path = save_path
+        instance._journal_path = journal_path
+        instance._max_history = max_history
+        instance._replay_journal()
+        if not save_path.exists() or instance._needs_compaction():
+            instance._save()
 
         return instance
 
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever the history is changed (every change is journaled).
+        """
+        return self._journal_seq
+
     def _save(self) -> None:
         """
-        Save the current full history.
+        Save the current full history. This includes all journal entries so far,
+        so the journal is then cleared.
         """
         data = self.model_dump()
+        data["journal_seq"] = self._journal_seq
         yaml_util.write_yaml_file(data, str(self._save_path))
+        self._save_size = self._save_path.stat().st_size
+        self._journal_path.unlink(missing_ok=True)
+        self._journal_size = 0
+
+    def _needs_compaction(self) -> bool:
+        return self._journal_size > max(JOURNAL_COMPACT_MIN_BYTES, self._save_size)
+
+    def _append_journal(self, op: str, args: Sequence[Any], kwargs: dict) -> None:
+        self._journal_seq += 1
+        entry = {"seq": self._journal_seq, "op": op, "args": _encode_arg(args)}
+        if kwargs:
+            entry["kwargs"] = {k: _encode_arg(v) for k, v in kwargs.items()}
+        line = json.dumps(entry) + "\n"
+        with self._journal_path.open("a", encoding="utf-8") as f:
+            f.write(line)
+        self._journal_size += len(line.encode("utf-8"))
+
+        if self._needs_compaction():
+            log.info("Compacting selection history journal: %s", fmt_loc(self._journal_path))
+            self._save()
+
+    def _replay_journal(self) -> None:
+        """
+        Apply any journal entries not already in the saved history. If the last entry is
+        incomplete, the history is saved, so the journal is cleared and new entries aren't
+        appended to the partial line.
+        """
+        if not self._journal_path.exists():
+            return
+
+        replayed = 0
+        incomplete = False
+        self._replaying = True
+        try:
+            with self._journal_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Only the last entry can be incomplete, if we were interrupted.
+                        log.warning("Ignoring incomplete selection journal entry: %r", line)
+                        incomplete = True
+                        break
+                    if not line.endswith("\n"):
+                        incomplete = True
+                    if entry["seq"] <= self._journal_seq:
+                        continue
+                    op = entry["op"]
+                    if op not in _journaled_ops:
+                        log.warning("Ignoring unknown selection journal entry: %r", line)
+                        continue
+                    args = _decode_arg(entry["args"])
+                    kwargs = {k: _decode_arg(v) for k, v in entry.get("kwargs", {}).items()}
+                    try:
+                        getattr(self, op)(*args, **kwargs)
+                    except (InvalidInput, InvalidOperation) as e:
+                        log.warning("Could not replay selection journal entry: %r: %s", line, e)
+                    self._journal_seq = entry["seq"]
+                    replayed += 1
+        finally:
+            self._replaying = False
+
+        log.info("Replayed %s selection history changes from journal.", replayed)
+        if incomplete:
+            self._save()
+        else:
+            self._journal_size = self._journal_path.stat().st_size
 
-    @persist_after(_save)
+    @journaled
     def clear(self) -> None:
         """
         Clear the history.
@@ -150,7 +298,7 @@ class SelectionHistory(BaseModel):
         self.history.clear()
         self.current_index = 0
 
-    @persist_after(_save)
+    @journaled
     def clear_future(self) -> None:
         """
         Clear history beyond the current position.
@@ -187,7 +335,7 @@ class SelectionHistory(BaseModel):
         else:
             return self.history[self.current_index]
 
-    @persist_after(_save)
+    @journaled
     def set_current(self, store_paths: List[StorePath]) -> None:
         """
         Set the current selection. If history is empty, adds a new selection.
@@ -197,7 +345,7 @@ class SelectionHistory(BaseModel):
         else:
             self.history[self.current_index] = Selection(paths=store_paths)
 
-    @persist_after(_save)
+    @journaled
     def unselect_current(self, paths: Sequence[StorePath]) -> Selection:
         """
         Remove specified paths from the current selection.
@@ -211,7 +359,7 @@ class SelectionHistory(BaseModel):
                 self.history[self.current_index].clear()
             return self.history[self.current_index]
 
-    @persist_after(_save)
+    @journaled
     def push(self, selection: Selection) -> None:
         """
         Append a new selection to history. If current_index is not at the end,
@@ -239,7 +387,7 @@ class SelectionHistory(BaseModel):
         self.current_index = len(self.history) - 1
         self._truncate()
 
-    @persist_after(_save)
+    @journaled
     def pop(self) -> Selection:
         """
         Remove the current selection from history and return it.
@@ -251,7 +399,7 @@ class SelectionHistory(BaseModel):
             self.current_index = max(0, self.current_index - 1)
             return selection
 
-    @persist_after(_save)
+    @journaled
     def previous(self, n: int = 1) -> Selection:
         """
         Move to the previous selection in history and return it.
@@ -264,7 +412,7 @@ class SelectionHistory(BaseModel):
         self.current_index -= n
         return self.history[self.current_index]
 
-    @persist_after(_save)
+    @journaled
     def next(self, n: int = 1) -> Selection:
         """
         Move to the next selection in history and return it.
@@ -277,13 +425,14 @@ class SelectionHistory(BaseModel):
         self.current_index += n
         return self.history[self.current_index]
 
-    @persist_after(_save)
+    @journaled
     def remove_values(self, targets: Sequence[StorePath]) -> None:
         """
         Remove specified paths from all selections.
         """
+        target_set = set(targets)
         for selection in self.history:
-            selection.remove_values(targets)
+            selection.remove_values(target_set)
 
         # Remove empty selections entirely. This happens for example if
         # we created a temporary item and then archived it.
@@ -297,7 +446,7 @@ class SelectionHistory(BaseModel):
             else:
                 i += 1
 
-    @persist_after(_save)
+    @journaled
     def replace_values(self, replacements: Sequence[Tuple[StorePath, StorePath]]) -> None:
         """
         Replace paths in all selections according to the replacement pairs.
@@ -330,3 +479,52 @@ class SelectionHistory(BaseModel):
                     )
 
         return selections
+
+
+## Tests
+
+
+def test_selection_history_journal():
+    import shutil
+
+    save_dir = Path("tmp/test_selection_history")
+    shutil.rmtree(save_dir, ignore_errors=True)
+    save_dir.mkdir(parents=True)
+    save_path = save_dir / "selection.yml"
+
+    def paths(*names: str) -> List[StorePath]:
+        return [StorePath(f"docs/{name}.doc.md") for name in names]
+
+    history = SelectionHistory.init(save_path)
+    version = history.version
+    history.push(Selection(paths=paths("a", "b", "c")))
+    assert history.version != version
+    history.push(Selection(paths=paths("d")))
+    history.previous()
+    history.remove_values(paths("b"))
+    history.replace_values([(paths("c")[0], paths("e")[0])])
+    history.set_current(paths("a", "e", "f"))
+
+    # Changes are only appended to the journal, then replayed on load.
+    assert save_path.exists() and save_path.with_suffix(JOURNAL_SUFFIX).exists()
+    reloaded = SelectionHistory.init(save_path)
+    assert reloaded.model_dump() == history.model_dump()
+    assert reloaded.current.paths == paths("a", "e", "f")
+
+    # A full save includes everything so far, so stale journal entries are skipped.
+    journal = save_path.with_suffix(JOURNAL_SUFFIX).read_text()
+    reloaded._save()
+    save_path.with_suffix(JOURNAL_SUFFIX).write_text(journal + '{"seq": 1000, "op": "cl')
+    assert SelectionHistory.init(save_path).model_dump() == history.model_dump()
+
+    # After an incomplete entry, new entries are still replayed.
+    save_path.with_suffix(JOURNAL_SUFFIX).write_text(journal + '{"seq": 1000, "op": "cl')
+    torn = SelectionHistory.init(save_path)
+    torn.push(Selection(paths=paths("g")))
+    assert SelectionHistory.init(save_path).current.paths == paths("g")
+
+    # Large journals are compacted.
+    for i in range(200):
+        reloaded.push(Selection(paths=paths(*[f"item_{i}_{j}" for j in range(20)])))
+    assert save_path.with_suffix(JOURNAL_SUFFIX).stat().st_size < JOURNAL_COMPACT_MIN_BYTES
+    assert SelectionHistory.init(save_path).model_dump() == reloaded.model_dump()
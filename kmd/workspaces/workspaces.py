@@ -1,6 +1,8 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import cache
 from pathlib import Path
-from typing import Optional, Tuple, Type, TypeVar
+from typing import Generator, Optional, Tuple, Type, TypeVar
 
 from kmd.config.logger import get_logger, reset_logging
 from kmd.config.settings import resolve_and_create_dirs, SANDBOX_KB_PATH, SANDBOX_NAME
@@ -143,11 +145,30 @@ def _switch_current_workspace(base_dir: Path) -> FileStore:
     return get_workspace_registry().load(ws_name, ws_path, is_sandbox)
 
 
+_pinned_workspace: ContextVar[Optional[FileStore]] = ContextVar("pinned_workspace", default=None)
+
+
+@contextmanager
+def pinned_workspace(ws: FileStore) -> Generator[FileStore, None, None]:
+    """
+    Within this context, the current workspace is `ws`, even if the working directory
+    changes. For work like background jobs that must keep using the same workspace.
+    """
+    token = _pinned_workspace.set(ws)
+    try:
+        yield ws
+    finally:
+        _pinned_workspace.reset(token)
+
+
 def current_workspace(silent: bool = False) -> FileStore:
     """
-    Get the current workspace based on the current working directory.
-    Also updates logging and cache directories if this has changed.
+    Get the current workspace based on the current working directory (unless it's
+    pinned). Also updates logging and cache directories if this has changed.
     """
+    pinned = _pinned_workspace.get()
+    if pinned:
+        return pinned
 
     base_dir, is_sandbox = _infer_workspace_info()
     if not base_dir:
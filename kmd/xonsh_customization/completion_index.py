@@ -0,0 +1,160 @@
+"""
+A prebuilt index of names and descriptions (of commands and actions), so completion
+doesn't have to fuzzy-match the input against every name on every keystroke.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Generic, Iterable, List, Optional, Set, TypeVar
+
+from kmd.xonsh_customization.completion_ranking import normalize, score_phrases
+
+T = TypeVar("T")
+
+NGRAM_SIZE = 3
+
+FUZZY_MIN_SCORE = 90
+
+
+@dataclass(frozen=True)
+class IndexEntry(Generic[T]):
+    name: str
+    description: str
+    value: T
+
+
+def ngrams(text: str, n: int = NGRAM_SIZE) -> Set[str]:
+    """
+    Character n-grams of each word of the (normalized) text.
+    """
+    return {word[i : i + n] for word in text.split() for i in range(max(1, len(word) - n + 1))}
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: List[int] = []
+        """Ids of all entries with this prefix, in order."""
+
+
+class CompletionIndex(Generic[T]):
+    """
+    A prefix trie over normalized names, for exact prefix matches, and n-gram indexes
+    over names and description words, to find the few candidates worth scoring for
+    fuzzy or description matches. Candidates are then scored in one batch.
+    """
+
+    def __init__(self, entries: Iterable[IndexEntry[T]]):
+        self.entries = list(entries)
+        self.names = [normalize(entry.name) for entry in self.entries]
+
+        self._trie = _TrieNode()
+        self._name_ngrams: Dict[str, Set[int]] = {}
+        self._desc_ngrams: Dict[str, Set[int]] = {}
+        self._desc_words: List[Set[str]] = []
+
+        for i, (name, entry) in enumerate(zip(self.names, self.entries)):
+            node = self._trie
+            node.ids.append(i)
+            for char in name:
+                node = node.children.setdefault(char, _TrieNode())
+                node.ids.append(i)
+            for gram in ngrams(name):
+                self._name_ngrams.setdefault(gram, set()).add(i)
+
+            words = set(normalize(f"{entry.name} {entry.description}").split())
+            self._desc_words.append(words)
+            for gram in ngrams(" ".join(words)):
+                self._desc_ngrams.setdefault(gram, set()).add(i)
+
+    def _prefix_ids(self, prefix: str) -> List[int]:
+        node: Optional[_TrieNode] = self._trie
+        for char in prefix:
+            node = node.children.get(char) if node else None
+        return node.ids if node else []
+
+    def matches(self, query: str) -> List[IndexEntry[T]]:
+        """
+        Entries whose name starts with the query or closely matches it (a fuzzy phrase
+        score above `FUZZY_MIN_SCORE`), in index order.
+        """
+        query = normalize(query)
+        matched = set(self._prefix_ids(query))
+
+        if len(query) < NGRAM_SIZE:
+            candidates = set(range(len(self.entries)))
+        else:
+            candidates = set()
+            for gram in ngrams(query):
+                candidates.update(self._name_ngrams.get(gram, ()))
+        candidates = sorted(candidates - matched)
+
+        scores = score_phrases(query, [self.names[i] for i in candidates])
+        matched.update(i for i, score in zip(candidates, scores) if score > FUZZY_MIN_SCORE)
+
+        return [self.entries[i] for i in sorted(matched)]
+
+    def description_matches(self, query: str, min_length: int = 4) -> List[IndexEntry[T]]:
+        """
+        Entries where every word of the query is a prefix of a word in the name or
+        description, in index order. Short query words are ignored.
+        """
+        query = normalize(query)
+        words = [word for word in query.split() if len(word) >= NGRAM_SIZE]
+        if len(query) < min_length or not words:
+            return []
+
+        candidates: Optional[Set[int]] = None
+        for word in words:
+            for gram in ngrams(word):
+                ids = self._desc_ngrams.get(gram, set())
+                candidates = ids.copy() if candidates is None else candidates & ids
+        return [
+            self.entries[i]
+            for i in sorted(candidates or ())
+            if all(any(w.startswith(word) for w in self._desc_words[i]) for word in words)
+        ]
+
+
+## Tests
+
+
+def test_completion_index():
+    from kmd.xonsh_customization.completion_ranking import score_phrase
+
+    names = [
+        "strip_html",
+        "summarize_as_bullets",
+        "show",
+        "select",
+        "transcribe",
+        "break_into_paragraphs",
+        "files",
+    ]
+    index = CompletionIndex(
+        IndexEntry(name, f"Description of {name}. Uses audio." if name == "transcribe" else "", i)
+        for i, name in enumerate(names)
+    )
+
+    def values(entries: List[IndexEntry[int]]) -> List[str]:
+        return [names[entry.value] for entry in entries]
+
+    assert values(index.matches("s")) == ["strip_html", "summarize_as_bullets", "show", "select"]
+    assert values(index.matches("sh")) == ["show"]
+    assert values(index.matches("")) == names
+
+    # Same results as scoring every name one at a time.
+    for query in ["summarize", "strip htm", "paragraphs", "transcrib", "filez", "xyz", "se"]:
+        expected = [
+            name
+            for name in names
+            if normalize(name).startswith(normalize(query))
+            or score_phrase(normalize(query), normalize(name)) > FUZZY_MIN_SCORE
+        ]
+        assert values(index.matches(query)) == expected, query
+
+    assert values(index.description_matches("audio")) == ["transcribe"]
+    assert values(index.description_matches("uses aud")) == ["transcribe"]
+    assert values(index.description_matches("video")) == []
+    assert values(index.description_matches("au")) == []
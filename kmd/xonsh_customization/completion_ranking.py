@@ -5,7 +5,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Callable, Iterable, List, Tuple, TypeVar
 
-from thefuzz import fuzz
+from thefuzz import fuzz, process
 from xonsh.completers.tools import RichCompletion
 
 from kmd.config.logger import get_logger
@@ -69,6 +69,22 @@ def score_phrase(prefix: str, text: str) -> float:
     )
 
 
+def score_phrases(prefix: str, texts: List[str]) -> List[float]:
+    """
+    Same as `score_phrase` on each text, but scoring all texts in one batch.
+    """
+    if not texts:
+        return []
+
+    def batch(scorer: Callable[[str, str], int]) -> List[float]:
+        return [score for _text, score in process.extractWithoutOrder(prefix, texts, scorer=scorer)]
+
+    token_set = batch(fuzz.token_set_ratio)
+    partial = batch(fuzz.partial_ratio)
+    token_sort = batch(fuzz.token_sort_ratio)
+    return [0.4 * a + 0.4 * b + 0.2 * c for a, b, c in zip(token_set, partial, token_sort)]
+
+
 def score_subphrase(prefix: str, text: str) -> float:
     return 0.5 * fuzz.partial_ratio(prefix, text) + 0.5 * fuzz.partial_token_set_ratio(prefix, text)
 
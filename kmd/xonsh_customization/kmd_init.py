@@ -4,17 +4,20 @@ from pathlib import Path
 from typing import Any, Callable, Dict, List, TypeVar
 
 from xonsh.built_ins import XSH
+from xonsh.events import events
 from xonsh.prompt.base import PromptFields
 
-from kmd.action_defs import reload_all_actions
+from kmd.action_defs import action_manifest
 from kmd.commands import help_commands
 from kmd.commands.command_registry import all_commands
 from kmd.config.logger import get_logger
 from kmd.config.settings import check_kyrm_code_support
 from kmd.config.setup import print_api_key_setup, setup
 from kmd.config.text_styles import PROMPT_COLOR_NORMAL, PROMPT_COLOR_WARN, PROMPT_MAIN
+from kmd.exec.action_manifest import ActionInfo
+from kmd.exec.action_registry import instantiate_actions
+from kmd.exec.background_jobs import list_jobs, pop_notifications
 from kmd.exec.history import wrap_with_history
-from kmd.model.actions_model import Action
 from kmd.model.shell_model import ShellResult
 from kmd.server.local_server import start_server
 from kmd.server.local_url_formatters import enable_local_urls
@@ -23,7 +26,7 @@ from kmd.shell_tools.exception_printing import wrap_with_exception_printing
 from kmd.shell_tools.function_wrapper import wrap_for_shell_args
 from kmd.shell_tools.native_tools import tool_check
 from kmd.shell_tools.tool_deps import check_terminal_features
-from kmd.shell_ui.shell_output import cprint
+from kmd.shell_ui.shell_output import cprint, print_status
 from kmd.shell_ui.shell_results import handle_shell_result, shell_before_exec
 from kmd.version import get_version_name
 from kmd.workspaces.workspaces import current_workspace
@@ -103,7 +106,7 @@ def _wrap_handle_results(func: Callable[..., R]) -> Callable[[List[str]], None]:
 
 _commands: Dict[str, Callable[..., Any]]
 
-_actions: Dict[str, Action]
+_actions: Dict[str, ActionInfo]
 
 
 def _load_xonsh_commands():
@@ -143,14 +146,21 @@ def _load_xonsh_commands():
 
 def _load_xonsh_actions() -> List[str]:
     """
-    Load all kmd actions as xonsh commands.
+    Load all kmd actions as xonsh commands. Uses the action manifest, so action
+    modules are only imported when each action is first used. Actions registered
+    elsewhere (e.g. by `load`) aren't in the manifest and are added directly.
     """
     kmd_actions = {}
     global _actions
-    _actions = reload_all_actions()
+    _actions = dict(action_manifest(reload=True))
 
-    for action in _actions.values():
-        kmd_actions[action.name] = _wrap_handle_results(ShellCallableAction(action))
+    for info in _actions.values():
+        kmd_actions[info.name] = _wrap_handle_results(ShellCallableAction(info))
+
+    for name, action in instantiate_actions().items():
+        if name not in _actions:
+            _actions[name] = ActionInfo.from_action(action)
+            kmd_actions[name] = _wrap_handle_results(ShellCallableAction(action))
 
     update_aliases(kmd_actions)
 
@@ -226,9 +236,20 @@ def _kmd_xonsh_prompt():
         colored_workspace_str = f"{{{PROMPT_COLOR_WARN}}}{workspace_str}"
 
     colored_workspace_str = f"{colored_workspace_str}{{RESET}}"
+
+    # Note any background jobs still running.
+    running = sum(1 for job in list_jobs() if job.status == "running")
+    if running:
+        colored_workspace_str += f" {{{PROMPT_COLOR_WARN}}}({running} bg){{RESET}}"
+
     return f"\n{colored_workspace_str} {{{PROMPT_COLOR_NORMAL}}}{PROMPT_MAIN}{{RESET}} "
 
 
+def _show_job_notifications(**_kwargs):
+    for notification in pop_notifications():
+        print_status(notification)
+
+
 def _shell_setup():
     from kmd.xonsh_customization.xonsh_completers import add_key_bindings
 
@@ -243,6 +264,9 @@ def _shell_setup():
 
     add_key_bindings()
 
+    # Let the user know of finished background jobs before each prompt.
+    events.on_pre_prompt(_show_job_notifications)
+
     modernize_shell()
 
 
@@ -2,7 +2,7 @@ import os
 import re
 import sys
 from pathlib import Path
-from typing import cast, Iterable, List, Tuple
+from typing import cast, Iterable, List, Optional, Tuple
 
 from prompt_toolkit.application import get_app
 from prompt_toolkit.filters import Condition
@@ -18,22 +18,25 @@ from xonsh.completers.tools import (
     non_exclusive_completer,
 )
 
+from kmd.action_defs import look_up_action
 from kmd.commands.help_commands import HELP_COMMANDS
 from kmd.config.logger import get_logger
 from kmd.config.text_styles import EMOJI_COMMAND, EMOJI_TASK, STYLE_ACTION_TEXT, STYLE_COMMAND_TEXT
 from kmd.docs.faq_headings import faq_headings
-from kmd.errors import InvalidState
+from kmd.errors import InvalidState, SkippableError
 from kmd.exec.system_actions import assistant_chat
 from kmd.help.function_param_info import annotate_param_info
 from kmd.model.params_model import Param
 from kmd.model.paths_model import fmt_store_path
 from kmd.model.preconditions_model import Precondition
-from kmd.preconditions.precondition_checks import items_matching_precondition
+from kmd.preconditions import precondition_by_name
+from kmd.preconditions.precondition_checks import paths_matching_precondition
 from kmd.shell_ui.shell_syntax import assist_request_str, is_valid_command
 from kmd.util.format_utils import single_line
 from kmd.util.log_calls import log_calls
 from kmd.util.type_utils import not_none
 from kmd.workspaces.workspaces import current_ignore, current_workspace
+from kmd.xonsh_customization.completion_index import CompletionIndex, IndexEntry
 from kmd.xonsh_customization.completion_ranking import (
     normalize,
     score_items,
@@ -153,40 +156,61 @@ def _completion_matches(
     return matches
 
 
-@log_calls(level="debug")
-def _command_completions(prefix: str) -> set[RichCompletion]:
+_command_index: Optional[CompletionIndex[RichCompletion]] = None
+_command_index_key: Optional[Tuple[int, int, int, int]] = None
+
+
+def _command_completion_index() -> CompletionIndex[RichCompletion]:
+    """
+    Index of completions for all commands and actions, rebuilt only when the loaded
+    commands or actions change.
+    """
     from kmd.xonsh_customization.kmd_init import _actions, _commands
 
-    prefix = normalize(prefix)
+    global _command_index, _command_index_key
+    key = (id(_commands), len(_commands), id(_actions), len(_actions))
+    if _command_index is None or key != _command_index_key:
+        entries = [
+            IndexEntry(
+                name,
+                command.__doc__ or "",
+                RichCompletion(
+                    name,
+                    display=f"{name} {EMOJI_COMMAND}",
+                    description=single_line(command.__doc__ or ""),
+                    style=STYLE_COMMAND_TEXT,
+                    append_space=True,
+                ),
+            )
+            for name, command in _commands.items()
+        ] + [
+            IndexEntry(
+                name,
+                action.description or "",
+                RichCompletion(
+                    name,
+                    display=f"{name} {EMOJI_TASK}",
+                    description=single_line(action.description or ""),
+                    style=STYLE_ACTION_TEXT,
+                    append_space=True,
+                ),
+            )
+            for name, action in _actions.items()
+        ]
+        _command_index = CompletionIndex(entries)
+        _command_index_key = key
+        log.info("Built completion index for %s commands and actions.", len(entries))
+    return _command_index
 
-    command_matches = _completion_matches(prefix, [c.__name__ for c in _commands.values()])
-    command_completions = [
-        RichCompletion(
-            name,
-            display=f"{name} {EMOJI_COMMAND}",
-            description=single_line(_commands[name].__doc__ or ""),
-            style=STYLE_COMMAND_TEXT,
-            append_space=True,
-        )
-        for name in command_matches
-    ]
 
-    action_matches = _completion_matches(prefix, [a.name for a in _actions.values()])
-    action_completions = [
-        RichCompletion(
-            name,
-            display=f"{name} {EMOJI_TASK}",
-            description=single_line(_actions[name].description or ""),
-            style=STYLE_ACTION_TEXT,
-            append_space=True,
-        )
-        for name in action_matches
-    ]
+@log_calls(level="debug")
+def _command_completions(prefix: str) -> set[RichCompletion]:
+    index = _command_completion_index()
 
-    # input_empty = not prefix.strip()
-    # help_completions = _completion_matches(prefix, _all_help_completions(input_empty))
+    # Match on names, or if nothing matches, on words in descriptions.
+    entries = index.matches(prefix) or index.description_matches(prefix)
 
-    all_completions = command_completions + action_completions  # + help_completions
+    all_completions = [entry.value for entry in entries]
     all_completions.sort(key=completion_sort)
 
     return set(all_completions)
@@ -235,15 +259,23 @@ def _item_completions(
     # Get immediate subdirectories from workspace base directory
     dir_completions = _dir_completions(prefix, ws.base_dir)
 
-    starts_with_prefix = Precondition(
-        lambda item: normalize(str(not_none(item.store_path))).startswith(prefix)
-    )
+    # Filter by path before loading any items. If there are too many matches to offer
+    # completions anyway, don't load any.
+    matching_paths = [
+        store_path
+        for store_path in paths_matching_precondition(ws, precondition)
+        if normalize(str(store_path)).startswith(prefix)
+    ]
+    if len(matching_paths) >= MAX_COMPLETIONS:
+        log.debug("Too many items (%s) to offer completions, skipping.", len(matching_paths))
+        return dir_completions
 
-    matching_items = list(
-        items_matching_precondition(
-            ws, precondition & starts_with_prefix, max_results=MAX_COMPLETIONS
-        )
-    )
+    matching_items = []
+    for store_path in matching_paths:
+        try:
+            matching_items.append(ws.load(store_path))
+        except SkippableError as e:
+            log.info("Skipping item for completion: %s: %s", store_path, e)
 
     log.debug("Found %s items matching: %r", len(matching_items), prefix)
 
@@ -315,10 +347,15 @@ def item_completer(context: CompletionContext) -> CompleterResult:
     try:
         if context.command and context.command.arg_index >= 1:
             action_name = context.command.args[0].value
-            action = _actions.get(action_name)
+            action_info = _actions.get(action_name)
             prefix = context.command.prefix
-            if action and action.precondition:
-                item_completions = _item_completions(prefix, action.precondition)
+            if action_info:
+                # Look up the precondition by name, so the action isn't imported, unless
+                # it's not a known precondition.
+                precondition = precondition_by_name(action_info.precondition)
+                if not precondition:
+                    precondition = look_up_action(action_name).precondition
+                item_completions = _item_completions(prefix, precondition)
                 return set(item_completions) if item_completions else None
     except InvalidState:
         return None
@@ -404,7 +441,7 @@ def options_completer(context: CompletionContext) -> CompleterResult:
                 params = annotate_param_info(command)
             elif action:
                 help_text = "Show more help for this action."
-                params = list(action.params)
+                params = action.param_list
 
             completions = _param_completions(params, prefix)
 
@@ -2,6 +2,7 @@
 A variety of configs and customizations for xonsh to work as the kmd shell.
 """
 
+import json
 import os
 import time
 from os.path import expanduser
@@ -28,6 +29,9 @@ from kmd.shell_ui.shell_syntax import is_assist_request_str
 log = get_logger(__name__)
 
 
+STARTUP_TIMING_ENV = "KMD_STARTUP_TIMING_FILE"
+"""If set, write startup time as JSON to this file and exit instead of showing the prompt."""
+
 # Turn off for cleaner outputs. Sometimes you want this on for development.
 XONSH_SHOW_TRACEBACK = False
 
@@ -284,13 +288,18 @@ def start_custom_xonsh(single_command: Optional[str] = None):
     # so let's only load ~/.kmdrc files.
     load_rcfiles(execer, ctx)
 
-    # Imports are so slow we will need to improve this. Let's time it.
+    # Imports are slow, so keep an eye on this (see devtools/startup_benchmark.py).
     startup_time = time.time() - import_start_time
     log.info(f"kmd startup took {startup_time:.2f}s.")
 
     # Main loop.
     try:
-        if single_command:
+        timing_file = os.environ.get(STARTUP_TIMING_ENV)
+        if timing_file:
+            # Benchmarking startup, so record the time and exit before the prompt.
+            with open(timing_file, "w") as f:
+                json.dump({"startup_time": startup_time}, f)
+        elif single_command:
             # Run a command.
             XSH.shell.shell.default(single_command)  # type: ignore
         else: